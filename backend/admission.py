@@ -0,0 +1,374 @@
+"""
+Token budgets and admission control for reorganization jobs.
+
+Three limits, all off (0) unless configured:
+
+- A per-job budget (PINPANDA_SESSION_TOKEN_BUDGET). Jobs whose estimate
+  exceeds it are rejected up front; a job whose actual usage (from the
+  responses' `usage`) exceeds it is stopped, keeping its checkpoint.
+- A per-key rate (PINPANDA_KEY_TOKENS_PER_MINUTE), tracked from usage over a
+  sliding minute. Reorganization calls are throttled to leave
+  CHAT_RESERVED_SHARE of it for chat, so one large job cannot stall chat.
+- A per-key limit on the estimated tokens still to be spent by admitted jobs
+  (PINPANDA_KEY_MAX_PENDING_TOKENS). A job that would exceed it waits until
+  earlier jobs on the key finish ("queue") or is refused ("reject").
+
+The per-key usage windows and reservations live in a budget state store:
+in memory, or in SQLite (PINPANDA_ADMISSION_STORE=sqlite) so that several
+API workers and the job worker processes share one view of each key. The
+SQLite store is the default with PINPANDA_JOB_QUEUE enabled; run several API
+workers without the queue only with it set explicitly. Reservations of jobs
+whose process died expire after RESERVATION_TTL_SECONDS without usage.
+"""
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from job_queue import JOB_QUEUE_ENABLED, user_key_for
+
+logger = logging.getLogger(__name__)
+
+SESSION_TOKEN_BUDGET = int(os.getenv("PINPANDA_SESSION_TOKEN_BUDGET", "0"))
+KEY_TOKENS_PER_MINUTE = int(os.getenv("PINPANDA_KEY_TOKENS_PER_MINUTE", "0"))
+KEY_MAX_PENDING_TOKENS = int(os.getenv("PINPANDA_KEY_MAX_PENDING_TOKENS", "0"))
+# What happens to a job that would exceed its key's pending limit: "queue" or "reject"
+ADMISSION_POLICY = os.getenv("PINPANDA_ADMISSION_POLICY", "queue")
+# Share of the per-key rate that reorganization jobs leave for chat
+CHAT_RESERVED_SHARE = float(os.getenv("PINPANDA_CHAT_RESERVED_SHARE", "0.2"))
+# "memory" or "sqlite"; processes sharing API keys must share the SQLite store
+ADMISSION_STORE = os.getenv("PINPANDA_ADMISSION_STORE", "sqlite" if JOB_QUEUE_ENABLED else "memory")
+ADMISSION_STORE_PATH = os.getenv(
+    "PINPANDA_ADMISSION_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "admission.db")
+)
+RESERVATION_TTL_SECONDS = float(os.getenv("PINPANDA_ADMISSION_RESERVATION_TTL_SECONDS", "900"))
+
+RATE_WINDOW_SECONDS = 60.0
+# How often a queued job re-checks whether it may start
+ADMISSION_POLL_SECONDS = 1.0
+
+class BudgetExceededError(Exception):
+    """A job used more tokens than its budget allows"""
+
+def usage_tokens(usage: Optional[Dict[str, Any]]) -> int:
+    if not usage:
+        return 0
+    return int(usage.get("total_tokens") or (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0))
+
+class BudgetState(ABC):
+    """Per-key usage windows and per-job reservations of pending tokens, keyed by user key"""
+
+    @abstractmethod
+    def record(self, key: str, tokens: int, now: float, session_id: Optional[str] = None) -> None:
+        """Add usage to the key's window and take it off the session's reservation"""
+
+    @abstractmethod
+    def window(self, key: str, now: float) -> Tuple[int, Optional[float]]:
+        """Tokens used in the last RATE_WINDOW_SECONDS and when the oldest of that usage was recorded"""
+
+    @abstractmethod
+    def reserve(self, key: str, session_id: str, tokens: int, max_pending: int, now: float) -> Optional[int]:
+        """
+        Reserve a job's tokens unless other jobs' reservations leave no room
+        under max_pending (0 = no limit). Returns None once reserved, else the
+        tokens reserved by the other jobs.
+        """
+
+    @abstractmethod
+    def release(self, key: str, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def pending(self, key: str, now: float) -> int:
+        ...
+
+    def close(self) -> None:
+        pass
+
+class _KeyState:
+    __slots__ = ("window", "window_tokens", "pending")
+
+    def __init__(self):
+        self.window: Deque[Tuple[float, int]] = deque()
+        self.window_tokens = 0
+        # session id -> estimated tokens it has yet to spend
+        self.pending: Dict[str, int] = {}
+
+    def expire(self, now: float) -> None:
+        while self.window and self.window[0][0] <= now - RATE_WINDOW_SECONDS:
+            self.window_tokens -= self.window.popleft()[1]
+
+class MemoryBudgetState(BudgetState):
+    """State for a single process"""
+
+    def __init__(self):
+        self._keys: Dict[str, _KeyState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key: str) -> _KeyState:
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _KeyState()
+        return state
+
+    def record(self, key: str, tokens: int, now: float, session_id: Optional[str] = None) -> None:
+        with self._lock:
+            state = self._state(key)
+            state.window.append((now, tokens))
+            state.window_tokens += tokens
+            if session_id in state.pending:
+                state.pending[session_id] = max(0, state.pending[session_id] - tokens)
+
+    def window(self, key: str, now: float) -> Tuple[int, Optional[float]]:
+        with self._lock:
+            state = self._state(key)
+            state.expire(now)
+            return state.window_tokens, state.window[0][0] if state.window else None
+
+    def reserve(self, key: str, session_id: str, tokens: int, max_pending: int, now: float) -> Optional[int]:
+        with self._lock:
+            state = self._state(key)
+            pending = sum(t for session, t in state.pending.items() if session != session_id)
+            if not max_pending or not pending or pending + tokens <= max_pending:
+                state.pending[session_id] = tokens
+                return None
+            return pending
+
+    def release(self, key: str, session_id: str) -> None:
+        with self._lock:
+            self._state(key).pending.pop(session_id, None)
+
+    def pending(self, key: str, now: float) -> int:
+        with self._lock:
+            return sum(self._state(key).pending.values())
+
+class SqliteBudgetState(BudgetState):
+    """State shared by every process that opens the same database file"""
+
+    def __init__(self, path: str = ADMISSION_STORE_PATH, reservation_ttl_seconds: float = RESERVATION_TTL_SECONDS):
+        self.path = path
+        self.reservation_ttl_seconds = reservation_ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_usage (user_key TEXT NOT NULL, at REAL NOT NULL, tokens INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_token_usage_key ON token_usage(user_key, at)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS token_reservations (
+                session_id TEXT PRIMARY KEY,
+                user_key TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+
+    def _pending_locked(self, key: str, now: float, exclude_session: Optional[str] = None) -> int:
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(tokens), 0) FROM token_reservations "
+            "WHERE user_key = ? AND updated_at > ? AND session_id IS NOT ?",
+            (key, now - self.reservation_ttl_seconds, exclude_session)
+        ).fetchone()[0]
+
+    def record(self, key: str, tokens: int, now: float, session_id: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT INTO token_usage (user_key, at, tokens) VALUES (?, ?, ?)", (key, now, tokens))
+                # Usage older than the window is never read again
+                self._conn.execute("DELETE FROM token_usage WHERE at <= ?", (now - RATE_WINDOW_SECONDS,))
+                if session_id is not None:
+                    self._conn.execute(
+                        "UPDATE token_reservations SET tokens = MAX(0, tokens - ?), updated_at = ? WHERE session_id = ?",
+                        (tokens, now, session_id)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def window(self, key: str, now: float) -> Tuple[int, Optional[float]]:
+        with self._lock:
+            tokens, oldest = self._conn.execute(
+                "SELECT COALESCE(SUM(tokens), 0), MIN(at) FROM token_usage WHERE user_key = ? AND at > ?",
+                (key, now - RATE_WINDOW_SECONDS)
+            ).fetchone()
+        return tokens, oldest
+
+    def reserve(self, key: str, session_id: str, tokens: int, max_pending: int, now: float) -> Optional[int]:
+        with self._lock:
+            # One transaction, so two processes cannot both fit into the same room
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                pending = self._pending_locked(key, now, exclude_session=session_id)
+                if not max_pending or not pending or pending + tokens <= max_pending:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO token_reservations (session_id, user_key, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                        (session_id, key, tokens, now)
+                    )
+                    pending = None
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return pending
+
+    def release(self, key: str, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM token_reservations WHERE session_id = ?", (session_id,))
+
+    def pending(self, key: str, now: float) -> int:
+        with self._lock:
+            return self._pending_locked(key, now)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def create_budget_state(backend: str = ADMISSION_STORE) -> BudgetState:
+    """Build the configured budget state store"""
+    if backend == "sqlite":
+        logger.info(f"Using the SQLite admission store at {ADMISSION_STORE_PATH}")
+        return SqliteBudgetState()
+    if backend != "memory":
+        logger.warning(f"Unknown admission store '{backend}', using the in-memory store")
+    return MemoryBudgetState()
+
+class JobBudget:
+    """Token accounting for one reorganization job"""
+
+    def __init__(self, budgets: "TokenBudgets", api_key: str, session_id: str, limit: int = SESSION_TOKEN_BUDGET):
+        self.budgets = budgets
+        self.api_key = api_key
+        self.session_id = session_id
+        self.limit = limit
+        self.used = 0
+
+    def check(self) -> None:
+        """Raise once the job has used up its budget"""
+        if self.limit and self.used >= self.limit:
+            raise BudgetExceededError(f"Used {self.used} tokens, over the job budget of {self.limit}")
+
+class TokenBudgets:
+    """Per-key rate limiting and pending-token admission over a budget state store"""
+
+    def __init__(
+        self,
+        tokens_per_minute: int = KEY_TOKENS_PER_MINUTE,
+        max_pending_tokens: int = KEY_MAX_PENDING_TOKENS,
+        policy: str = ADMISSION_POLICY,
+        state: Optional[BudgetState] = None
+    ):
+        self.tokens_per_minute = tokens_per_minute
+        self.max_pending_tokens = max_pending_tokens
+        self.policy = policy
+        self._state = state
+        self._state_lock = threading.Lock()
+
+    @property
+    def state(self) -> BudgetState:
+        # Opened on first use, so processes that never budget anything leave no database behind
+        with self._state_lock:
+            if self._state is None:
+                self._state = create_budget_state()
+            return self._state
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tokens_per_minute or self.max_pending_tokens)
+
+    def record(self, api_key: str, usage: Optional[Dict[str, Any]], budget: Optional[JobBudget] = None) -> None:
+        """Count a response's usage against its key (and job)"""
+        tokens = usage_tokens(usage)
+        if not tokens:
+            return
+        if budget is not None:
+            budget.used += tokens
+        if self.enabled:
+            self.state.record(user_key_for(api_key), tokens, time.time(), budget.session_id if budget is not None else None)
+
+    async def throttle(self, api_key: str, tokens: int) -> None:
+        """Wait until a reorganization call of about `tokens` fits the key's rate, minus the chat reserve"""
+        if not self.tokens_per_minute:
+            return
+        allowed = self.tokens_per_minute * (1.0 - CHAT_RESERVED_SHARE)
+        key = user_key_for(api_key)
+        while True:
+            now = time.time()
+            used, oldest = self.state.window(key, now)
+            # A call bigger than the whole allowance still goes out once the window is empty
+            if oldest is None or used + tokens <= allowed:
+                return
+            wait = oldest + RATE_WINDOW_SECONDS - now
+            logger.info(f"Throttling a reorganization call for {wait:.1f}s to stay within the key's token rate")
+            await asyncio.sleep(max(0.05, wait))
+
+    def pending_tokens(self, api_key: str) -> int:
+        return self.state.pending(user_key_for(api_key), time.time())
+
+    def admission(self, estimated_tokens: int, api_key: Optional[str] = None) -> str:
+        """"accept", "queue" or "reject" for a job with this estimate"""
+        if SESSION_TOKEN_BUDGET and estimated_tokens > SESSION_TOKEN_BUDGET:
+            return "reject"
+        if not self.max_pending_tokens or api_key is None:
+            return "accept"
+        pending = self.pending_tokens(api_key)
+        if not pending or pending + estimated_tokens <= self.max_pending_tokens:
+            return "accept"
+        return "reject" if self.policy == "reject" else "queue"
+
+    async def admit(
+        self,
+        budget: JobBudget,
+        estimated_tokens: int,
+        on_wait: Optional[Callable[[int], Awaitable[None]]] = None
+    ) -> None:
+        """Reserve a job's estimate against its key, waiting while earlier jobs hold the key's pending limit"""
+        if not self.enabled:
+            return
+        key = user_key_for(budget.api_key)
+        announced = False
+        while True:
+            pending = await asyncio.to_thread(
+                self.state.reserve, key, budget.session_id, estimated_tokens, self.max_pending_tokens, time.time()
+            )
+            if pending is None:
+                return
+            if not announced and on_wait is not None:
+                await on_wait(pending)
+                announced = True
+            await asyncio.sleep(ADMISSION_POLL_SECONDS)
+
+    def release(self, budget: JobBudget) -> None:
+        if self.enabled:
+            self.state.release(user_key_for(budget.api_key), budget.session_id)
+
+    def key_snapshot(self, api_key: str) -> Dict[str, Any]:
+        """A key's current usage and limits, for the estimate endpoint"""
+        now = time.time()
+        key = user_key_for(api_key)
+        used, _ = self.state.window(key, now) if self.enabled else (0, None)
+        return {
+            "tokensLastMinute": used,
+            "tokensPerMinute": self.tokens_per_minute,
+            "pendingTokens": self.state.pending(key, now) if self.enabled else 0,
+            "maxPendingTokens": self.max_pending_tokens,
+            "sessionTokenBudget": SESSION_TOKEN_BUDGET
+        }
+
+    def close(self) -> None:
+        with self._state_lock:
+            if self._state is not None:
+                self._state.close()
+                self._state = None
+
+token_budgets = TokenBudgets()
@@ -0,0 +1,246 @@
+"""
+Persistent per-bookmark categorization cache.
+
+Categories assigned by the model are stored in a local SQLite file keyed by a
+content hash of the bookmark (normalized URL, title and folder) plus the model
+and categorization depth, so re-running a reorganization only sends bookmarks
+that changed. Entries expire after a TTL and the table is trimmed to a maximum
+size by least-recent use.
+
+The cache also keeps the text of recently model-categorized bookmarks as
+training examples for the local pre-classifier.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Optional, Dict, Any, Iterable, Tuple, List
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration (overridable through environment variables)
+CACHE_PATH = os.getenv(
+    "PINPANDA_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "categorization_cache.db")
+)
+CACHE_MAX_ENTRIES = int(os.getenv("PINPANDA_CACHE_MAX_ENTRIES", "200000"))
+CACHE_TTL_SECONDS = int(os.getenv("PINPANDA_CACHE_TTL_DAYS", "30")) * 24 * 60 * 60
+MAX_TRAINING_EXAMPLES = int(os.getenv("PINPANDA_MAX_TRAINING_EXAMPLES", "50000"))
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH_SIZE = 500
+
+def normalize_cache_url(url: str) -> str:
+    """Normalize a URL for cache keys: lowercase scheme/host, no fragment or trailing slash"""
+    url = (url or "").strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url.lower().rstrip("/")
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+def make_cache_key(title: str, url: str, folder: str, model: str, depth: str) -> str:
+    """Content hash identifying one bookmark categorization"""
+    parts = [
+        normalize_cache_url(url),
+        " ".join((title or "").split()).lower(),
+        (folder or "").strip().lower(),
+        model,
+        depth
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+class CategorizationCache:
+    """SQLite-backed cache of bookmark key -> category path"""
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS categorizations (
+                key TEXT PRIMARY KEY,
+                category TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_categorizations_last_used ON categorizations(last_used)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS training_examples (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                folder TEXT,
+                category TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_training_examples_namespace ON training_examples(namespace, created_at)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: Iterable[str], peek: bool = False) -> Dict[str, str]:
+        """
+        Look up many keys at once, refreshing their recency; expired entries count as misses.
+        A peek (for estimates) neither refreshes recency nor counts as hits or misses.
+        """
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        oldest_valid = now - self.ttl_seconds
+        found: Dict[str, str] = {}
+
+        with self._lock:
+            for start in range(0, len(keys), _QUERY_BATCH_SIZE):
+                batch = keys[start:start + _QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, category FROM categorizations WHERE key IN ({placeholders}) AND created_at >= ?",
+                    (*batch, oldest_valid)
+                ).fetchall()
+                found.update(rows)
+
+            if peek:
+                return found
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE categorizations SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Store key -> category pairs and evict anything over the size or age limit"""
+        now = time.time()
+        rows = [(key, category, now, now) for key, category in items]
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO categorizations (key, category, created_at, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def _evict_locked(self, now: float) -> None:
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        self._conn.execute("DELETE FROM categorizations WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM categorizations").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM categorizations WHERE key IN "
+                "(SELECT key FROM categorizations ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+            logger.info(f"Evicted {overflow} least recently used categorization cache entries")
+
+    def put_examples(self, namespace: str, examples: Iterable[Tuple[str, str, str, Optional[str], str]]) -> None:
+        """Store (key, title, url, folder, category) training examples, keeping the newest"""
+        now = time.time()
+        rows = [(key, namespace, title, url, folder, category, now) for key, title, url, folder, category in examples]
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO training_examples "
+                "(key, namespace, title, url, folder, category, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM training_examples").fetchone()[0]
+            overflow = count - MAX_TRAINING_EXAMPLES
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM training_examples WHERE key IN "
+                    "(SELECT key FROM training_examples ORDER BY created_at ASC LIMIT ?)",
+                    (overflow,)
+                )
+            self._conn.commit()
+
+    def load_examples(self, namespace: str, limit: int) -> List[Tuple[str, str, Optional[str], str]]:
+        """Newest (title, url, folder, category) examples for a namespace"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT title, url, folder, category FROM training_examples "
+                "WHERE namespace = ? AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                (namespace, time.time() - self.ttl_seconds, limit)
+            ).fetchall()
+
+    def examples_version(self, namespace: str) -> Tuple[int, float]:
+        """(count, newest timestamp) of a namespace's examples, to detect changes cheaply"""
+        with self._lock:
+            count, newest = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(created_at), 0) FROM training_examples WHERE namespace = ?",
+                (namespace,)
+            ).fetchone()
+        return count, newest
+
+    def clear(self) -> None:
+        """Remove every cached categorization and training example"""
+        with self._lock:
+            self._conn.execute("DELETE FROM categorizations")
+            self._conn.execute("DELETE FROM training_examples")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM categorizations").fetchone()[0]
+            examples = self._conn.execute("SELECT COUNT(*) FROM training_examples").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "trainingExamples": examples,
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_cache: Optional[CategorizationCache] = None
+
+def get_categorization_cache() -> CategorizationCache:
+    """Return the process-wide cache, opening it on first use"""
+    global _cache
+    if _cache is None:
+        _cache = CategorizationCache()
+    return _cache
+
+def close_categorization_cache() -> None:
+    """Close the process-wide cache if it was opened"""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
@@ -0,0 +1,171 @@
+"""
+Merge engine for per-chunk categorization results.
+
+Each chunk is categorized by the model with chunk-local indices. The merger
+maps them to global indices through a precomputed offset table and keeps a
+single index -> category map, so the final assignment is a linear pass.
+"""
+import logging
+from typing import List, Optional, Dict, Any, Set, Sequence
+
+logger = logging.getLogger(__name__)
+
+UNCATEGORIZED = "Uncategorized"
+
+# Specificity ranks used for conflict resolution (higher wins)
+MAIN_CATEGORY_RANK = 1
+SUBCATEGORY_RANK = 2
+
+def format_category_path(category_name: str, sub_name: Optional[str] = None) -> str:
+    """Format a category path the way the frontend expects it"""
+    if sub_name:
+        return f"{category_name} / {sub_name}"
+    return category_name
+
+def _coerce_index(value: Any) -> Optional[int]:
+    """Convert a model-provided index to int, ignoring anything unusable"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+class CategoryMerger:
+    """Accumulates chunk results into a global index -> category assignment"""
+
+    def __init__(self, chunk_sizes: List[int], total: Optional[int] = None,
+                 index_map: Optional[List[int]] = None):
+        """
+        chunk_sizes describes the chunks sent to the model. When only a subset
+        of the collection is chunked, index_map translates positions in that
+        subset to collection indices and total is the collection size.
+        """
+        self.chunk_sizes = list(chunk_sizes)
+        self.offsets: List[int] = []
+        chunked = 0
+        for size in self.chunk_sizes:
+            self.offsets.append(chunked)
+            chunked += size
+        self.index_map = index_map
+        self.total = total if total is not None else chunked
+
+        self.assignments: List[Optional[str]] = [None] * self.total
+        # Specificity rank of each current assignment (0 = unassigned)
+        self._assignment_ranks: List[int] = [0] * self.total
+        # Main category each assignment is counted under; model names may themselves contain " / "
+        self._assignment_mains: List[Optional[str]] = [None] * self.total
+        self.unassigned: Set[int] = set(range(self.total))
+        self.category_counts: Dict[str, int] = {}
+        self.main_categories: Dict[str, int] = {}
+        self.conflicts = 0
+        self.invalid_indices = 0
+
+    def chunk_positions(self, chunk_index: int) -> List[int]:
+        """Positions of a chunk's bookmarks within the chunked bookmarks"""
+        start = self.offsets[chunk_index]
+        return list(range(start, start + self.chunk_sizes[chunk_index]))
+
+    def to_global(self, position: int) -> int:
+        """Collection index of a position within the chunked bookmarks"""
+        return position if self.index_map is None else self.index_map[position]
+
+    def merge_positions(self, positions: Sequence[int], batch_result: Dict[str, Any]) -> int:
+        """
+        Merge a categorization of an arbitrary part of the chunked bookmarks,
+        such as a chunk or half of a split one. Index i in batch_result refers
+        to positions[i] and is validated against len(positions). When the
+        model places a bookmark in several categories, the most specific one
+        (subcategory over main category) wins, then the first one listed in
+        the response. Returns the number of bookmarks newly assigned.
+        """
+        size = len(positions)
+        newly_assigned = 0
+
+        if not isinstance(batch_result, dict):
+            logger.warning("Ignoring non-object categorization result")
+            return 0
+
+        for category_name, category_data in batch_result.items():
+            category_name = str(category_name).strip() or UNCATEGORIZED
+
+            # Accept a bare list of indices as a flat category
+            if isinstance(category_data, list):
+                category_data = {"bookmarks": category_data, "subcategories": {}}
+            elif not isinstance(category_data, dict):
+                continue
+
+            placements = [(MAIN_CATEGORY_RANK, category_name, category_data.get("bookmarks") or [])]
+            subcategories = category_data.get("subcategories") or {}
+            if isinstance(subcategories, dict):
+                for sub_name, sub_indices in subcategories.items():
+                    placements.append((
+                        SUBCATEGORY_RANK,
+                        format_category_path(category_name, str(sub_name).strip()),
+                        sub_indices or []
+                    ))
+
+            for rank, path, indices in placements:
+                if not isinstance(indices, list):
+                    continue
+                for raw_index in indices:
+                    local_index = _coerce_index(raw_index)
+                    if local_index is None or not 0 <= local_index < size:
+                        self.invalid_indices += 1
+                        continue
+
+                    global_index = self.to_global(positions[local_index])
+                    current_rank = self._assignment_ranks[global_index]
+
+                    if not current_rank:
+                        newly_assigned += 1
+                        self.unassigned.discard(global_index)
+                    else:
+                        # Keep the earlier placement unless this one is more specific
+                        self.conflicts += 1
+                        if rank <= current_rank:
+                            continue
+                        self._decrement(global_index)
+
+                    self._set(global_index, path, category_name, rank)
+
+        return newly_assigned
+
+    def assign(self, global_index: int, path: str) -> None:
+        """Assign a bookmark directly (e.g. from the cache), outside any chunk"""
+        if self._assignment_ranks[global_index]:
+            self._decrement(global_index)
+        else:
+            self.unassigned.discard(global_index)
+        self._set(global_index, path, path.split(" / ", 1)[0], SUBCATEGORY_RANK)
+
+    def _set(self, global_index: int, path: str, main_category: str, rank: int) -> None:
+        self.assignments[global_index] = path
+        self._assignment_ranks[global_index] = rank
+        self._assignment_mains[global_index] = main_category
+        self.category_counts[path] = self.category_counts.get(path, 0) + 1
+        self.main_categories[main_category] = self.main_categories.get(main_category, 0) + 1
+
+    def _decrement(self, global_index: int) -> None:
+        """Remove a bookmark's current assignment from the category counters"""
+        path = self.assignments[global_index]
+        if path is None:
+            return
+        self.category_counts[path] -= 1
+        if not self.category_counts[path]:
+            del self.category_counts[path]
+        main_category = self._assignment_mains[global_index]
+        self.main_categories[main_category] -= 1
+        if not self.main_categories[main_category]:
+            del self.main_categories[main_category]
+
+    def category_for(self, global_index: int) -> str:
+        """Final category path for a bookmark"""
+        return self.assignments[global_index] or UNCATEGORIZED
+
+    def unassigned_indices(self) -> List[int]:
+        """Global indices that no chunk result assigned, in order"""
+        return sorted(self.unassigned)
@@ -0,0 +1,297 @@
+"""
+Incrementally maintained collection analytics.
+
+A CollectionStats is built once per collection and then updated with only
+the bookmarks a delta adds or removes: per-category, per-domain, per-folder
+and per-canonical-URL counts, bookmarks added per month, overall and per
+domain. Domains are the host part of the canonical URL (so www. and default
+port variants count as one), parsed once per bookmark change and stored as
+integer IDs that are reused once a domain's last bookmark is removed.
+
+Counts live in RankedCounters, which stay sorted under +1/-1 changes, so
+reading the top k of anything is O(k) and a stats query costs the same for
+ten bookmarks or a million.
+"""
+import re
+import time
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from category_merge import UNCATEGORIZED
+from dedupe import URLCanonicalizer, default_canonicalizer
+
+# Folder name reported for bookmarks outside any folder
+UNFILED = "Unfiled"
+
+_ISO_MONTH = re.compile(r"^(\d{4})-(\d{2})")
+
+def added_month(date_added: Optional[str]) -> Optional[str]:
+    """"YYYY-MM" of an ISO date or a Unix timestamp (seconds or milliseconds), None if unknown"""
+    if not date_added:
+        return None
+    match = _ISO_MONTH.match(date_added)
+    if match:
+        return match.group(0)
+    if date_added.isdigit():
+        timestamp = int(date_added)
+        if timestamp > 10 ** 11:
+            timestamp //= 1000
+        try:
+            return time.strftime("%Y-%m", time.gmtime(timestamp))
+        except (OverflowError, OSError, ValueError):
+            return None
+    return None
+
+class _Bucket:
+    __slots__ = ("count", "keys", "higher", "lower")
+
+    def __init__(self, count: int):
+        self.count = count
+        # Insertion-ordered set of the keys with this count
+        self.keys: Dict[Hashable, None] = {}
+        self.higher: Optional["_Bucket"] = None
+        self.lower: Optional["_Bucket"] = None
+
+class RankedCounter:
+    """
+    A counter kept in descending order under +1/-1 changes.
+
+    Keys sit in buckets of equal count in a doubly linked list (a
+    stream-summary structure), so a change only moves a key to a neighbouring
+    bucket: increment and decrement are O(1) and most_common(k) is O(k).
+    """
+
+    def __init__(self):
+        self._buckets: Dict[Hashable, _Bucket] = {}
+        self._top: Optional[_Bucket] = None
+        self._bottom: Optional[_Bucket] = None
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def __getitem__(self, key: Hashable) -> int:
+        bucket = self._buckets.get(key)
+        return bucket.count if bucket is not None else 0
+
+    def increment(self, key: Hashable) -> int:
+        """Add one to `key`, returning its new count"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            target = self._bottom
+            if target is None or target.count != 1:
+                target = self._insert(1, higher=self._bottom, lower=None)
+        else:
+            target = bucket.higher
+            if target is None or target.count != bucket.count + 1:
+                target = self._insert(bucket.count + 1, higher=bucket.higher, lower=bucket)
+            self._discard(bucket, key)
+        target.keys[key] = None
+        self._buckets[key] = target
+        return target.count
+
+    def decrement(self, key: Hashable) -> int:
+        """Subtract one from `key`, dropping it at zero, and return its new count"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0
+        if bucket.count == 1:
+            del self._buckets[key]
+        else:
+            target = bucket.lower
+            if target is None or target.count != bucket.count - 1:
+                target = self._insert(bucket.count - 1, higher=bucket, lower=bucket.lower)
+            target.keys[key] = None
+            self._buckets[key] = target
+        self._discard(bucket, key)
+        return bucket.count - 1
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[Hashable, int]]:
+        """The n largest counts, ties in the order keys reached their count"""
+        result: List[Tuple[Hashable, int]] = []
+        bucket = self._top
+        while bucket is not None and (n is None or len(result) < n):
+            for key in bucket.keys:
+                if n is not None and len(result) >= n:
+                    break
+                result.append((key, bucket.count))
+            bucket = bucket.lower
+        return result
+
+    def _insert(self, count: int, higher: Optional[_Bucket], lower: Optional[_Bucket]) -> _Bucket:
+        bucket = _Bucket(count)
+        bucket.higher = higher
+        bucket.lower = lower
+        if higher is None:
+            self._top = bucket
+        else:
+            higher.lower = bucket
+        if lower is None:
+            self._bottom = bucket
+        else:
+            lower.higher = bucket
+        return bucket
+
+    def _discard(self, bucket: _Bucket, key: Hashable) -> None:
+        del bucket.keys[key]
+        if bucket.keys:
+            return
+        if bucket.higher is None:
+            self._top = bucket.lower
+        else:
+            bucket.higher.lower = bucket.lower
+        if bucket.lower is None:
+            self._bottom = bucket.higher
+        else:
+            bucket.lower.higher = bucket.higher
+
+def _add_to(counts: Dict[str, int], key: str, amount: int) -> None:
+    count = counts.get(key, 0) + amount
+    if count:
+        counts[key] = count
+    else:
+        counts.pop(key, None)
+
+class CollectionStats:
+    """Analytics for one collection, updated as bookmarks are added and removed"""
+
+    def __init__(self, bookmarks: Iterable[Any] = (), canonicalizer: Optional[URLCanonicalizer] = None):
+        self._canonicalizer = canonicalizer or default_canonicalizer
+        self._lock = threading.Lock()
+        self.total = 0
+        self.categories = RankedCounter()
+        self.domains = RankedCounter()  # keyed by domain ID
+        self.folders = RankedCounter()
+        self.urls = RankedCounter()  # canonical URL -> bookmarks with it
+        self.urls_with_duplicates = 0
+        self.undated = 0
+        self._folder_categories: Dict[str, RankedCounter] = {}
+        self._months: Dict[str, int] = {}
+        self._domain_months: Dict[int, Dict[str, int]] = {}
+        self._domain_ids: Dict[str, int] = {}
+        self._domain_names: List[Optional[str]] = []
+        self._free_domain_ids: List[int] = []
+        for bookmark in bookmarks:
+            self._apply(bookmark, 1)
+
+    def update(self, removed: Iterable[Any] = (), added: Iterable[Any] = ()) -> None:
+        """Apply a delta: `removed` bookmarks (including the old versions of updated ones) and `added` ones"""
+        with self._lock:
+            for bookmark in removed:
+                self._apply(bookmark, -1)
+            for bookmark in added:
+                self._apply(bookmark, 1)
+
+    def _domain_id(self, url: str) -> Optional[int]:
+        domain = self._canonicalizer.host(url)
+        if domain is None:
+            return None
+        domain_id = self._domain_ids.get(domain)
+        if domain_id is None:
+            if self._free_domain_ids:
+                domain_id = self._free_domain_ids.pop()
+                self._domain_names[domain_id] = domain
+            else:
+                domain_id = len(self._domain_names)
+                self._domain_names.append(domain)
+            self._domain_ids[domain] = domain_id
+        return domain_id
+
+    def _release_domain_id(self, domain_id: int) -> None:
+        del self._domain_ids[self._domain_names[domain_id]]
+        self._domain_names[domain_id] = None
+        self._free_domain_ids.append(domain_id)
+
+    def _apply(self, bookmark: Any, sign: int) -> None:
+        change = RankedCounter.increment if sign > 0 else RankedCounter.decrement
+        self.total += sign
+
+        category = bookmark.category or UNCATEGORIZED
+        folder = bookmark.folder or UNFILED
+        change(self.categories, category)
+        change(self.folders, folder)
+        folder_categories = self._folder_categories.get(folder)
+        if folder_categories is None:
+            folder_categories = self._folder_categories[folder] = RankedCounter()
+        change(folder_categories, category)
+        if not folder_categories:
+            del self._folder_categories[folder]
+
+        count = change(self.urls, self._canonicalizer.canonicalize(bookmark.url))
+        # A URL starts or stops having duplicates as its count crosses two
+        if (sign > 0 and count == 2) or (sign < 0 and count == 1):
+            self.urls_with_duplicates += sign
+
+        domain_id = self._domain_id(bookmark.url)
+        domain_count = change(self.domains, domain_id) if domain_id is not None else None
+        month = added_month(bookmark.dateAdded)
+        if month is None:
+            self.undated += sign
+        else:
+            _add_to(self._months, month, sign)
+            if domain_id is not None:
+                months = self._domain_months.setdefault(domain_id, {})
+                _add_to(months, month, sign)
+                if not months:
+                    del self._domain_months[domain_id]
+        if domain_count == 0:
+            self._release_domain_id(domain_id)
+
+    @property
+    def duplicates(self) -> int:
+        """Bookmarks beyond the first with each canonical URL"""
+        return self.total - len(self.urls)
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        """Totals and top categories and domains, as the chat stats answer uses them"""
+        with self._lock:
+            return {
+                "total": self.total,
+                "categories": dict(self.categories.most_common(top)),
+                "domains": {self._domain_names[d]: count for d, count in self.domains.most_common(top)},
+                "duplicates": self.duplicates,
+                "unique_domains": len(self.domains),
+                "unique_categories": len(self.categories)
+            }
+
+    def breakdown(self, top: int = 10, folder_categories: int = 3, domains_over_time: int = 5) -> Dict[str, Any]:
+        """
+        Totals plus top categories, domains, folders (each with its top
+        categories) and duplicated URLs, bookmarks added per month, and the
+        monthly history of the top `domains_over_time` domains.
+        """
+        with self._lock:
+            top_domains = self.domains.most_common(top)
+            return {
+                "total": self.total,
+                "uniqueCategories": len(self.categories),
+                "uniqueDomains": len(self.domains),
+                "uniqueFolders": len(self.folders),
+                "duplicates": self.duplicates,
+                "urlsWithDuplicates": self.urls_with_duplicates,
+                "categories": [{"name": name, "count": count} for name, count in self.categories.most_common(top)],
+                "domains": [{"name": self._domain_names[d], "count": count} for d, count in top_domains],
+                "folders": [
+                    {
+                        "name": name,
+                        "count": count,
+                        "categories": [
+                            {"name": category, "count": category_count}
+                            for category, category_count in self._folder_categories[name].most_common(folder_categories)
+                        ]
+                    }
+                    for name, count in self.folders.most_common(top)
+                ],
+                "mostDuplicatedUrls": [
+                    {"url": url, "count": count} for url, count in self.urls.most_common(top) if count > 1
+                ],
+                "addedByMonth": dict(sorted(self._months.items())),
+                "undated": self.undated,
+                "domainsOverTime": [
+                    {
+                        "name": self._domain_names[d],
+                        "count": count,
+                        "byMonth": dict(sorted(self._domain_months.get(d, {}).items()))
+                    }
+                    for d, count in top_domains[:domains_over_time]
+                ]
+            }
@@ -0,0 +1,182 @@
+"""
+Server-side bookmark collections with versioned delta sync.
+
+A client uploads its bookmarks once, receives a collection ID and version,
+and afterwards sends only add/update/delete deltas. Chat and reorganization
+requests can then reference the collection by ID, and indexes and caches are
+keyed to the stable "{collectionId}:{version}" key.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+from collection_stats import CollectionStats
+
+logger = logging.getLogger(__name__)
+
+# Collections not touched for this long are dropped
+COLLECTION_TTL_SECONDS = int(os.getenv("PINPANDA_COLLECTION_TTL_HOURS", "24")) * 60 * 60
+MAX_COLLECTIONS = int(os.getenv("PINPANDA_MAX_COLLECTIONS", "1000"))
+
+class CollectionNotFoundError(KeyError):
+    """Raised when a collection ID is unknown or expired"""
+
+class VersionConflictError(ValueError):
+    """Raised when a delta is based on a stale collection version"""
+
+    def __init__(self, expected: int, actual: int):
+        super().__init__(f"Collection is at version {actual}, delta was based on version {expected}")
+        self.expected = expected
+        self.actual = actual
+
+class BookmarkCollection:
+    """One uploaded collection; bookmarks keep their upload order"""
+
+    def __init__(self, collection_id: str, bookmarks: List[Any]):
+        self.id = collection_id
+        self.version = 1
+        self.bookmarks = bookmarks
+        # Analytics, built on first use and then updated by each delta rather than recomputed
+        self.stats: Optional[CollectionStats] = None
+        self.created_at = time.time()
+        self.last_access = self.created_at
+
+    @property
+    def version_key(self) -> str:
+        """Stable key for caches derived from this exact version"""
+        return f"{self.id}:{self.version}"
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "collectionId": self.id,
+            "version": self.version,
+            "count": len(self.bookmarks)
+        }
+
+class CollectionStore:
+    """In-memory store of bookmark collections"""
+
+    def __init__(self, ttl_seconds: int = COLLECTION_TTL_SECONDS, max_collections: int = MAX_COLLECTIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_collections = max_collections
+        self._collections: Dict[str, BookmarkCollection] = {}
+        self._lock = threading.Lock()
+
+    def create(self, bookmarks: List[Any]) -> BookmarkCollection:
+        """Store a new collection, assigning IDs to bookmarks that lack one"""
+        _ensure_ids(bookmarks)
+        collection = BookmarkCollection(str(uuid.uuid4()), bookmarks)
+        with self._lock:
+            self._evict_locked()
+            self._collections[collection.id] = collection
+        logger.info(f"Created collection {collection.id} with {len(bookmarks)} bookmarks")
+        return collection
+
+    def get(self, collection_id: str) -> BookmarkCollection:
+        with self._lock:
+            collection = self._collections.get(collection_id)
+            if collection is None or self._expired(collection, time.time()):
+                self._collections.pop(collection_id, None)
+                raise CollectionNotFoundError(collection_id)
+            collection.last_access = time.time()
+            return collection
+
+    def snapshot(self, collection_id: str) -> Tuple[List[Any], str]:
+        """Bookmarks and version key of the current version, read together"""
+        collection = self.get(collection_id)
+        with self._lock:
+            return collection.bookmarks, collection.version_key
+
+    def get_stats(self, collection_id: str) -> Tuple[CollectionStats, int]:
+        """A collection's analytics and the version they describe, building them on first use"""
+        collection = self.get(collection_id)
+        with self._lock:
+            if collection.stats is None:
+                collection.stats = CollectionStats(collection.bookmarks)
+            return collection.stats, collection.version
+
+    def delete(self, collection_id: str) -> None:
+        with self._lock:
+            if self._collections.pop(collection_id, None) is None:
+                raise CollectionNotFoundError(collection_id)
+
+    def apply_delta(
+        self,
+        collection_id: str,
+        base_version: Optional[int],
+        add: Iterable[Any] = (),
+        update: Iterable[Dict[str, Any]] = (),
+        delete: Iterable[str] = ()
+    ) -> BookmarkCollection:
+        """
+        Apply deletes, then updates, then adds and bump the version.
+
+        Updates are partial: only the given fields of the bookmark with the
+        matching id change. Unknown ids in updates or deletes are ignored.
+        """
+        collection = self.get(collection_id)
+        with self._lock:
+            if base_version is not None and base_version != collection.version:
+                raise VersionConflictError(base_version, collection.version)
+
+            # Work on a new list so readers of the previous version are unaffected
+            delete_ids = set(delete)
+            removed: List[Any] = []
+            if delete_ids:
+                bookmarks = []
+                for b in collection.bookmarks:
+                    (removed if b.id in delete_ids else bookmarks).append(b)
+            else:
+                bookmarks = list(collection.bookmarks)
+
+            updates = {u["id"]: u for u in update if u.get("id")}
+            updated: List[Any] = []
+            if updates:
+                for position, bookmark in enumerate(bookmarks):
+                    changes = updates.get(bookmark.id)
+                    if changes:
+                        removed.append(bookmark)
+                        bookmarks[position] = bookmark.model_copy(update=changes)
+                        updated.append(bookmarks[position])
+
+            added = list(add)
+            _ensure_ids(added)
+            bookmarks.extend(added)
+
+            collection.bookmarks = bookmarks
+            if collection.stats is not None:
+                collection.stats.update(removed, updated + added)
+            collection.version += 1
+            collection.last_access = time.time()
+            logger.info(
+                f"Collection {collection_id} -> v{collection.version}: "
+                f"+{len(added)} ~{len(updates)} -{len(delete_ids)} ({len(bookmarks)} bookmarks)"
+            )
+            return collection
+
+    def _expired(self, collection: BookmarkCollection, now: float) -> bool:
+        return now - collection.last_access > self.ttl_seconds
+
+    def _evict_locked(self) -> None:
+        """Drop expired collections, then the least recently used over the limit"""
+        now = time.time()
+        for collection_id in [cid for cid, c in self._collections.items() if self._expired(c, now)]:
+            del self._collections[collection_id]
+        overflow = len(self._collections) - self.max_collections + 1
+        if overflow > 0:
+            oldest = sorted(self._collections.values(), key=lambda c: c.last_access)[:overflow]
+            for collection in oldest:
+                del self._collections[collection.id]
+
+    def __len__(self) -> int:
+        return len(self._collections)
+
+def _ensure_ids(bookmarks: List[Any]) -> None:
+    for bookmark in bookmarks:
+        if not bookmark.id:
+            bookmark.id = str(uuid.uuid4())
+
+collection_store = CollectionStore()
@@ -0,0 +1,287 @@
+"""
+Duplicate and near-duplicate bookmark detection.
+
+Exact duplicates are grouped in one pass by canonical URL. The configurable
+canonicalizer ignores the scheme, "www.", fragments, tracking parameters,
+query parameter order and trailing slashes.
+
+Near duplicates, such as the same article under different URLs or a
+retitled copy, are found with MinHash signatures over title and URL
+shingles plus locality-sensitive hashing. Only bookmarks that share an LSH
+bucket are compared, so the work stays roughly linear in collection size.
+"""
+import os
+import re
+import logging
+from urllib.parse import SplitResult, urlsplit, parse_qsl, urlencode
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Iterable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "yclid",
+    "_hsenc", "_hsmi", "ref", "ref_src", "ref_url", "spm", "si"
+}
+TRACKING_PARAM_PREFIXES = ("utm_",)
+EXTRA_IGNORED_PARAMS = {
+    p.strip().lower() for p in os.getenv("PINPANDA_DEDUPE_IGNORED_PARAMS", "").split(",") if p.strip()
+}
+
+NEAR_DUPLICATES_ENABLED = os.getenv("PINPANDA_NEAR_DUPLICATES", "1").lower() in ("1", "true", "yes")
+NEAR_DUPLICATE_THRESHOLD = 0.7
+
+# 16 bands x 4 rows: pairs at 0.7 Jaccard similarity share a bucket ~99% of the time
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+MINHASH_PERMUTATIONS = MINHASH_BANDS * MINHASH_ROWS
+# Signatures are computed in batches to bound memory
+MINHASH_BATCH_SIZE = 1024
+
+# Multiply-shift hash family: h(x) = ((a * x + b) mod 2^64) >> 32 with odd a
+_rng = np.random.RandomState(1729)
+_HASH_A = _rng.randint(0, 1 << 62, size=MINHASH_PERMUTATIONS, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+_HASH_B = _rng.randint(0, 1 << 62, size=MINHASH_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+# Mixes a band's rows into one bucket key
+_BAND_MIX = _rng.randint(0, 1 << 62, size=MINHASH_ROWS, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+
+_WORD_PATTERN = re.compile(r"[^\W_]+")
+_DEFAULT_PORTS = {"http": "80", "https": "443"}
+_SCHEME_PATTERN = re.compile(r"^[a-z][a-z0-9+.-]*://")
+
+class URLCanonicalizer:
+    """Maps URLs that point at the same page to one canonical string"""
+
+    def __init__(
+        self,
+        ignore_scheme: bool = True,
+        ignore_www: bool = True,
+        ignore_fragment: bool = True,
+        ignore_trailing_slash: bool = True,
+        strip_tracking_params: bool = True,
+        sort_query_params: bool = True,
+        ignored_params: Iterable[str] = ()
+    ):
+        self.ignore_scheme = ignore_scheme
+        self.ignore_www = ignore_www
+        self.ignore_fragment = ignore_fragment
+        self.ignore_trailing_slash = ignore_trailing_slash
+        self.strip_tracking_params = strip_tracking_params
+        self.sort_query_params = sort_query_params
+        self.ignored_params = {p.lower() for p in ignored_params} | EXTRA_IGNORED_PARAMS
+
+    def _keep_param(self, name: str) -> bool:
+        name = name.lower()
+        if name in self.ignored_params:
+            return False
+        if self.strip_tracking_params and (name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)):
+            return False
+        return True
+
+    def _host(self, parts: SplitResult, scheme: str) -> str:
+        # Parse the netloc directly; SplitResult.hostname/.port re-split it on every access
+        host = parts.netloc.rpartition("@")[2].lower()
+        name, colon, port = host.rpartition(":")
+        if colon and port.isdigit():
+            host = name if port == _DEFAULT_PORTS.get(scheme) else f"{name}:{port}"
+        host = host.rstrip(".")
+        if self.ignore_www and host.startswith("www."):
+            host = host[4:]
+        return host
+
+    def host(self, url: str) -> Optional[str]:
+        """The host part of the canonical URL, None for URLs without one"""
+        try:
+            parts = urlsplit((url or "").strip())
+        except ValueError:
+            return None
+        if not parts.netloc:
+            return None
+        return self._host(parts, parts.scheme.lower()) or None
+
+    def canonicalize(self, url: str) -> str:
+        url = (url or "").strip()
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return url.lower()
+        if not parts.netloc:
+            return url.lower().rstrip("/") if self.ignore_trailing_slash else url.lower()
+
+        scheme = parts.scheme.lower()
+        host = self._host(parts, scheme)
+
+        path = parts.path or "/"
+        if self.ignore_trailing_slash and len(path) > 1:
+            path = path.rstrip("/") or "/"
+
+        query = parts.query
+        if query and (self.strip_tracking_params or self.ignored_params or self.sort_query_params):
+            params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if self._keep_param(k)]
+            if self.sort_query_params:
+                params.sort()
+            query = urlencode(params)
+
+        canonical = host + path
+        if not self.ignore_scheme:
+            canonical = f"{scheme}://{canonical}"
+        if query:
+            canonical += "?" + query
+        if parts.fragment and not self.ignore_fragment:
+            canonical += "#" + parts.fragment
+        return canonical
+
+default_canonicalizer = URLCanonicalizer()
+
+def group_by_canonical_url(
+    bookmarks: Sequence[Any],
+    canonicalizer: Optional[URLCanonicalizer] = None
+) -> Dict[str, List[int]]:
+    """Canonical URL -> indices of the bookmarks with it, in one pass"""
+    canonicalizer = canonicalizer or default_canonicalizer
+    groups: Dict[str, List[int]] = {}
+    for index, bookmark in enumerate(bookmarks):
+        groups.setdefault(canonicalizer.canonicalize(bookmark.url), []).append(index)
+    return groups
+
+def _shingles(title: str, canonical_url: str) -> List[int]:
+    """Hashed word unigrams and bigrams of the title plus the URL's host and path words"""
+    words = _WORD_PATTERN.findall((title or "").lower())
+    # Canonical URLs keep their scheme when the canonicalizer's ignore_scheme is off
+    try:
+        parts = urlsplit(canonical_url if _SCHEME_PATTERN.match(canonical_url) else "//" + canonical_url)
+        host, path = parts.netloc, parts.path
+    except ValueError:
+        host, _, path = canonical_url.partition("/")
+    features = set(words)
+    features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    features.add("host:" + host)
+    features.update("path:" + w for w in _WORD_PATTERN.findall(path.split("?", 1)[0].lower()))
+    # Signatures are only compared within one call, so the per-process string hash is enough
+    return [hash(f) & 0xFFFFFFFF for f in features]
+
+def minhash_signatures(shingle_sets: Sequence[List[int]]) -> np.ndarray:
+    """MinHash signature matrix (documents x permutations)"""
+    signatures = np.full((len(shingle_sets), MINHASH_PERMUTATIONS), np.iinfo(np.uint32).max, dtype=np.uint32)
+    for start in range(0, len(shingle_sets), MINHASH_BATCH_SIZE):
+        batch = shingle_sets[start:start + MINHASH_BATCH_SIZE]
+        lengths = np.fromiter((len(s) for s in batch), dtype=np.int64, count=len(batch))
+        non_empty = np.flatnonzero(lengths)
+        if not len(non_empty):
+            continue
+        values = np.fromiter((h for i in non_empty for h in batch[i]), dtype=np.uint64)
+        # In place: the (shingles x permutations) intermediates dominate peak memory
+        hashed = values[:, None] * _HASH_A
+        hashed += _HASH_B
+        hashed >>= np.uint64(32)
+        hashed = hashed.astype(np.uint32)
+        offsets = np.concatenate(([0], np.cumsum(lengths[non_empty])[:-1]))
+        signatures[start + non_empty] = np.minimum.reduceat(hashed, offsets, axis=0)
+    return signatures
+
+def find_near_duplicate_groups(
+    titles: Sequence[str],
+    canonical_urls: Sequence[str],
+    threshold: float = NEAR_DUPLICATE_THRESHOLD
+) -> List[Tuple[List[int], float]]:
+    """
+    Groups of positions whose estimated Jaccard similarity to the group's
+    leader is at least `threshold`, each with the lowest such similarity.
+    Only groups with two or more members are returned.
+    """
+    if len(titles) < 2:
+        return []
+    # Shingle lists are built a batch at a time; for a whole collection they outweigh the signatures
+    signatures = np.empty((len(titles), MINHASH_PERMUTATIONS), dtype=np.uint32)
+    for start in range(0, len(titles), MINHASH_BATCH_SIZE):
+        end = start + MINHASH_BATCH_SIZE
+        signatures[start:end] = minhash_signatures(
+            [_shingles(t, u) for t, u in zip(titles[start:end], canonical_urls[start:end])]
+        )
+
+    # Star clustering: each bookmark joins at most one group and must be similar to
+    # that group's leader itself, so similarity cannot drift along chains
+    leader = np.arange(len(titles))
+    has_members = np.zeros(len(titles), dtype=bool)
+    for band in range(MINHASH_BANDS):
+        keys = signatures[:, band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS].astype(np.uint64) @ _BAND_MIX
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        # Pair every bucket member with the bucket's first member, keeping the work linear
+        starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+        first_of = order[np.repeat(starts, np.diff(np.append(starts, len(order))))]
+        candidates = np.flatnonzero((first_of != order) & (leader[order] == order))
+        if not len(candidates):
+            continue
+        leaders = leader[first_of[candidates]]
+        others = order[candidates]
+        similarity = np.mean(signatures[leaders] == signatures[others], axis=1)
+        for group_leader, other in zip(leaders[similarity >= threshold], others[similarity >= threshold]):
+            # Skip bookmarks that lead a group or joined one earlier in this band
+            if leader[other] == other and not has_members[other] and other != group_leader:
+                leader[other] = group_leader
+                has_members[group_leader] = True
+
+    members: Dict[int, List[int]] = {}
+    for position, root in enumerate(leader.tolist()):
+        members.setdefault(root, []).append(position)
+
+    groups = []
+    for root, positions in members.items():
+        if len(positions) < 2:
+            continue
+        similarity = float(min(np.mean(signatures[root] == signatures[p]) for p in positions if p != root))
+        groups.append((positions, round(similarity, 3)))
+    return groups
+
+class DedupeReport:
+    """Exact and near-duplicate groups for a bookmark collection"""
+
+    def __init__(self, exact_groups: Dict[str, List[int]], near_groups: List[Dict[str, Any]]):
+        self.exact_groups = exact_groups
+        self.near_groups = near_groups
+
+    def duplicate_pairs(self) -> List[Dict[str, int]]:
+        """(originalIndex, duplicateIndex) for every exact duplicate"""
+        return [
+            {"originalIndex": indices[0], "duplicateIndex": duplicate}
+            for indices in self.exact_groups.values() if len(indices) > 1
+            for duplicate in indices[1:]
+        ]
+
+    def duplicate_groups(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Exact duplicate groups, largest first"""
+        groups = sorted(
+            ((url, indices) for url, indices in self.exact_groups.items() if len(indices) > 1),
+            key=lambda item: len(item[1]),
+            reverse=True
+        )
+        return [{"url": url, "count": len(indices), "indices": indices} for url, indices in groups[:limit]]
+
+def find_duplicates(
+    bookmarks: Sequence[Any],
+    canonicalizer: Optional[URLCanonicalizer] = None,
+    near_duplicates: bool = NEAR_DUPLICATES_ENABLED,
+    threshold: float = NEAR_DUPLICATE_THRESHOLD
+) -> DedupeReport:
+    """Group exact duplicates by canonical URL and, optionally, cluster near duplicates"""
+    groups = group_by_canonical_url(bookmarks, canonicalizer)
+
+    near_groups: List[Dict[str, Any]] = []
+    if near_duplicates and len(groups) > 1:
+        # One representative per exact group; near duplicates of it cover its copies
+        urls = list(groups)
+        representatives = [groups[url][0] for url in urls]
+        clusters = find_near_duplicate_groups([bookmarks[i].title for i in representatives], urls, threshold)
+        for positions, similarity in clusters:
+            indices = sorted(i for p in positions for i in groups[urls[p]])
+            near_groups.append({
+                "indices": indices,
+                "urls": [urls[p] for p in positions],
+                "similarity": similarity
+            })
+        near_groups.sort(key=lambda group: len(group["indices"]), reverse=True)
+
+    return DedupeReport(groups, near_groups)
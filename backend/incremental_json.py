@@ -0,0 +1,146 @@
+"""
+Incremental parsing of streamed JSON objects.
+
+Categorization responses are one JSON object whose top-level entries
+(category -> indices) are independent. The parser consumes text as it
+streams in and returns each top-level entry as soon as it is complete, so
+malformed output is detected after a few tokens instead of after the full
+generation, and the entries of a truncated response can still be used.
+
+Leading prose or a markdown fence before the object and "//" comments
+(which models copy from the prompt's example) are tolerated.
+"""
+import json
+from typing import List, Dict, Any, Optional, Tuple
+
+# Text allowed before the opening brace ("Here is the JSON:", a ``` fence, ...)
+MAX_PREAMBLE_CHARS = 200
+
+_CLOSING = {"}": "{", "]": "["}
+
+class MalformedResponseError(ValueError):
+    """The response is not the JSON object that was asked for"""
+
+    def __init__(self, message: str, partial: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        # Entries that were complete before the problem was noticed
+        self.partial = partial or {}
+
+class TruncatedResponseError(MalformedResponseError):
+    """The response ended before its JSON object was complete"""
+
+class IncrementalJSONParser:
+    """Feeds streamed text and yields completed top-level (key, value) entries"""
+
+    def __init__(self):
+        self._pending = ""  # Unscanned input (an undecided "/" at the end of a chunk)
+        self._entry: List[str] = []  # Comment-free text of the current top-level entry
+        self._stack: List[str] = []
+        self._preamble = 0
+        self._in_string = False
+        self._escape = False
+        self._in_comment = False
+        self.started = False
+        self.done = False
+        self.entries = 0
+        self._completed: List[Tuple[str, Any]] = []
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume more text; returns the entries it completed"""
+        if self.done:
+            return []
+        text = self._pending + text
+        self._pending = ""
+
+        for position, char in enumerate(text):
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self._stack.append("{")
+                    continue
+                self._preamble += 1
+                if self._preamble > MAX_PREAMBLE_CHARS:
+                    raise MalformedResponseError("Response does not start with a JSON object")
+                continue
+
+            if self._in_comment:
+                if char == "\n":
+                    self._in_comment = False
+                    self._entry.append(char)
+                continue
+
+            if self._in_string:
+                self._entry.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == "/":
+                if position + 1 == len(text):
+                    # Decide once the next character arrives
+                    self._pending = char
+                    break
+                if text[position + 1] == "/":
+                    self._in_comment = True
+                    continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append(char)
+            elif char in _CLOSING:
+                if not self._stack or self._stack[-1] != _CLOSING[char]:
+                    raise MalformedResponseError(f"Unbalanced '{char}' in response")
+                self._stack.pop()
+                if not self._stack:
+                    self._finish_entry()
+                    self.done = True
+                    break
+            elif char == "," and len(self._stack) == 1:
+                self._finish_entry()
+                continue
+            self._entry.append(char)
+
+        return self.drain()
+
+    def drain(self) -> List[Tuple[str, Any]]:
+        """Entries completed since the last call (also those before a parse error)"""
+        completed, self._completed = self._completed, []
+        return completed
+
+    def _finish_entry(self) -> None:
+        text = "".join(self._entry).strip()
+        self._entry = []
+        if not text:
+            return
+        try:
+            parsed = json.loads("{" + text + "}")
+        except json.JSONDecodeError as e:
+            raise MalformedResponseError(f"Invalid entry in response: {e.msg}") from None
+        self.entries += len(parsed)
+        self._completed.extend(parsed.items())
+
+    def close(self) -> None:
+        """Signal the end of the stream; raises if the object never completed"""
+        if not self.done:
+            if not self.started:
+                raise MalformedResponseError("Response contains no JSON object")
+            raise TruncatedResponseError(f"Response ended after {self.entries} complete entries")
+
+def parse_partial_object(text: str) -> Dict[str, Any]:
+    """The complete top-level entries of a possibly truncated or damaged JSON object"""
+    parser = IncrementalJSONParser()
+    result: Dict[str, Any] = {}
+    # No streaming here, so any amount of leading prose is fine
+    start = text.find("{")
+    if start < 0:
+        return result
+    try:
+        result.update(parser.feed(text[start:]))
+    except MalformedResponseError:
+        result.update(parser.drain())
+    return result
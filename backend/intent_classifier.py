@@ -0,0 +1,235 @@
+"""
+Local intent classification for chat messages.
+
+High-precision phrase rules handle the common phrasings; everything else goes
+through a small multinomial Naive Bayes model trained at import time on the
+example messages below. Both return a confidence so the caller can fall back
+to the LLM when the local answer is uncertain. The model's posteriors come
+from a few dozen examples and are far too sure of themselves (0.9+ for
+clearly wrong answers on new phrasings), so its confidence is capped below
+the chat's fallback threshold: only rule hits are answered locally.
+Results are memoized per normalized message in an LRU cache.
+"""
+import re
+import math
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+INTENTS = ["search", "reorganize", "general", "export", "stats"]
+
+RULE_CONFIDENCE = 0.95
+# Upper bound on model-only confidence; main.INTENT_CONFIDENCE_THRESHOLD is 0.75
+MODEL_CONFIDENCE_CAP = 0.7
+INTENT_CACHE_SIZE = 2048
+
+# Ordered: the first matching rule wins
+INTENT_RULES: List[Tuple[str, re.Pattern]] = [
+    ("stats", re.compile(
+        r"\b(how many|count|stats|statistics|analytics|duplicates?|breakdown)\b"
+        r"|\b(top|most common|biggest|largest) (domains?|categor(y|ies)|sites?)\b"
+    )),
+    ("export", re.compile(r"\b(export|download|backup|back up)\b|\bsave (it |them |my bookmarks )?as\b")),
+    ("reorganize", re.compile(r"\b(re-?organi[sz]e|organi[sz]e|categori[sz]e|clean ?up|restructure|tidy)\b")),
+    ("general", re.compile(r"^(help|hi|hello|hey|thanks|thank you)\b|\bwhat can you do\b|\bhow do(es)? (this|it|you) work\b")),
+    ("search", re.compile(r"^(find|search|show|get|look ?up|look for|where('s| is| are)|list|open)\b")),
+]
+
+# Training data for the fallback model
+TRAINING_EXAMPLES: List[Tuple[str, str]] = [
+    ("find my react bookmarks", "search"),
+    ("show me coding resources", "search"),
+    ("search for javascript tutorials", "search"),
+    ("travel sites", "search"),
+    ("where did i save that recipe", "search"),
+    ("bookmarks about machine learning", "search"),
+    ("anything on python asyncio", "search"),
+    ("i need my work links", "search"),
+    ("vue documentation", "search"),
+    ("looking for the flight booking page", "search"),
+    ("cooking videos", "search"),
+    ("pages related to investing", "search"),
+    ("do i have anything about kubernetes", "search"),
+    ("reorganize my bookmarks", "reorganize"),
+    ("organize my collection", "reorganize"),
+    ("please sort these into folders", "reorganize"),
+    ("my bookmarks are a mess", "reorganize"),
+    ("group my links by topic", "reorganize"),
+    ("create better categories", "reorganize"),
+    ("restructure the folders", "reorganize"),
+    ("can you categorize everything", "reorganize"),
+    ("fix my folder structure", "reorganize"),
+    ("help", "general"),
+    ("what can you do", "general"),
+    ("how does this work", "general"),
+    ("hello there", "general"),
+    ("explain what pinpanda is", "general"),
+    ("thanks", "general"),
+    ("who are you", "general"),
+    ("what is this app for", "general"),
+    ("export my bookmarks", "export"),
+    ("download as html", "export"),
+    ("save them as json", "export"),
+    ("backup my collection", "export"),
+    ("get a csv file of my links", "export"),
+    ("i want to import these into chrome", "export"),
+    ("how many bookmarks do i have", "stats"),
+    ("how many duplicates", "stats"),
+    ("show my collection stats", "stats"),
+    ("count bookmarks per category", "stats"),
+    ("which domains do i bookmark most", "stats"),
+    ("what is my biggest category", "stats"),
+    ("give me analytics", "stats"),
+    ("number of bookmarks", "stats"),
+]
+
+# Phrasings kept out of training, with their intended intent, to check that
+# what clears the confidence threshold is right (see benchmarks/run_benchmarks.py)
+HELD_OUT_EXAMPLES: List[Tuple[str, str]] = [
+    ("what bookmarks do i have on rust", "search"),
+    ("can you get my cooking links", "search"),
+    ("any saved articles on climbing", "search"),
+    ("that docker page from last week", "search"),
+    ("find the sourdough recipe", "search"),
+    ("show me everything tagged travel", "search"),
+    ("where is my tax return link", "search"),
+    ("sort my bookmarks into categories", "reorganize"),
+    ("organize everything by topic", "reorganize"),
+    ("my folders need cleaning up", "reorganize"),
+    ("please tidy this mess", "reorganize"),
+    ("put similar links together", "reorganize"),
+    ("export to a csv", "export"),
+    ("download my collection as html", "export"),
+    ("make a backup of everything", "export"),
+    ("how many links are in my collection", "stats"),
+    ("which sites do i save the most", "stats"),
+    ("top domains", "stats"),
+    ("are there any duplicates", "stats"),
+    ("hi", "general"),
+    ("what can you do for me", "general"),
+    ("how does this work", "general"),
+    ("tell me about yourself", "general"),
+]
+
+# Words dropped when extracting a search query from a message
+_QUERY_STOPWORDS = {
+    "find", "search", "show", "get", "look", "lookup", "for", "me", "my", "all", "the", "a", "an",
+    "bookmarks", "bookmark", "links", "link", "sites", "site", "pages", "page", "about", "on",
+    "related", "to", "any", "anything", "some", "please", "can", "you", "i", "saved", "where",
+    "is", "are", "list", "open", "of", "with", "do", "have"
+}
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+def normalize_message(message: str) -> str:
+    """Lowercase, collapse whitespace and trim surrounding punctuation"""
+    return " ".join(message.lower().split()).strip(" ?!.,;:")
+
+def _features(text: str) -> List[str]:
+    words = _WORD_PATTERN.findall(text)
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+class NaiveBayesIntentModel:
+    """Multinomial Naive Bayes over word unigrams and bigrams"""
+
+    def __init__(self, examples: List[Tuple[str, str]], alpha: float = 0.5):
+        self.alpha = alpha
+        self.class_counts: Dict[str, int] = {intent: 0 for intent in INTENTS}
+        self.feature_counts: Dict[str, Dict[str, int]] = {intent: {} for intent in INTENTS}
+        self.total_features: Dict[str, int] = {intent: 0 for intent in INTENTS}
+        vocabulary = set()
+
+        for text, intent in examples:
+            self.class_counts[intent] += 1
+            for feature in _features(normalize_message(text)):
+                counts = self.feature_counts[intent]
+                counts[feature] = counts.get(feature, 0) + 1
+                self.total_features[intent] += 1
+                vocabulary.add(feature)
+
+        self.vocabulary = vocabulary
+        total_examples = sum(self.class_counts.values())
+        self.log_priors = {
+            intent: math.log((count + 1) / (total_examples + len(INTENTS)))
+            for intent, count in self.class_counts.items()
+        }
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Most likely intent and its posterior probability"""
+        features = [f for f in _features(text) if f in self.vocabulary]
+        vocabulary_size = len(self.vocabulary)
+        log_scores = {}
+        for intent in INTENTS:
+            denominator = self.total_features[intent] + self.alpha * vocabulary_size
+            counts = self.feature_counts[intent]
+            log_scores[intent] = self.log_priors[intent] + sum(
+                math.log((counts.get(f, 0) + self.alpha) / denominator) for f in features
+            )
+
+        best = max(log_scores, key=log_scores.get)
+        peak = log_scores[best]
+        normalizer = sum(math.exp(score - peak) for score in log_scores.values())
+        return best, 1.0 / normalizer
+
+_model = NaiveBayesIntentModel(TRAINING_EXAMPLES)
+
+def extract_search_query(message: str) -> str:
+    """Strip request phrasing to leave the search terms"""
+    words = [w for w in _WORD_PATTERN.findall(message.lower()) if w not in _QUERY_STOPWORDS]
+    return " ".join(words) or message
+
+def classify_intent(message: str) -> Dict[str, Any]:
+    """
+    Classify a chat message locally.
+
+    Returns the same shape as the LLM intent detector plus a "source" key
+    ("rules" or "model").
+    """
+    text = normalize_message(message)
+
+    for intent, pattern in INTENT_RULES:
+        if pattern.search(text):
+            intent_name, confidence, source = intent, RULE_CONFIDENCE, "rules"
+            break
+    else:
+        intent_name, confidence = _model.predict(text)
+        confidence = min(confidence, MODEL_CONFIDENCE_CAP)
+        source = "model"
+
+    entities: Dict[str, Any] = {}
+    if intent_name == "search":
+        entities["query"] = extract_search_query(message)
+
+    return {
+        "intent": intent_name,
+        "confidence": round(confidence, 4),
+        "entities": entities,
+        "source": source
+    }
+
+class IntentCache:
+    """LRU cache of normalized message -> intent result"""
+
+    def __init__(self, max_size: int = INTENT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, message: str) -> Optional[Dict[str, Any]]:
+        key = normalize_message(message)
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(result, entities=dict(result.get("entities") or {}))
+
+    def put(self, message: str, result: Dict[str, Any]) -> None:
+        key = normalize_message(message)
+        self._entries[key] = dict(result, entities=dict(result.get("entities") or {}))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+intent_cache = IntentCache()
@@ -0,0 +1,278 @@
+"""
+SQLite-backed reorganization job queue.
+
+API workers enqueue jobs; separate worker processes (see job_worker.py) claim
+and run them. Claiming is one IMMEDIATE transaction, so any number of API and
+worker processes can share the queue file without an external broker.
+
+Scheduling is fair across users: the next job goes to the user with the
+fewest running jobs, and within that to the smallest job (ties broken by
+age). Waiting jobs age so large jobs are not starved by a stream of small
+ones. Workers heartbeat their running jobs; a job whose lease expires is put
+back in the queue (and resumes from its checkpoint). Cancelling a running job
+marks it cancelled; its worker notices on the next status poll and stops.
+
+API keys are kept out of the job payloads. A job's key sits in a separate
+job_secrets table only while the job is queued or running, because a worker
+needs it to claim or re-claim the job. It is deleted when the job finishes,
+is cancelled or is purged. With secure_delete on, SQLite zeroes the deleted
+rows on disk. The queue file still holds the keys of unfinished jobs, so
+keep it readable only by the API and worker processes.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Queue configuration (overridable through environment variables)
+JOB_QUEUE_ENABLED = os.getenv("PINPANDA_JOB_QUEUE", "0").lower() in ("1", "true", "yes")
+JOB_QUEUE_PATH = os.getenv(
+    "PINPANDA_JOB_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_queue.db")
+)
+JOB_WORKERS = int(os.getenv("PINPANDA_JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("PINPANDA_JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("PINPANDA_JOB_HEARTBEAT_SECONDS", "10"))
+JOB_POLL_SECONDS = float(os.getenv("PINPANDA_JOB_POLL_SECONDS", "0.5"))
+# Bookmarks of priority a waiting job gains per second, so big jobs eventually run
+JOB_AGING_PER_SECOND = float(os.getenv("PINPANDA_JOB_AGING_PER_SECOND", "20"))
+
+def user_key_for(api_key: str) -> str:
+    """Stable, non-reversible scheduling key for the user behind an API key"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+class JobQueue:
+    """Durable job queue shared by API and worker processes"""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, lease_seconds: float = JOB_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_queue (
+                job_id TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                user_key TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT,
+                worker_id TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_job_queue_status ON job_queue(status)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS job_secrets (job_id TEXT PRIMARY KEY, api_key TEXT NOT NULL)")
+        # Overwrite deleted API keys instead of leaving them in free pages
+        self._conn.execute("PRAGMA secure_delete=ON")
+
+    def enqueue(self, session_id: str, user_key: str, size: int, payload: Dict[str, Any], api_key: str) -> str:
+        """Add a job and return its ID; the API key is stored apart from the payload until the job ends"""
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    """
+                    INSERT INTO job_queue (job_id, session_id, user_key, size, status, payload, enqueued_at)
+                    VALUES (?, ?, ?, ?, 'queued', ?, ?)
+                    """,
+                    (job_id, session_id, user_key, size, json.dumps(payload), time.time())
+                )
+                self._conn.execute("INSERT INTO job_secrets (job_id, api_key) VALUES (?, ?)", (job_id, api_key))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def claim_next(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically pick the next job for a worker, or None if the queue is empty"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs of workers that stopped heartbeating go back in the queue
+                self._conn.execute(
+                    "UPDATE job_queue SET status = 'queued', worker_id = NULL "
+                    "WHERE status = 'running' AND heartbeat_at < ?",
+                    (now - self.lease_seconds,)
+                )
+                row = self._conn.execute(
+                    """
+                    SELECT q.job_id, q.session_id, q.payload, q.attempts FROM job_queue q
+                    LEFT JOIN (
+                        SELECT user_key, COUNT(*) AS running FROM job_queue
+                        WHERE status = 'running' GROUP BY user_key
+                    ) r ON r.user_key = q.user_key
+                    WHERE q.status = 'queued'
+                    ORDER BY COALESCE(r.running, 0) ASC,
+                             q.size - (? - q.enqueued_at) * ? ASC,
+                             q.enqueued_at ASC
+                    LIMIT 1
+                    """,
+                    (now, JOB_AGING_PER_SECOND)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    """
+                    UPDATE job_queue SET status = 'running', worker_id = ?, attempts = attempts + 1,
+                        started_at = ?, heartbeat_at = ?
+                    WHERE job_id = ?
+                    """,
+                    (worker_id, now, now, row[0])
+                )
+                secret = self._conn.execute("SELECT api_key FROM job_secrets WHERE job_id = ?", (row[0],)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        payload = json.loads(row[2])
+        if secret is not None:
+            payload["apiKey"] = secret[0]
+        return {"jobId": row[0], "sessionId": row[1], "payload": payload, "attempts": row[3] + 1}
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extend a running job's lease; False if the worker no longer owns it"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE job_queue SET heartbeat_at = ? WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), job_id, worker_id)
+            )
+        return cursor.rowcount > 0
+
+    def status(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM job_queue WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def active_status(self, session_id: str) -> Optional[str]:
+        """'queued' or 'running' if the session has an unfinished job, else None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM job_queue WHERE session_id = ? AND status IN ('queued', 'running')",
+                (session_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def cancel(self, session_id: str) -> Optional[str]:
+        """Cancel a session's queued or running job, returning its previous status (None if there was none)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job_id, status FROM job_queue WHERE session_id = ? AND status IN ('queued', 'running')",
+                    (session_id,)
+                ).fetchone()
+                if row is not None:
+                    # A running job keeps its payload until its worker has stopped
+                    self._conn.execute(
+                        "UPDATE job_queue SET status = 'cancelled', finished_at = ?, "
+                        "payload = CASE WHEN status = 'queued' THEN NULL ELSE payload END WHERE job_id = ?",
+                        (time.time(), row[0])
+                    )
+                    # A running job's worker already holds the key and a cancelled job is never claimed again
+                    self._conn.execute("DELETE FROM job_secrets WHERE job_id = ?", (row[0],))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row[1] if row else None
+
+    def finish(self, job_id: str, status: str = "done") -> None:
+        """Mark a job finished and drop its payload and API key"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE job_queue SET status = ?, payload = NULL, finished_at = ? WHERE job_id = ?",
+                    (status, time.time(), job_id)
+                )
+                self._conn.execute("DELETE FROM job_secrets WHERE job_id = ?", (job_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def position(self, session_id: str) -> Optional[int]:
+        """Number of queued jobs enqueued before this session's job, or None if not queued"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT enqueued_at FROM job_queue WHERE session_id = ? AND status = 'queued'",
+                (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM job_queue WHERE status = 'queued' AND enqueued_at < ?",
+                (row[0],)
+            ).fetchone()[0]
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        """Delete finished job rows older than the given age, and any API key left behind by a finished job"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM job_queue WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+                (time.time() - older_than_seconds,)
+            )
+            self._conn.execute(
+                "DELETE FROM job_secrets WHERE job_id NOT IN "
+                "(SELECT job_id FROM job_queue WHERE status IN ('queued', 'running'))"
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_queue GROUP BY status"
+            ).fetchall())
+            users = self._conn.execute(
+                "SELECT COUNT(DISTINCT user_key) FROM job_queue WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+            workers = self._conn.execute(
+                "SELECT COUNT(DISTINCT worker_id) FROM job_queue WHERE status = 'running'"
+            ).fetchone()[0]
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "cancelled": counts.get("cancelled", 0),
+            "activeUsers": users,
+            "busyWorkers": workers
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_job_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    """Lazily open the process-wide job queue"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
+
+def close_job_queue() -> None:
+    global _job_queue
+    if _job_queue is not None:
+        _job_queue.close()
+        _job_queue = None
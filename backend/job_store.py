@@ -0,0 +1,408 @@
+"""
+Job store for reorganization sessions.
+
+Holds each session's latest progress snapshot and, once finished, its result
+bookmarks. Two implementations share one interface:
+
+- MemoryJobStore: in-process, bounded by a TTL since the last update and a
+  maximum number of sessions (finished sessions are evicted first).
+- SqliteJobStore: durable across restarts and shareable between processes.
+
+A background sweeper calls sweep() periodically so abandoned sessions are
+released even if their results are never fetched.
+
+Running jobs also checkpoint here: the job's inputs once, then each batch of
+categories the model assigns, so an interrupted job can resume where it
+stopped. Checkpoints are dropped with their session.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job store configuration (overridable through environment variables)
+JOB_STORE_BACKEND = os.getenv("PINPANDA_JOB_STORE", "memory")
+JOB_STORE_PATH = os.getenv(
+    "PINPANDA_JOB_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db")
+)
+JOB_TTL_SECONDS = int(os.getenv("PINPANDA_JOB_TTL_SECONDS", "3600"))
+MAX_JOBS = int(os.getenv("PINPANDA_MAX_JOBS", "500"))
+JOB_SWEEP_INTERVAL_SECONDS = float(os.getenv("PINPANDA_JOB_SWEEP_INTERVAL_SECONDS", "60"))
+
+FINISHED_STATUSES = ("completed", "error", "cancelled")
+
+def _approximate_size(value: Any) -> int:
+    """Rough in-memory footprint of progress/result payloads, in bytes"""
+    if isinstance(value, dict):
+        return 64 + sum(_approximate_size(k) + _approximate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(_approximate_size(v) for v in value)
+    if isinstance(value, str):
+        return 49 + len(value)
+    if hasattr(value, "model_dump"):
+        return _approximate_size(value.model_dump())
+    return 24
+
+class JobStore(ABC):
+    """Interface shared by the job store implementations"""
+
+    @abstractmethod
+    def save_progress(self, session_id: str, progress: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def get_progress(self, session_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save_result(self, session_id: str, bookmarks: List[Dict[str, Any]]) -> None:
+        ...
+
+    @abstractmethod
+    def get_result(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def save_checkpoint(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Store the job inputs needed to resume it, discarding earlier checkpoints"""
+
+    @abstractmethod
+    def append_checkpoint(self, session_id: str, assignments: Dict[int, str]) -> None:
+        """Record bookmark index -> category assignments completed since the last checkpoint"""
+
+    @abstractmethod
+    def get_checkpoint(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """{"state": ..., "assignments": {index: category}} or None"""
+
+    @abstractmethod
+    def delete_checkpoint(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def sweep(self) -> List[str]:
+        """Evict expired or excess sessions, returning their IDs"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get_progress(session_id) is not None
+
+    def close(self) -> None:
+        pass
+
+class _MemoryJob:
+    __slots__ = ("progress", "result", "checkpoint", "checkpoint_assignments", "updated_at", "size", "checkpoint_size")
+
+    def __init__(self):
+        self.progress: Dict[str, Any] = {}
+        self.result: Optional[List[Dict[str, Any]]] = None
+        self.checkpoint: Optional[Dict[str, Any]] = None
+        self.checkpoint_assignments: Dict[int, str] = {}
+        self.updated_at = time.time()
+        self.size = 0
+        # Tracked as checkpoints are written, so stats() doesn't walk them
+        self.checkpoint_size = 0
+
+class MemoryJobStore(JobStore):
+    """In-process job store with TTL and size-bounded eviction"""
+
+    def __init__(self, ttl_seconds: int = JOB_TTL_SECONDS, max_jobs: int = MAX_JOBS):
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, _MemoryJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def _touch(self, session_id: str) -> _MemoryJob:
+        job = self._jobs.get(session_id)
+        if job is None:
+            job = self._jobs[session_id] = _MemoryJob()
+        job.updated_at = time.time()
+        self._jobs.move_to_end(session_id)
+        return job
+
+    def save_progress(self, session_id: str, progress: Dict[str, Any]) -> None:
+        with self._lock:
+            job = self._touch(session_id)
+            job.progress = progress
+
+    def get_progress(self, session_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(session_id)
+        return job.progress if job is not None else None
+
+    def save_result(self, session_id: str, bookmarks: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            job = self._touch(session_id)
+            job.result = bookmarks
+            job.size = _approximate_size(bookmarks)
+
+    def get_result(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        job = self._jobs.get(session_id)
+        return job.result if job is not None else None
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(session_id, None)
+
+    def save_checkpoint(self, session_id: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            job = self._touch(session_id)
+            job.checkpoint = state
+            job.checkpoint_assignments = {}
+            job.checkpoint_size = _approximate_size(state) + _approximate_size(job.checkpoint_assignments)
+
+    def append_checkpoint(self, session_id: str, assignments: Dict[int, str]) -> None:
+        with self._lock:
+            job = self._touch(session_id)
+            for index, category in assignments.items():
+                if index not in job.checkpoint_assignments:
+                    job.checkpoint_size += _approximate_size(index)
+                else:
+                    job.checkpoint_size -= _approximate_size(job.checkpoint_assignments[index])
+                job.checkpoint_size += _approximate_size(category)
+                job.checkpoint_assignments[index] = category
+
+    def get_checkpoint(self, session_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(session_id)
+        if job is None or job.checkpoint is None:
+            return None
+        with self._lock:
+            return {"state": job.checkpoint, "assignments": dict(job.checkpoint_assignments)}
+
+    def delete_checkpoint(self, session_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if job is not None:
+                job.checkpoint = None
+                job.checkpoint_assignments = {}
+                job.checkpoint_size = 0
+
+    def sweep(self) -> List[str]:
+        now = time.time()
+        removed = []
+        with self._lock:
+            for session_id, job in list(self._jobs.items()):
+                if now - job.updated_at > self.ttl_seconds:
+                    removed.append(session_id)
+                    del self._jobs[session_id]
+
+            # Over the limit: drop the least recently updated, finished sessions first
+            overflow = len(self._jobs) - self.max_jobs
+            if overflow > 0:
+                finished = [sid for sid, job in self._jobs.items()
+                            if job.progress.get("status") in FINISHED_STATUSES]
+                running = [sid for sid in self._jobs if sid not in set(finished)]
+                for session_id in (finished + running)[:overflow]:
+                    removed.append(session_id)
+                    del self._jobs[session_id]
+
+        self.evicted += len(removed)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "backend": "memory",
+            "sessions": len(jobs),
+            "results": sum(1 for job in jobs if job.result is not None),
+            "checkpoints": sum(1 for job in jobs if job.checkpoint is not None),
+            "approxBytes": sum(
+                job.size + job.checkpoint_size + _approximate_size(job.progress) for job in jobs
+            ),
+            "evicted": self.evicted,
+            "ttlSeconds": self.ttl_seconds,
+            "maxJobs": self.max_jobs
+        }
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._jobs
+
+class SqliteJobStore(JobStore):
+    """Durable job store in a local SQLite file, shareable between processes"""
+
+    def __init__(self, path: str = JOB_STORE_PATH, ttl_seconds: int = JOB_TTL_SECONDS, max_jobs: int = MAX_JOBS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                session_id TEXT PRIMARY KEY,
+                status TEXT,
+                progress TEXT,
+                result TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs(updated_at)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_checkpoints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                data TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_job_checkpoints_session ON job_checkpoints(session_id, id)")
+        self._conn.commit()
+
+    def save_progress(self, session_id: str, progress: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (session_id, status, progress, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    status = excluded.status, progress = excluded.progress, updated_at = excluded.updated_at
+                """,
+                (session_id, progress.get("status"), json.dumps(progress), time.time())
+            )
+            self._conn.commit()
+
+    def get_progress(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT progress FROM jobs WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def save_result(self, session_id: str, bookmarks: List[Dict[str, Any]]) -> None:
+        payload = json.dumps([b.model_dump() if hasattr(b, "model_dump") else b for b in bookmarks])
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (session_id, result, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET result = excluded.result, updated_at = excluded.updated_at
+                """,
+                (session_id, payload, time.time())
+            )
+            self._conn.commit()
+
+    def get_result(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM jobs WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM job_checkpoints WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def save_checkpoint(self, session_id: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM job_checkpoints WHERE session_id = ?", (session_id,))
+            self._conn.execute(
+                "INSERT INTO job_checkpoints (session_id, kind, data) VALUES (?, 'state', ?)",
+                (session_id, json.dumps(state))
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+            self._conn.commit()
+
+    def append_checkpoint(self, session_id: str, assignments: Dict[int, str]) -> None:
+        # Appending keeps each checkpoint proportional to the new work, not the job size
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO job_checkpoints (session_id, kind, data) VALUES (?, 'assignments', ?)",
+                (session_id, json.dumps(assignments))
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+            self._conn.commit()
+
+    def get_checkpoint(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, data FROM job_checkpoints WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        state = None
+        assignments: Dict[int, str] = {}
+        for kind, data in rows:
+            if kind == "state":
+                state = json.loads(data)
+            else:
+                assignments.update((int(index), category) for index, category in json.loads(data).items())
+        return {"state": state, "assignments": assignments} if state is not None else None
+
+    def delete_checkpoint(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM job_checkpoints WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def sweep(self) -> List[str]:
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            removed = [row[0] for row in self._conn.execute(
+                "SELECT session_id FROM jobs WHERE updated_at < ?", (cutoff,)
+            )]
+            count = self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            overflow = count - len(removed) - self.max_jobs
+            if overflow > 0:
+                # Finished sessions first, then the least recently updated
+                placeholders = ",".join("?" * len(FINISHED_STATUSES))
+                removed += [row[0] for row in self._conn.execute(
+                    f"""
+                    SELECT session_id FROM jobs WHERE updated_at >= ?
+                    ORDER BY CASE WHEN status IN ({placeholders}) THEN 0 ELSE 1 END, updated_at ASC
+                    LIMIT ?
+                    """,
+                    (cutoff, *FINISHED_STATUSES, overflow)
+                )]
+            if removed:
+                self._conn.executemany("DELETE FROM jobs WHERE session_id = ?", [(sid,) for sid in removed])
+                self._conn.executemany("DELETE FROM job_checkpoints WHERE session_id = ?", [(sid,) for sid in removed])
+                self._conn.commit()
+
+        self.evicted += len(removed)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions, results, size = self._conn.execute(
+                "SELECT COUNT(*), COUNT(result), "
+                "COALESCE(SUM(LENGTH(progress)), 0) + COALESCE(SUM(LENGTH(result)), 0) FROM jobs"
+            ).fetchone()
+            checkpoints, checkpoint_size = self._conn.execute(
+                "SELECT COUNT(DISTINCT session_id), COALESCE(SUM(LENGTH(data)), 0) FROM job_checkpoints"
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "results": results,
+            "checkpoints": checkpoints,
+            "approxBytes": size + checkpoint_size,
+            "evicted": self.evicted,
+            "ttlSeconds": self.ttl_seconds,
+            "maxJobs": self.max_jobs
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def create_job_store(backend: str = JOB_STORE_BACKEND) -> JobStore:
+    """Build the configured job store implementation"""
+    if backend == "sqlite":
+        logger.info(f"Using SQLite job store at {JOB_STORE_PATH}")
+        return SqliteJobStore()
+    if backend != "memory":
+        logger.warning(f"Unknown job store '{backend}', using the in-memory store")
+    return MemoryJobStore()
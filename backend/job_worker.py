@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Reorganization worker processes.
+
+Each worker process claims jobs from the shared SQLite queue and runs them on
+its own event loop, writing progress and results to the shared SQLite job
+store so any API worker can serve them. Start it next to the API with
+PINPANDA_JOB_QUEUE=1 set for both:
+
+    python job_worker.py --workers 4
+
+With --metrics-port, worker i serves Prometheus metrics for its jobs at
+http://host:(port + i)/metrics.
+"""
+import os
+import sys
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+WORKER_METRICS_PORT = int(os.getenv("PINPANDA_WORKER_METRICS_PORT", "0"))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        from metrics import registry, CONTENT_TYPE
+
+        if self.path.split("?", 1)[0] not in ("/metrics", "/api/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def _serve_metrics(port: int) -> None:
+    """Serve this process's metrics from a background thread"""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving worker metrics on port {port}")
+
+async def _supervise(queue, job_id: str, worker_id: str, job_task: asyncio.Task) -> str:
+    """
+    Heartbeat a running job and stop it if it is cancelled or its lease is
+    lost. Returns "cancelled" or "lost" when it stopped the job.
+    """
+    from job_queue import JOB_POLL_SECONDS, JOB_HEARTBEAT_SECONDS
+
+    loop = asyncio.get_running_loop()
+    next_heartbeat = loop.time() + JOB_HEARTBEAT_SECONDS
+    while True:
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        if await asyncio.to_thread(queue.status, job_id) == "cancelled":
+            logger.info(f"Job {job_id} was cancelled")
+            job_task.cancel()
+            return "cancelled"
+        if loop.time() >= next_heartbeat:
+            next_heartbeat = loop.time() + JOB_HEARTBEAT_SECONDS
+            if not await asyncio.to_thread(queue.heartbeat, job_id, worker_id):
+                logger.warning(f"Worker {worker_id} lost the lease on job {job_id}")
+                job_task.cancel()
+                return "lost"
+
+async def run_worker(worker_id: str, metrics_port: int = 0) -> None:
+    """Claim and run jobs until cancelled"""
+    # Imported here so each spawned process builds its own app state
+    import main
+    from job_queue import get_job_queue, JOB_POLL_SECONDS
+    from metrics import registry, ACTIVE_SESSIONS
+
+    running = {"session": None}
+    # Registered after main's collector, so this count wins
+    registry.add_collector(lambda: ACTIVE_SESSIONS.set(1 if running["session"] else 0))
+    if metrics_port:
+        _serve_metrics(metrics_port)
+
+    queue = get_job_queue()
+    await main.start_openai_client()
+    logger.info(f"Worker {worker_id} started")
+    try:
+        while True:
+            job = await asyncio.to_thread(queue.claim_next, worker_id)
+            if job is None:
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+
+            session_id = job["sessionId"]
+            logger.info(f"Worker {worker_id} running job {job['jobId']} (session {session_id}, attempt {job['attempts']})")
+            # A re-claimed job picks up from its checkpoint
+            job_task = asyncio.create_task(main.reorganize_bookmarks_background(main.ReorganizeRequest(**job["payload"])))
+            supervisor = asyncio.create_task(_supervise(queue, job["jobId"], worker_id, job_task))
+            running["session"] = session_id
+            try:
+                await job_task
+            except asyncio.CancelledError:
+                if not supervisor.done():
+                    raise
+            finally:
+                running["session"] = None
+                supervisor.cancel()
+                # Nobody subscribes in a worker (API processes relay from the job store), and
+                # workers run no sweeper, so drop the job's channels here
+                main.progress_broker.discard(session_id)
+                main.result_streams.discard(session_id)
+
+            if supervisor.done() and not supervisor.cancelled() and supervisor.result() == "lost":
+                # Another worker owns the job now
+                continue
+            progress = main.job_store.get_progress(session_id) or {}
+            status = {"error": "failed", "cancelled": "cancelled"}.get(progress.get("status"), "done")
+            await asyncio.to_thread(queue.finish, job["jobId"], status)
+    finally:
+        await main.close_openai_client()
+
+def _worker_process(worker_id: str, metrics_port: int = 0) -> None:
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run_worker(worker_id, metrics_port))
+    except KeyboardInterrupt:
+        pass
+
+def main() -> None:
+    # Workers and API processes must share the queue and the job store. Set before any
+    # project import: modules read their configuration once, and forked workers inherit them
+    os.environ.setdefault("PINPANDA_JOB_QUEUE", "1")
+    os.environ.setdefault("PINPANDA_JOB_STORE", "sqlite")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from job_queue import JOB_WORKERS
+
+    parser = argparse.ArgumentParser(description="Run PinPanda reorganization workers")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="number of worker processes")
+    parser.add_argument(
+        "--metrics-port", type=int, default=WORKER_METRICS_PORT,
+        help="serve each worker's metrics on this port plus its index (0 disables)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    host = socket.gethostname()
+    processes = [
+        multiprocessing.Process(
+            target=_worker_process,
+            args=(f"{host}-{os.getpid()}-{i}", args.metrics_port + i if args.metrics_port else 0),
+            daemon=True
+        )
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {len(processes)} reorganization workers")
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logger.info("Stopping workers")
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    main()
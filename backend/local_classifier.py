@@ -0,0 +1,216 @@
+"""
+Local pre-classification of bookmarks before they are sent to the model.
+
+Two sources of high-confidence answers:
+
+- A nearest-neighbour model over bookmarks the LLM already categorized for
+  this model/depth (training examples kept by the categorization cache),
+  using the same hashed TF-IDF vectors as semantic search. A bookmark is
+  resolved when its closest examples are very similar and agree on a
+  category, so it follows the user's own taxonomy.
+- Domain/path rules for sites whose category is unambiguous (code hosting,
+  package registries, banking, ...), used when the neighbours have no answer.
+
+Everything else is left for the LLM.
+
+Off by default (PINPANDA_LOCAL_CLASSIFIER, or useLocalClassifier per job):
+the rules use fixed category names that need not match the ones the model
+makes up for a collection, so enabling them mixes two taxonomies in one
+result. Jobs that opt in can keep the rules off with PINPANDA_LOCAL_RULES=0.
+"""
+import os
+import logging
+import threading
+from urllib.parse import urlsplit
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from category_merge import format_category_path
+from semantic_search import vectorize_texts, FIELD_WEIGHTS
+from prompt_encoding import compact_url
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CLASSIFIER_ENABLED = os.getenv("PINPANDA_LOCAL_CLASSIFIER", "0").lower() in ("1", "true", "yes")
+LOCAL_RULES_ENABLED = os.getenv("PINPANDA_LOCAL_RULES", "1").lower() in ("1", "true", "yes")
+
+# Nearest-neighbour settings
+KNN_NEIGHBORS = 7
+KNN_MIN_TRAINING_EXAMPLES = 50
+KNN_MAX_TRAINING_EXAMPLES = int(os.getenv("PINPANDA_KNN_MAX_EXAMPLES", "20000"))
+# The closest example must be at least this similar (cosine) ...
+KNN_MIN_SIMILARITY = float(os.getenv("PINPANDA_KNN_MIN_SIMILARITY", "0.75"))
+# ... and this share of the similarity-weighted neighbour votes must agree
+KNN_MIN_AGREEMENT = float(os.getenv("PINPANDA_KNN_MIN_AGREEMENT", "0.8"))
+# Neighbours less similar than this do not vote
+KNN_VOTE_SIMILARITY = 0.5
+# Query rows scored per matrix product, bounding memory
+KNN_QUERY_BATCH = 1024
+
+# (host suffix, path prefix or None, main category, subcategory)
+DOMAIN_RULES: List[Tuple[str, Optional[str], str, Optional[str]]] = [
+    ("github.com", None, "Development", "Code Repositories"),
+    ("gitlab.com", None, "Development", "Code Repositories"),
+    ("bitbucket.org", None, "Development", "Code Repositories"),
+    ("stackoverflow.com", None, "Development", "Q&A"),
+    ("stackexchange.com", None, "Development", "Q&A"),
+    ("developer.mozilla.org", None, "Development", "Documentation"),
+    ("docs.python.org", None, "Development", "Documentation"),
+    ("readthedocs.io", None, "Development", "Documentation"),
+    ("readthedocs.org", None, "Development", "Documentation"),
+    ("npmjs.com", None, "Development", "Packages"),
+    ("pypi.org", None, "Development", "Packages"),
+    ("crates.io", None, "Development", "Packages"),
+    ("arxiv.org", None, "Education", "Research Papers"),
+    ("coursera.org", None, "Education", "Online Courses"),
+    ("udemy.com", None, "Education", "Online Courses"),
+    ("edx.org", None, "Education", "Online Courses"),
+    ("khanacademy.org", None, "Education", "Online Courses"),
+    ("wikipedia.org", None, "Reference", "Wikipedia"),
+    ("paypal.com", None, "Finance", "Payments"),
+    ("chase.com", None, "Finance", "Banking"),
+    ("bankofamerica.com", None, "Finance", "Banking"),
+    ("wellsfargo.com", None, "Finance", "Banking"),
+    ("capitalone.com", None, "Finance", "Banking"),
+    ("netflix.com", None, "Entertainment", "Streaming"),
+    ("spotify.com", None, "Entertainment", "Music"),
+    ("booking.com", None, "Travel", "Bookings"),
+    ("airbnb.com", None, "Travel", "Bookings"),
+    ("expedia.com", None, "Travel", "Bookings"),
+    ("google.com", "/maps", "Travel", "Maps"),
+    ("mail.google.com", None, "Productivity", "Email"),
+    ("docs.google.com", None, "Productivity", "Documents"),
+    ("drive.google.com", None, "Productivity", "Documents"),
+]
+
+def _host_and_path(url: str) -> Tuple[str, str]:
+    try:
+        parts = urlsplit((url or "").strip())
+    except ValueError:
+        return "", ""
+    host = parts.netloc.rpartition("@")[2].split(":", 1)[0].lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return host, parts.path or "/"
+
+def match_domain_rule(url: str, depth: str = "balanced") -> Optional[str]:
+    """Category path for URLs covered by a domain rule, or None"""
+    host, path = _host_and_path(url)
+    if not host:
+        return None
+    for suffix, path_prefix, main, sub in DOMAIN_RULES:
+        if host == suffix or host.endswith("." + suffix):
+            if path_prefix and not path.startswith(path_prefix):
+                continue
+            # Simple categorization uses main categories only
+            return format_category_path(main, None if depth == "simple" else sub)
+    return None
+
+def _example_fields(title: str, url: str, folder: Optional[str]) -> List[Tuple[str, float]]:
+    return [
+        (title or "", FIELD_WEIGHTS["title"]),
+        (compact_url(url or ""), FIELD_WEIGHTS["url"]),
+        (folder or "", FIELD_WEIGHTS["folder"])
+    ]
+
+class NearestNeighborModel:
+    """Cosine k-nearest-neighbour classifier over hashed TF-IDF vectors"""
+
+    def __init__(self, examples: Sequence[Tuple[str, str, Optional[str], str]]):
+        raw = vectorize_texts([_example_fields(title, url, folder) for title, url, folder, _ in examples])
+        df = np.count_nonzero(raw, axis=0).astype(np.float32)
+        self.idf = np.log((1.0 + len(examples)) / (1.0 + df)).astype(np.float32) + 1.0
+        self.matrix = self._normalize(raw * self.idf)
+        self.category_names = sorted({category for _, _, _, category in examples})
+        codes = {name: code for code, name in enumerate(self.category_names)}
+        self.labels = np.fromiter((codes[category] for _, _, _, category in examples), dtype=np.int64, count=len(examples))
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def predict(self, bookmarks: Sequence[Any]) -> List[Optional[Tuple[str, float]]]:
+        """(category, agreement) for bookmarks whose neighbours are close and agree, else None"""
+        predictions: List[Optional[Tuple[str, float]]] = [None] * len(bookmarks)
+        k = min(KNN_NEIGHBORS, len(self.labels))
+        for start in range(0, len(bookmarks), KNN_QUERY_BATCH):
+            batch = bookmarks[start:start + KNN_QUERY_BATCH]
+            queries = self._normalize(
+                vectorize_texts([_example_fields(b.title, b.url, b.folder) for b in batch]) * self.idf
+            )
+            scores = queries @ self.matrix.T
+            neighbours = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, columns in enumerate(neighbours):
+                similarities = scores[row, columns]
+                if similarities.max() < KNN_MIN_SIMILARITY:
+                    continue
+                voting = similarities >= KNN_VOTE_SIMILARITY
+                votes = np.bincount(self.labels[columns[voting]], weights=similarities[voting])
+                best = int(np.argmax(votes))
+                agreement = float(votes[best] / votes.sum())
+                if agreement >= KNN_MIN_AGREEMENT:
+                    predictions[start + row] = (self.category_names[best], round(agreement, 3))
+        return predictions
+
+class LocalClassifier:
+    """Per-namespace nearest-neighbour models, rebuilt when their training examples change"""
+
+    def __init__(self):
+        self._models: Dict[str, Tuple[Tuple[int, float], Optional[NearestNeighborModel]]] = {}
+        self._lock = threading.Lock()
+
+    def _model_for(self, namespace: str, cache: Any) -> Optional[NearestNeighborModel]:
+        version = cache.examples_version(namespace)
+        with self._lock:
+            cached = self._models.get(namespace)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        model = None
+        if version[0] >= KNN_MIN_TRAINING_EXAMPLES:
+            examples = cache.load_examples(namespace, KNN_MAX_TRAINING_EXAMPLES)
+            model = NearestNeighborModel(examples)
+            logger.info(f"Trained local classifier for {namespace} on {len(model)} examples")
+        with self._lock:
+            self._models[namespace] = (version, model)
+        return model
+
+    def classify(
+        self,
+        bookmarks: Sequence[Any],
+        namespace: str,
+        depth: str,
+        cache: Any
+    ) -> Tuple[Dict[int, str], Dict[str, int]]:
+        """
+        Resolve what can be resolved locally.
+        Returns (position -> category path, count per source).
+        """
+        resolved: Dict[int, str] = {}
+        counts = {"neighbors": 0, "rules": 0}
+
+        model = self._model_for(namespace, cache) if cache is not None else None
+        if model is not None:
+            for position, prediction in enumerate(model.predict(bookmarks)):
+                if prediction is not None:
+                    resolved[position] = prediction[0]
+            counts["neighbors"] = len(resolved)
+
+        if LOCAL_RULES_ENABLED:
+            for position, bookmark in enumerate(bookmarks):
+                if position in resolved:
+                    continue
+                category = match_domain_rule(bookmark.url, depth)
+                if category is not None:
+                    resolved[position] = category
+                    counts["rules"] += 1
+
+        return resolved, counts
+
+local_classifier = LocalClassifier()
@@ -1,22 +1,69 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any, Union
+from pydantic import BaseModel, field_validator
+from typing import List, Optional, Dict, Any, Sequence, Union
 import asyncio
 import httpx
 import json
 import logging
+import time
 from datetime import datetime
 import uuid
 import re
-import math
-from urllib.parse import urlparse
+from collections import Counter
+from contextlib import aclosing
+
+from openai_client import (
+    start_openai_client, close_openai_client, post_chat_completion,
+    stream_chat_completion, iter_completion_deltas, OPENAI_STREAM_RESPONSES
+)
+from category_merge import CategoryMerger, UNCATEGORIZED
+from search_index import get_search_index, collection_fingerprint
+from semantic_search import get_semantic_index
+from intent_classifier import classify_intent, intent_cache
+from progress_events import progress_broker, format_sse
+from result_stream import result_streams, format_ndjson
+from job_store import create_job_store, JOB_SWEEP_INTERVAL_SECONDS, JOB_TTL_SECONDS, FINISHED_STATUSES
+from job_queue import JOB_QUEUE_ENABLED, JOB_POLL_SECONDS, get_job_queue, close_job_queue, user_key_for
+from token_budget import (
+    count_tokens, chat_prompt_tokens, input_token_budget, max_items_per_response, pack_chunks,
+    record_prompt_usage, estimate_completion_tokens, estimate_cost_usd, RESPONSE_MAX_TOKENS, OUTPUT_OVERHEAD_TOKENS
+)
+from dedupe import (
+    URLCanonicalizer, DedupeReport, find_duplicates, NEAR_DUPLICATE_THRESHOLD
+)
+from taxonomy import (
+    Taxonomy, TAXONOMY_FIELDS, DEFAULT_TAXONOMY_MODE, TAXONOMY_SYSTEM_PROMPT, ASSIGNMENT_SYSTEM_PROMPT,
+    select_taxonomy_sample, create_taxonomy_prompt, create_assignment_prompt, parse_taxonomy
+)
+from incremental_json import IncrementalJSONParser, MalformedResponseError, TruncatedResponseError, parse_partial_object
+from retry_policy import (
+    RetryStats, RETRY_MAX_ATTEMPTS, RETRY_AFTER_LIMIT_SECONDS, MIN_SPLIT_CHUNK_SIZE,
+    backoff_delay, parse_retry_after, retry_after_headers, is_retryable_status
+)
+from prompt_encoding import encode_bookmarks, bookmark_entry_texts, format_description
+from categorization_cache import make_cache_key, get_categorization_cache, close_categorization_cache
+from local_classifier import local_classifier, LOCAL_CLASSIFIER_ENABLED
+from collection_store import collection_store, CollectionNotFoundError, VersionConflictError
+from collection_stats import CollectionStats
+from admission import token_budgets, JobBudget, BudgetExceededError, SESSION_TOKEN_BUDGET
+from bookmark_record import Bookmark, pack_bookmarks, unpack_bookmarks
+from request_decoding import DecodingRoute
+from metrics import (
+    registry as metrics_registry, record_token_usage, CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    OPENAI_RETRIES, CHUNK_SECONDS, CHUNK_SPLITS, JOB_SECONDS, BOOKMARKS_CATEGORIZED,
+    CATEGORIZATION_CACHE_LOOKUPS, INTENT_CACHE_LOOKUPS, INTENT_DETECTIONS, ACTIVE_SESSIONS,
+    QUEUE_JOBS, JOB_STORE_SESSIONS, JOB_STORE_BYTES, JOB_STORE_CHECKPOINTS, JOB_STORE_EVICTIONS
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="PinPanda AI Backend", version="1.0.0")
+# Accept compressed bodies and parse JSON with orjson/msgspec when available
+app.router.route_class = DecodingRoute
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,22 +74,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Data models
-class Bookmark(BaseModel):
-    title: str
-    url: str
-    description: Optional[str] = ""
-    category: Optional[str] = "Uncategorized"
-    dateAdded: Optional[str] = None
-    favicon: Optional[str] = None
-    folder: Optional[str] = None
-    id: Optional[str] = None
+@app.on_event("startup")
+async def startup_event():
+    """Open the shared, pooled OpenAI client and start the job sweeper"""
+    global _sweeper_task
+    await start_openai_client()
+    _sweeper_task = asyncio.create_task(sweep_jobs_periodically())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the job sweeper and running jobs, and close shared clients and stores"""
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+    # Cancelled jobs keep their checkpoints and can be resumed after a restart
+    running = list(_running_jobs.values())
+    for task in running:
+        task.cancel()
+    await asyncio.gather(*running, return_exceptions=True)
+    await close_openai_client()
+    close_categorization_cache()
+    close_job_queue()
+    job_store.close()
+
+# Data models
 class DuplicateStats(BaseModel):
     uniqueUrls: int
     urlsWithDuplicates: int
     totalDuplicateReferences: int
     mostDuplicatedUrls: List[Dict[str, Any]]
+    nearDuplicateGroups: int = 0
+    nearDuplicateBookmarks: int = 0
+    topNearDuplicates: List[Dict[str, Any]] = []
 
 class ProgressUpdate(BaseModel):
     sessionId: str
@@ -54,20 +116,46 @@ class ProgressUpdate(BaseModel):
     step: Optional[int] = 0
     bookmarksProcessed: Optional[int] = 0
     duplicatesFound: Optional[int] = 0
+    cachedBookmarks: Optional[int] = 0
+    localBookmarks: Optional[int] = 0
+    resumedBookmarks: Optional[int] = 0
+    retriedChunks: Optional[int] = 0
+    splitChunks: Optional[int] = 0
+    failedChunks: Optional[int] = 0
+    estimatedTokens: Optional[int] = 0
+    usedTokens: Optional[int] = 0
     duplicateStats: Optional[DuplicateStats] = None
 
 class ReorganizeRequest(BaseModel):
-    bookmarks: List[Bookmark]
+    bookmarks: Optional[List[Bookmark]] = None
+    collectionId: Optional[str] = None  # Use a stored collection instead of sending bookmarks
     apiKey: str
     model: str = "gpt-4o-mini"
     categorizationDepth: str = "balanced"
     sessionId: str
+    useCache: bool = True
+    useLocalClassifier: bool = LOCAL_CLASSIFIER_ENABLED  # Resolve confident bookmarks without the model
+    taxonomyMode: str = DEFAULT_TAXONOMY_MODE  # "chunked" or "global" (derive categories once, then assign)
+
+class EstimateRequest(BaseModel):
+    bookmarks: Optional[List[Bookmark]] = None
+    collectionId: Optional[str] = None
+    apiKey: Optional[str] = None  # Only used to report the key's current usage and admission
+    model: str = "gpt-4o-mini"
+    categorizationDepth: str = "balanced"
+    useCache: bool = True
+    taxonomyMode: str = DEFAULT_TAXONOMY_MODE
+
+class ResumeRequest(BaseModel):
+    apiKey: str  # Never stored with the checkpoint
 
 class ChatRequest(BaseModel):
     message: str
-    bookmarks: List[Bookmark]
+    bookmarks: Optional[List[Bookmark]] = None
+    collectionId: Optional[str] = None  # Use a stored collection instead of sending bookmarks
     apiKey: str
     chatModel: str = "gpt-4o-mini"  # Separate model for chat/search
+    searchMode: str = "auto"  # "auto" | "local" | "ai"
     context: Optional[Dict[str, Any]] = {}
 
 class ChatResponse(BaseModel):
@@ -77,18 +165,192 @@ class ChatResponse(BaseModel):
     results: Optional[List[Bookmark]] = None
     suggestions: Optional[List[str]] = None
 
-# Global storage for progress tracking
-progress_store: Dict[str, ProgressUpdate] = {}
+class CollectionUploadRequest(BaseModel):
+    bookmarks: List[Bookmark]
+
+class BookmarkUpdate(BaseModel):
+    id: str
+    title: Optional[str] = None
+    url: Optional[str] = None
+    description: Optional[str] = None
+    category: Optional[str] = None
+    dateAdded: Optional[str] = None
+    favicon: Optional[str] = None
+    folder: Optional[str] = None
+
+    @field_validator("title", "url")
+    @classmethod
+    def required_field_not_null(cls, value: Optional[str]) -> str:
+        # Only runs for fields the client sent; title and url can be left out but not cleared
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+class CollectionDeltaRequest(BaseModel):
+    baseVersion: Optional[int] = None  # Rejected with 409 if the collection has moved on
+    add: List[Bookmark] = []
+    update: List[BookmarkUpdate] = []
+    delete: List[str] = []
+
+class DuplicatesRequest(BaseModel):
+    bookmarks: Optional[List[Bookmark]] = None
+    collectionId: Optional[str] = None
+    # URL canonicalization options
+    ignoreScheme: bool = True
+    ignoreWww: bool = True
+    ignoreFragment: bool = True
+    ignoreTrailingSlash: bool = True
+    stripTrackingParams: bool = True
+    sortQueryParams: bool = True
+    ignoredParams: List[str] = []
+    # Near-duplicate detection on titles and URLs
+    nearDuplicates: bool = True
+    threshold: float = NEAR_DUPLICATE_THRESHOLD
+    limit: int = 100
+
+class StatsRequest(BaseModel):
+    bookmarks: Optional[List[Bookmark]] = None
+    collectionId: Optional[str] = None
+    top: int = 10
+    folderCategories: int = 3  # Top categories listed for each folder
+    domainsOverTime: int = 5  # Top domains listed with their bookmarks added per month
+
+# Job storage for progress tracking and results
+# Queued jobs run in worker processes, so their state must live in the shared SQLite store
+job_store = create_job_store("sqlite") if JOB_QUEUE_ENABLED else create_job_store()
+_sweeper_task: Optional[asyncio.Task] = None
+# Reorganizations running in this process, by session
+_running_jobs: Dict[str, asyncio.Task] = {}
+
+def set_progress(session_id: str, progress: ProgressUpdate) -> None:
+    """Store a new progress snapshot and push it to streaming subscribers"""
+    snapshot = progress.model_dump()
+    job_store.save_progress(session_id, snapshot)
+    progress_broker.publish(session_id, snapshot)
+
+def update_progress(session_id: str, **fields: Any) -> None:
+    """Change fields of the current progress snapshot and push it to streaming subscribers"""
+    snapshot = dict(job_store.get_progress(session_id) or {}, **fields)
+    job_store.save_progress(session_id, snapshot)
+    progress_broker.publish(session_id, snapshot)
+
+def release_session(session_id: str) -> None:
+    """Drop everything held for a session"""
+    job_store.delete(session_id)
+    progress_broker.discard(session_id)
+    result_streams.discard(session_id)
+
+async def sweep_jobs_periodically():
+    """Evict abandoned sessions so their results do not stay in memory forever"""
+    while True:
+        await asyncio.sleep(JOB_SWEEP_INTERVAL_SECONDS)
+        try:
+            removed = await asyncio.to_thread(job_store.sweep)
+            for session_id in removed:
+                progress_broker.discard(session_id)
+                result_streams.discard(session_id)
+            if removed:
+                logger.info(f"Job sweeper evicted {len(removed)} sessions")
+            if JOB_QUEUE_ENABLED:
+                await asyncio.to_thread(get_job_queue().purge_finished, JOB_TTL_SECONDS)
+        except Exception as e:
+            logger.error(f"Job sweep failed: {str(e)}")
+
+_mirrored_sessions = set()
+
+def mirror_queued_session(session_id: str) -> None:
+    """Relay a stored job's progress and result (run by a worker, or already finished) to this process's streams"""
+    if session_id not in _mirrored_sessions:
+        _mirrored_sessions.add(session_id)
+        asyncio.create_task(_mirror_queued_session(session_id))
+
+async def _mirror_queued_session(session_id: str):
+    last_progress = None
+    try:
+        while True:
+            progress = await asyncio.to_thread(job_store.get_progress, session_id)
+            if progress is None:
+                break
+            if progress != last_progress:
+                progress_broker.publish(session_id, progress)
+                last_progress = progress
+            
+            status = progress.get("status")
+            if status in FINISHED_STATUSES:
+                if session_id in result_streams and not result_streams.is_finished(session_id):
+                    await _replay_stored_result(session_id, progress)
+                break
+            await asyncio.sleep(JOB_POLL_SECONDS)
+    except Exception as e:
+        logger.error(f"Mirroring queued session {session_id} failed: {str(e)}")
+    finally:
+        _mirrored_sessions.discard(session_id)
+
+async def _replay_stored_result(session_id: str, progress: Dict[str, Any]):
+    """Stream a finished job's stored result as NDJSON records"""
+    if progress.get("status") == "cancelled":
+        result_streams.finish(session_id, {"type": "cancelled", "message": progress.get("message", "")})
+        return
+    if progress.get("status") != "completed":
+        result_streams.finish(session_id, {"type": "error", "message": progress.get("message", "")})
+        return
+    
+    result = await asyncio.to_thread(job_store.get_result, session_id) or []
+    records = []
+    category_counts: Dict[str, int] = {}
+    for i, bookmark in enumerate(result):
+        bookmark = bookmark if isinstance(bookmark, dict) else bookmark.model_dump()
+        category = bookmark.get("category") or UNCATEGORIZED
+        records.append({"type": "bookmark", "index": i, "id": bookmark.get("id"), "category": category})
+        if category != UNCATEGORIZED:
+            category_counts[category] = category_counts.get(category, 0) + 1
+    result_streams.append(session_id, records)
+    result_streams.finish(session_id, {
+        "type": "summary",
+        "total": len(result),
+        "categories": category_counts,
+        "uncategorized": len(result) - sum(category_counts.values()),
+        "cached": progress.get("cachedBookmarks", 0),
+        "local": progress.get("localBookmarks", 0),
+        "resumed": progress.get("resumedBookmarks", 0),
+        "retried": progress.get("retriedChunks", 0),
+        "split": progress.get("splitChunks", 0),
+        "failed": progress.get("failedChunks", 0)
+    })
 
 # Processing configuration
 BATCH_SIZE = 75  # Optimized batch size
-MAX_CONCURRENT_REQUESTS = 5  # Increased for better parallelization
-REQUEST_DELAY = 1.0  # Delay between batches in seconds
+MAX_CONCURRENT_REQUESTS = 5  # Chunks processed in parallel per reorganization
 MAX_TOKENS_PER_CHUNK = 20000  # Conservative token limit
 PROCESSING_TIMEOUT_MS = 120000  # 2 minutes
+MALFORMED_RESPONSE_ATTEMPTS = 2  # Tries per prompt when the answer is malformed
+
+# Chat configuration
+INTENT_CONFIDENCE_THRESHOLD = 0.75  # Local intent results below this fall back to the LLM
+
+# Search configuration
+SEARCH_RESULT_LIMIT = 15  # Results returned to the chat
+SEARCH_CANDIDATE_LIMIT = 100  # Candidates ranked locally / sent for AI reranking
+SEMANTIC_SCORE_WEIGHT = 0.6  # Blend of cosine similarity and normalized BM25
+KEYWORD_SCORE_WEIGHT = 0.4
+LOCAL_SEARCH_MIN_SCORE = 0.35  # Below this the AI reranks (searchMode "auto")
 
 async def detect_intent(message: str, api_key: str, model: str) -> Dict[str, Any]:
-    """Detect user intent from chat message"""
+    """Detect user intent from chat message, locally when confident, otherwise with the LLM"""
+    cached = intent_cache.get(message)
+    if cached is not None:
+        INTENT_DETECTIONS.inc(source="cache")
+        return cached
+    
+    local_result = classify_intent(message)
+    if local_result["confidence"] >= INTENT_CONFIDENCE_THRESHOLD:
+        INTENT_DETECTIONS.inc(source="local")
+        intent_cache.put(message, local_result)
+        return local_result
+    INTENT_DETECTIONS.inc(source="llm")
+    
+    logger.info(f"Local intent '{local_result['intent']}' below threshold ({local_result['confidence']}), asking the LLM")
+    
     intent_prompt = f"""
 Analyze this user message about bookmarks and determine the intent. Return ONLY a JSON object with this structure:
 
@@ -112,206 +374,160 @@ Intent definitions:
 - stats: Analytics, counts, duplicate info, statistics. Keywords: how many, count, stats, statistics, duplicates, analytics.
 """
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                },
-                json={
-                    "model": get_model_name(model),
-                    "messages": [
-                        {"role": "user", "content": intent_prompt}
-                    ],
-                    "temperature": 0.1,
-                    "max_tokens": 300
-                }
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                content = data['choices'][0]['message']['content']
-                try:
-                    return json.loads(content)
-                except json.JSONDecodeError:
-                    logger.warning(f"Failed to parse intent JSON: {content}")
-                    return {"intent": "general", "confidence": 0.5, "entities": {}}
-            else:
-                logger.error(f"Intent detection API error: {response.status_code}")
+    try:
+        response = await post_chat_completion(api_key, {
+            "model": get_model_name(model),
+            "messages": [
+                {"role": "user", "content": intent_prompt}
+            ],
+            "temperature": 0.1,
+            "max_tokens": 300
+        }, call_site="detect_intent")
+        
+        if response.status_code == 200:
+            data = response.json()
+            record_token_usage("detect_intent", data.get("usage"))
+            token_budgets.record(api_key, data.get("usage"))
+            content = data['choices'][0]['message']['content']
+            try:
+                result = json.loads(content)
+                intent_cache.put(message, result)
+                return result
+            except json.JSONDecodeError:
+                logger.warning(f"Failed to parse intent JSON: {content}")
                 return {"intent": "general", "confidence": 0.5, "entities": {}}
-                
-        except Exception as e:
-            logger.error(f"Intent detection failed: {str(e)}")
+        else:
+            logger.error(f"Intent detection API error: {response.status_code}")
             return {"intent": "general", "confidence": 0.5, "entities": {}}
+            
+    except Exception as e:
+        logger.error(f"Intent detection failed: {str(e)}")
+        return {"intent": "general", "confidence": 0.5, "entities": {}}
 
-def perform_keyword_search(query: str, bookmarks: List[Bookmark]) -> List[Bookmark]:
-    """Perform keyword-based search on bookmarks"""
-    query_lower = query.lower()
-    keywords = query_lower.split()
-    
-    logger.info(f"Keyword search: '{query}' -> keywords: {keywords} in {len(bookmarks)} bookmarks")
-    
-    scored_bookmarks = []
-    
-    for bookmark in bookmarks:
-        score = 0
-        text_fields = [
-            bookmark.title.lower(),
-            bookmark.url.lower(),
-            (bookmark.category or "").lower(),
-            (bookmark.description or "").lower()
-        ]
-        
-        combined_text = " ".join(text_fields)
-        
-        # Score based on keyword matches
-        for keyword in keywords:
-            if keyword in bookmark.title.lower():
-                score += 10  # Title matches are most important
-            elif keyword in bookmark.url.lower():
-                score += 5   # URL matches are good
-            elif keyword in (bookmark.category or "").lower():
-                score += 3   # Category matches
-            elif keyword in (bookmark.description or "").lower():
-                score += 2   # Description matches
-            elif keyword in combined_text:
-                score += 1   # Any other match
-        
-        if score > 0:
-            scored_bookmarks.append((bookmark, score))
-    
-    # Sort by score and return top results
-    scored_bookmarks.sort(key=lambda x: x[1], reverse=True)
-    result_bookmarks = [bookmark for bookmark, score in scored_bookmarks[:50]]
-    
-    logger.info(f"Keyword search found {len(scored_bookmarks)} matches, returning top {len(result_bookmarks)}")
+def perform_keyword_search(query: str, bookmarks: List[Bookmark], version_key: str) -> List[Bookmark]:
+    """Perform BM25 keyword search on bookmarks using the cached inverted index"""
+    index = get_search_index(bookmarks, version_key)
+    scored_indices = index.search(query, limit=50)
+    result_bookmarks = [bookmarks[i] for i, score in scored_indices]
+    
+    logger.info(f"Keyword search: '{query}' in {len(bookmarks)} bookmarks, returning top {len(result_bookmarks)}")
     return result_bookmarks
 
-async def search_bookmarks_with_ai(query: str, bookmarks: List[Bookmark], api_key: str, model: str) -> List[Bookmark]:
-    """Search bookmarks using keyword pre-filtering + AI semantic search"""
-    if not bookmarks:
-        return []
-    
-    # Step 1: Pre-filter with keyword search to reduce context size
-    keyword_results = perform_keyword_search(query, bookmarks)
+def perform_local_search(
+    query: str, 
+    bookmarks: List[Bookmark], 
+    version_key: str, 
+    limit: int = SEARCH_CANDIDATE_LIMIT
+) -> List[tuple[int, float]]:
+    """
+    Rank bookmarks locally by blending semantic similarity with normalized BM25.
     
-    # If keyword search found very few results, use all bookmarks for AI
-    search_candidates = keyword_results if len(keyword_results) >= 5 else bookmarks
+    version_key identifies the indexes to use: the collection store's version
+    for stored collections, or request_version_key() for ad-hoc lists.
+    """
+    semantic_ranked = get_semantic_index(bookmarks, version_key).search(query, limit)
+    keyword_ranked = get_search_index(bookmarks, version_key).search(query, limit)
     
-    # If we have too many candidates, limit to top 100 to stay within token limits
-    if len(search_candidates) > 100:
-        search_candidates = search_candidates[:100]
-    
-    # Step 2: Use AI for semantic search on the filtered candidates
-    bookmark_data = [
-        {
-            "index": i,
-            "title": bookmark.title,
-            "url": bookmark.url,
-            "category": bookmark.category or "Uncategorized",
-            "description": bookmark.description or ""
-        }
-        for i, bookmark in enumerate(search_candidates)
-    ]
+    combined: Dict[int, float] = {}
+    for i, score in semantic_ranked:
+        combined[i] = SEMANTIC_SCORE_WEIGHT * score
+    if keyword_ranked:
+        top_keyword_score = keyword_ranked[0][1]
+        for i, score in keyword_ranked:
+            combined[i] = combined.get(i, 0.0) + KEYWORD_SCORE_WEIGHT * score / top_keyword_score
     
+    return sorted(combined.items(), key=lambda x: (-x[1], x[0]))[:limit]
+
+def is_local_ranking_ambiguous(ranked: List[tuple[int, float]]) -> bool:
+    """Local scores are ambiguous when nothing matches confidently"""
+    return not ranked or ranked[0][1] < LOCAL_SEARCH_MIN_SCORE
+
+async def rerank_with_ai(query: str, search_candidates: List[Bookmark], api_key: str, model: str) -> Optional[List[Bookmark]]:
+    """Ask the model to pick and order the most relevant candidates; None on failure"""
     search_prompt = f"""
 Given this user query: "{query}"
 
-Find the most relevant bookmarks from this pre-filtered collection and return ONLY a JSON array of bookmark indices (numbers only):
+Find the most relevant bookmarks from this pre-filtered collection and return ONLY a JSON array of bookmark indices (numbers only). {format_description(SEARCH_FIELDS)}
 
-{json.dumps(bookmark_data, indent=2)}
+{encode_bookmarks(search_candidates, SEARCH_FIELDS)}
 
 Return format: [1, 5, 12, 23]
 Return the indices of the most relevant bookmarks, sorted by relevance (most relevant first).
 Consider semantic meaning, not just keyword matches.
-Limit results to 15 bookmarks maximum.
+Limit results to {SEARCH_RESULT_LIMIT} bookmarks maximum.
 """
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                },
-                json={
-                    "model": get_model_name(model),
-                    "messages": [
-                        {"role": "user", "content": search_prompt}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 500
-                }
-            )
+    try:
+        response = await post_chat_completion(api_key, {
+            "model": get_model_name(model),
+            "messages": [
+                {"role": "user", "content": search_prompt}
+            ],
+            "temperature": 0.3,
+            "max_tokens": 500
+        }, call_site="search")
+        
+        if response.status_code == 200:
+            data = response.json()
+            record_token_usage("search", data.get("usage"))
+            token_budgets.record(api_key, data.get("usage"))
+            content = data['choices'][0]['message']['content']
+            try:
+                indices = json.loads(content)
+                # Return bookmarks at specified indices from search candidates
+                return [search_candidates[i] for i in indices if 0 <= i < len(search_candidates)]
+            except (json.JSONDecodeError, IndexError, TypeError):
+                logger.warning(f"Failed to parse search results: {content}")
+                return None
+        else:
+            logger.error(f"Search API error: {response.status_code}")
+            return None
             
-            if response.status_code == 200:
-                data = response.json()
-                content = data['choices'][0]['message']['content']
-                try:
-                    indices = json.loads(content)
-                    # Return bookmarks at specified indices from search candidates
-                    return [search_candidates[i] for i in indices if 0 <= i < len(search_candidates)]
-                except (json.JSONDecodeError, IndexError, TypeError):
-                    logger.warning(f"Failed to parse search results: {content}")
-                    return []
-            else:
-                logger.error(f"Search API error: {response.status_code}")
-                return []
-                
-        except Exception as e:
-            logger.error(f"AI search failed: {str(e)}")
-            return []
+    except Exception as e:
+        logger.error(f"AI search failed: {str(e)}")
+        return None
 
-async def generate_bookmark_stats(bookmarks: List[Bookmark]) -> Dict[str, Any]:
-    """Generate statistics about bookmark collection"""
+async def search_bookmarks_with_ai(
+    query: str, 
+    bookmarks: List[Bookmark], 
+    api_key: str, 
+    model: str, 
+    version_key: str,
+    mode: str = "auto"
+) -> List[Bookmark]:
+    """
+    Search bookmarks with local hybrid ranking, reranking with AI only when needed.
+    
+    mode: "local" never calls the model, "ai" always reranks with the model,
+    "auto" reranks only when local scores are ambiguous.
+    """
     if not bookmarks:
-        return {
-            "total": 0,
-            "categories": {},
-            "domains": {},
-            "duplicates": 0
-        }
+        return []
     
-    # Count categories
-    categories = {}
-    domains = {}
+    # Step 1: Rank locally (semantic vectors + BM25 keyword index)
+    ranked = perform_local_search(query, bookmarks, version_key)
+    local_results = [bookmarks[i] for i, score in ranked[:SEARCH_RESULT_LIMIT]]
     
-    for bookmark in bookmarks:
-        # Category stats
-        category = bookmark.category or "Uncategorized"
-        categories[category] = categories.get(category, 0) + 1
-        
-        # Domain stats
-        try:
-            domain = urlparse(bookmark.url).netloc.lower()
-            domains[domain] = domains.get(domain, 0) + 1
-        except:
-            pass
-    
-    # Find duplicates
-    urls_seen = set()
-    duplicates = 0
-    for bookmark in bookmarks:
-        url = bookmark.url.lower().strip('/')
-        if url in urls_seen:
-            duplicates += 1
-        urls_seen.add(url)
-    
-    # Sort by count
-    top_categories = sorted(categories.items(), key=lambda x: x[1], reverse=True)[:10]
-    top_domains = sorted(domains.items(), key=lambda x: x[1], reverse=True)[:10]
+    if mode == "local" or (mode == "auto" and not is_local_ranking_ambiguous(ranked)):
+        logger.info(f"Local search answered '{query}' with {len(local_results)} results")
+        return local_results
     
-    return {
-        "total": len(bookmarks),
-        "categories": dict(top_categories),
-        "domains": dict(top_domains),
-        "duplicates": duplicates,
-        "unique_domains": len(domains),
-        "unique_categories": len(categories)
-    }
+    # Step 2: Use AI to rerank the local candidates
+    # If local search found very few results, let the AI look at the first bookmarks as well
+    if len(ranked) >= 5:
+        search_candidates = [bookmarks[i] for i, score in ranked]
+    else:
+        search_candidates = bookmarks[:SEARCH_CANDIDATE_LIMIT]
+    
+    logger.info(f"Reranking {len(search_candidates)} candidates for '{query}' with AI (mode={mode})")
+    reranked = await rerank_with_ai(query, search_candidates, api_key, model)
+    return reranked if reranked is not None else local_results
+
+async def generate_bookmark_stats(bookmarks: List[Bookmark], stats: Optional[CollectionStats] = None) -> Dict[str, Any]:
+    """Generate statistics about bookmark collection, from a stored collection's analytics when given"""
+    if stats is None:
+        stats = CollectionStats(bookmarks)
+    return stats.summary()
 
 def get_model_name(selected_model: str) -> str:
     """Map UI model names to actual OpenAI API model names"""
@@ -330,10 +546,27 @@ def get_model_name(selected_model: str) -> str:
     }
     return model_map.get(selected_model, 'gpt-4o-mini')
 
+def resolve_bookmarks(bookmarks: Optional[List[Bookmark]], collection_id: Optional[str]) -> tuple[List[Bookmark], Optional[str]]:
+    """Return the bookmarks for a request and, for stored collections, their version key"""
+    if collection_id:
+        try:
+            return collection_store.snapshot(collection_id)
+        except CollectionNotFoundError:
+            raise HTTPException(status_code=404, detail="Collection not found")
+    return bookmarks or [], None
+
+def request_version_key(bookmarks: List[Bookmark], version_key: Optional[str]) -> str:
+    """
+    The index key for a request's bookmarks. Stored collections have one
+    already; an ad-hoc list has to be fingerprinted, which reads the whole
+    list, so callers compute it once per request and pass it along.
+    """
+    return version_key or collection_fingerprint(bookmarks)
+
 # Advanced utility functions
-def estimate_token_count(text: str) -> int:
+def estimate_token_count(text: str, model: str = "gpt-4o-mini") -> int:
     """Estimate token count for a text string"""
-    return math.ceil(len(text) / 4)
+    return count_tokens(text, model)
 
 def get_panda_progress_message(start: int, end: int, total: int) -> str:
     """Get engaging progress messages with personality"""
@@ -349,73 +582,36 @@ def get_panda_progress_message(start: int, end: int, total: int) -> str:
     ]
     return messages[hash(f"{start}-{end}") % len(messages)]
 
-def find_duplicate_bookmarks(bookmarks: List[Bookmark]) -> tuple[List[Dict[str, int]], DuplicateStats]:
-    """Find duplicate bookmarks and generate statistics"""
-    url_map = {}
-    duplicates = []
-    
-    for index, bookmark in enumerate(bookmarks):
-        # Normalize URL
-        normalized_url = bookmark.url.lower().rstrip('/')
-        
-        if normalized_url in url_map:
-            duplicates.append({
-                "originalIndex": url_map[normalized_url],
-                "duplicateIndex": index
-            })
-        else:
-            url_map[normalized_url] = index
-    
-    # Calculate duplicate statistics
-    url_counts = {}
-    for bookmark in bookmarks:
-        normalized_url = bookmark.url.lower().rstrip('/')
-        url_counts[normalized_url] = url_counts.get(normalized_url, 0) + 1
-    
-    unique_urls = len(url_counts)
-    urls_with_duplicates = sum(1 for count in url_counts.values() if count > 1)
-    
-    # Find most duplicated URLs
-    most_duplicated = sorted(
-        [(url, count) for url, count in url_counts.items() if count > 1],
-        key=lambda x: x[1],
-        reverse=True
-    )[:5]
-    
-    most_duplicated_urls = [
-        {
-            "url": url,
-            "count": count,
-            "indices": [i for i, b in enumerate(bookmarks) if b.url.lower().rstrip('/') == url]
-        }
-        for url, count in most_duplicated
-    ]
-    
-    stats = DuplicateStats(
-        uniqueUrls=unique_urls,
-        urlsWithDuplicates=urls_with_duplicates,
-        totalDuplicateReferences=len(duplicates),
-        mostDuplicatedUrls=most_duplicated_urls
+def build_duplicate_stats(report: DedupeReport, top: int = 5) -> DuplicateStats:
+    """Summarize a dedupe report for progress updates and the duplicates endpoint"""
+    return DuplicateStats(
+        uniqueUrls=len(report.exact_groups),
+        urlsWithDuplicates=sum(1 for indices in report.exact_groups.values() if len(indices) > 1),
+        totalDuplicateReferences=sum(len(indices) - 1 for indices in report.exact_groups.values()),
+        mostDuplicatedUrls=report.duplicate_groups(limit=top),
+        nearDuplicateGroups=len(report.near_groups),
+        nearDuplicateBookmarks=sum(len(group["indices"]) for group in report.near_groups),
+        topNearDuplicates=report.near_groups[:top]
     )
-    
-    return duplicates, stats
+
+def find_duplicate_bookmarks(
+    bookmarks: List[Bookmark],
+    canonicalizer: Optional[URLCanonicalizer] = None
+) -> tuple[List[Dict[str, int]], DuplicateStats]:
+    """Find duplicate bookmarks by canonical URL, plus near duplicates, and generate statistics"""
+    report = find_duplicates(bookmarks, canonicalizer)
+    return report.duplicate_pairs(), build_duplicate_stats(report)
+
+# Bookmark fields sent to the model for categorization and for search reranking
+CATEGORIZATION_FIELDS = ("title", "url", "folder")
+SEARCH_FIELDS = ("title", "url", "category", "description")
 
 def create_categorization_prompt(bookmarks: List[Bookmark], depth: str) -> str:
     """Create sophisticated categorization prompt matching aiService quality"""
-    bookmark_data = [
-        {
-            "index": i,
-            "title": bookmark.title,
-            "url": bookmark.url,
-            "folder": bookmark.folder or "Uncategorized"
-        }
-        for i, bookmark in enumerate(bookmarks)
-    ]
-    
     return f"""
-Here are {len(bookmarks)} bookmarks to categorize:
+Here are {len(bookmarks)} bookmarks to categorize. {format_description(CATEGORIZATION_FIELDS)}
 
-{json.dumps(bookmark_data, indent=2)}
+{encode_bookmarks(bookmarks, CATEGORIZATION_FIELDS)}
 
 IMPORTANT INSTRUCTIONS:
 1. Analyze these bookmarks deeply to understand their content, purpose, and relationships
@@ -428,106 +624,81 @@ IMPORTANT INSTRUCTIONS:
 
 Return ONLY a valid JSON object with main categories and subcategories as shown in the system prompt."""
 
-def chunk_bookmarks(bookmarks: List[Bookmark], max_tokens: int = 20000) -> List[List[Bookmark]]:
-    """Create intelligent chunks of bookmarks for processing"""
+def plan_chunks(
+    bookmarks: List[Bookmark],
+    model: str = "gpt-4o-mini",
+    depth: str = "balanced",
+    taxonomy: Optional[Taxonomy] = None
+) -> tuple[List[List[Bookmark]], Dict[str, int]]:
+    """Pack bookmarks into as few prompts as fit the model's token budget, with the estimated token usage"""
+    if not bookmarks:
+        return [], {"chunks": 0, "promptTokens": 0, "completionTokens": 0}
+    
+    # Tokens every request spends regardless of its bookmarks
+    if taxonomy is not None:
+        fixed_prompts = [ASSIGNMENT_SYSTEM_PROMPT, create_assignment_prompt([], taxonomy)]
+    else:
+        fixed_prompts = [CATEGORIZATION_SYSTEM_PROMPT, create_categorization_prompt([], depth)]
+    fixed_tokens = chat_prompt_tokens(fixed_prompts, model)
+    budget = input_token_budget(model) - fixed_tokens
+    
+    # Entries are costed with index 0; allow one extra token for longer local indices
+    costs = [estimate_token_count(text, model) + 1 for text in bookmark_entry_texts(bookmarks, CATEGORIZATION_FIELDS)]
+    sizes = pack_chunks(costs, budget, max_items_per_response())
+    
     chunks = []
-    current_chunk = []
-    current_token_count = 0
-    
-    # Add buffer for system prompt and response
-    system_prompt_buffer = 3000
-    response_buffer = 16000
-    overhead_buffer = 5000
-    effective_max_tokens = max_tokens - system_prompt_buffer - response_buffer - overhead_buffer
-    
-    logger.info(f"Chunking bookmarks with effective max tokens: {effective_max_tokens}")
-    
-    # If total is small enough, use single chunk
-    estimated_total_tokens = estimate_token_count(json.dumps([b.dict() for b in bookmarks]))
-    if estimated_total_tokens <= effective_max_tokens:
-        logger.info(f"All {len(bookmarks)} bookmarks fit in a single chunk ({estimated_total_tokens} tokens)")
-        return [bookmarks]
-    
-    # For very large collections, use fixed chunk size
-    if len(bookmarks) > 1000 or estimated_total_tokens > 100000:
-        logger.warning(f"Very large bookmark set detected ({len(bookmarks)} bookmarks, ~{estimated_total_tokens} tokens). Using aggressive chunking.")
-        chunk_size = 75
-        for i in range(0, len(bookmarks), chunk_size):
-            chunks.append(bookmarks[i:i + chunk_size])
-        logger.info(f"Split {len(bookmarks)} bookmarks into {len(chunks)} fixed-size chunks")
-        return chunks
-    
-    # Normal chunking for medium-sized collections
-    for bookmark in bookmarks:
-        bookmark_text = f"{bookmark.title} {bookmark.url} {bookmark.folder or ''}"
-        bookmark_tokens = estimate_token_count(bookmark_text)
-        
-        if current_token_count + bookmark_tokens > effective_max_tokens and current_chunk:
-            chunks.append(current_chunk)
-            current_chunk = []
-            current_token_count = 0
-        
-        current_chunk.append(bookmark)
-        current_token_count += bookmark_tokens
-    
-    if current_chunk:
-        chunks.append(current_chunk)
-    
-    logger.info(f"Split {len(bookmarks)} bookmarks into {len(chunks)} chunks")
-    return chunks
+    start = 0
+    for size in sizes:
+        chunks.append(bookmarks[start:start + size])
+        start += size
+    
+    estimate = {
+        "chunks": len(chunks),
+        "promptTokens": sum(costs) + fixed_tokens * len(chunks),
+        "completionTokens": sum(estimate_completion_tokens(size) for size in sizes)
+    }
+    logger.info(
+        f"Split {len(bookmarks)} bookmarks (~{estimate['promptTokens']} prompt tokens) "
+        f"into {len(chunks)} chunks with a budget of {budget} tokens each"
+    )
+    return chunks, estimate
+
+def chunk_bookmarks(
+    bookmarks: List[Bookmark],
+    model: str = "gpt-4o-mini",
+    depth: str = "balanced",
+    taxonomy: Optional[Taxonomy] = None
+) -> List[List[Bookmark]]:
+    """Pack bookmarks into as few prompts as fit the model's token budget"""
+    return plan_chunks(bookmarks, model, depth, taxonomy)[0]
 
 def extract_json_from_response(text: str) -> Dict[str, Any]:
     """Extract JSON from AI response with multiple fallback strategies"""
+    # Try parsing entire text as JSON
     try:
-        # Try parsing entire text as JSON
+        result = json.loads(text)
+        if isinstance(result, dict):
+            return result
+    except json.JSONDecodeError:
+        logger.info("Response is not pure JSON, trying to extract JSON portion")
+    
+    # Try markdown code block
+    markdown_match = re.search(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', text)
+    if markdown_match:
         try:
-            result = json.loads(text)
-            logger.info("Successfully parsed entire response as JSON")
+            result = json.loads(markdown_match.group(1))
+            logger.info("Successfully extracted JSON from markdown code block")
             return result
         except json.JSONDecodeError:
-            logger.info("Response is not pure JSON, trying to extract JSON portion")
-        
-        # Look for JSON object pattern
-        json_pattern = r'\{[\s\S]*\}'
-        match = re.search(json_pattern, text)
-        
-        if match:
-            try:
-                result = json.loads(match.group(0))
-                logger.info("Successfully extracted JSON using pattern match")
-                return result
-            except json.JSONDecodeError:
-                logger.warning("Failed to parse extracted JSON pattern")
-        
-        # Try markdown code block
-        markdown_pattern = r'```(?:json)?\s*(\{[\s\S]*?\})\s*```'
-        markdown_match = re.search(markdown_pattern, text)
-        
-        if markdown_match:
-            try:
-                result = json.loads(markdown_match.group(1))
-                logger.info("Successfully extracted JSON from markdown code block")
-                return result
-            except json.JSONDecodeError:
-                logger.warning("Failed to parse markdown JSON")
-        
-        # Fallback categorization
-        logger.warning("Using fallback categorization with 'All Bookmarks' category")
-        return {
-            "All Bookmarks": {
-                "bookmarks": list(range(1000)),  # Large range to cover most cases
-                "subcategories": {}
-            }
-        }
-        
-    except Exception as e:
-        logger.error(f"JSON extraction failed: {e}")
-        return {
-            "All Bookmarks": {
-                "bookmarks": list(range(1000)),
-                "subcategories": {}
-            }
-        }
+            logger.warning("Failed to parse markdown JSON")
+    
+    # Keep whatever complete entries a damaged or truncated object has
+    result = parse_partial_object(text)
+    if result:
+        logger.warning(f"Recovered {len(result)} complete entries from a malformed response")
+    else:
+        logger.warning("No JSON object found in response")
+    return result
 
 # System prompt for hierarchical categorization
 CATEGORIZATION_SYSTEM_PROMPT = """
@@ -580,70 +751,310 @@ CATEGORIZATION STRATEGY:
 7. Review and refine the structure for balance and usability
 """
 
+def validate_category_entry(key: str, value: Any) -> None:
+    """Reject entries that cannot be a category (the model has gone off the rails)"""
+    if not isinstance(value, (dict, list)):
+        raise MalformedResponseError(f"Category {key!r} has a {type(value).__name__} value")
+
+async def stream_categorization_json(
+    payload: Dict[str, Any],
+    api_key: str,
+    estimated_prompt_tokens: int,
+    call_site: str = "categorization",
+    budget: Optional[JobBudget] = None
+) -> Dict[str, Any]:
+    """Stream a completion, parsing category entries as they arrive and aborting on malformed output"""
+    parser = IncrementalJSONParser()
+    result: Dict[str, Any] = {}
+    async with stream_chat_completion(api_key, payload, call_site=call_site) as response:
+        if response.status_code != 200:
+            body = (await response.aread()).decode("utf-8", "replace")
+            logger.error(f"OpenAI API error: {response.status_code} - {body}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"OpenAI API error: {body}",
+                headers=retry_after_headers(response.headers)
+            )
+        
+        try:
+            async for delta, _, usage in iter_completion_deltas(response):
+                if usage:
+                    record_prompt_usage(estimated_prompt_tokens, usage)
+                    record_token_usage(call_site, usage)
+                    token_budgets.record(api_key, usage, budget)
+                for key, value in parser.feed(delta):
+                    validate_category_entry(key, value)
+                    result[key] = value
+            parser.close()
+        except MalformedResponseError as e:
+            # Keep the entries the parser completed in the same delta before the error
+            for key, value in parser.drain():
+                if isinstance(value, (dict, list)):
+                    result.setdefault(key, value)
+            # Leaving the stream closes the connection, so the rest is never generated
+            e.partial = result
+            raise
+    return result
+
+async def complete_categorization_json(
+    payload: Dict[str, Any],
+    api_key: str,
+    estimated_prompt_tokens: int,
+    call_site: str = "categorization",
+    budget: Optional[JobBudget] = None
+) -> Dict[str, Any]:
+    """Non-streaming variant: wait for the whole completion, then parse it"""
+    response = await post_chat_completion(api_key, payload, call_site=call_site)
+    if response.status_code != 200:
+        logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
+        raise HTTPException(
+            status_code=response.status_code, 
+            detail=f"OpenAI API error: {response.text}",
+            headers=retry_after_headers(response.headers)
+        )
+    
+    data = response.json()
+    choice = data['choices'][0]
+    record_prompt_usage(estimated_prompt_tokens, data.get("usage"))
+    record_token_usage(call_site, data.get("usage"))
+    token_budgets.record(api_key, data.get("usage"), budget)
+    
+    categorization = extract_json_from_response(choice['message']['content'] or "")
+    if choice.get("finish_reason") == "length":
+        raise TruncatedResponseError("Response hit the token limit", categorization)
+    if not categorization:
+        raise MalformedResponseError("No JSON object in response")
+    for key, value in categorization.items():
+        validate_category_entry(key, value)
+    return categorization
+
+async def request_categorization_json(
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    model: str,
+    retry_stats: Optional[RetryStats] = None,
+    call_site: str = "categorization",
+    budget: Optional[JobBudget] = None
+) -> Dict[str, Any]:
+    """
+    Send one categorization-style prompt to OpenAI and return the JSON object it answers with.
+    
+    Transient failures are retried with backoff and a malformed answer is
+    retried once. A truncated or still-malformed answer raises
+    MalformedResponseError (carrying the complete entries) so the caller
+    can split the chunk. Calls are throttled to the API key's token rate,
+    and BudgetExceededError is raised once the job's budget is used up.
+    """
+    model_name = get_model_name(model)
+    estimated_prompt_tokens = chat_prompt_tokens([system_prompt, prompt], model_name)
+    payload = {
+        "model": model_name,
+        "messages": [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "temperature": 0.3,
+        "max_tokens": RESPONSE_MAX_TOKENS
+    }
+    request_completion = stream_categorization_json if OPENAI_STREAM_RESPONSES else complete_categorization_json
+    
+    attempt = 0
+    malformed_attempts = 0
+    while True:
+        attempt += 1
+        retry_after = None
+        if budget is not None:
+            budget.check()
+        await token_budgets.throttle(api_key, estimated_prompt_tokens)
+        try:
+            return await request_completion(payload, api_key, estimated_prompt_tokens, call_site, budget)
+        except TruncatedResponseError as e:
+            # The same prompt would overflow again
+            logger.warning(f"Truncated categorization response: {str(e)}")
+            raise
+        except MalformedResponseError as e:
+            malformed_attempts += 1
+            logger.warning(f"Malformed categorization response (attempt {malformed_attempts}/{MALFORMED_RESPONSE_ATTEMPTS}): {str(e)}")
+            if malformed_attempts >= MALFORMED_RESPONSE_ATTEMPTS:
+                raise
+            # A fresh sample usually parses; no need to wait
+            if retry_stats is not None:
+                retry_stats.retried += 1
+            OPENAI_RETRIES.inc(call_site=call_site, reason="malformed")
+            continue
+        except HTTPException as e:
+            if not is_retryable_status(e.status_code) or attempt >= RETRY_MAX_ATTEMPTS:
+                raise
+            retry_after = parse_retry_after(e.headers)
+            if retry_after is not None and retry_after > RETRY_AFTER_LIMIT_SECONDS:
+                raise
+            logger.warning(f"OpenAI API error {e.status_code} (attempt {attempt}/{RETRY_MAX_ATTEMPTS}), retrying")
+            retry_reason = str(e.status_code)
+        except httpx.TimeoutException:
+            if attempt >= RETRY_MAX_ATTEMPTS:
+                logger.error("Request timeout")
+                raise HTTPException(status_code=408, detail="Request timeout")
+            logger.warning(f"Request timeout (attempt {attempt}/{RETRY_MAX_ATTEMPTS}), retrying")
+            retry_reason = "timeout"
+        except httpx.TransportError as e:
+            if attempt >= RETRY_MAX_ATTEMPTS:
+                logger.error(f"Connection error: {str(e)}")
+                raise HTTPException(status_code=503, detail=f"Connection error: {str(e)}")
+            logger.warning(f"Connection error (attempt {attempt}/{RETRY_MAX_ATTEMPTS}), retrying: {str(e)}")
+            retry_reason = "connection_error"
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+        
+        if retry_stats is not None:
+            retry_stats.retried += 1
+        OPENAI_RETRIES.inc(call_site=call_site, reason=retry_reason)
+        await asyncio.sleep(backoff_delay(attempt, retry_after))
+
 async def process_batch_with_ai(
     bookmarks: List[Bookmark], 
     api_key: str, 
     model: str, 
-    depth: str
+    depth: str,
+    retry_stats: Optional[RetryStats] = None,
+    budget: Optional[JobBudget] = None
 ) -> Dict[str, Any]:
     """Process a single batch of bookmarks with OpenAI API"""
     prompt = create_categorization_prompt(bookmarks, depth)
+    return await request_categorization_json(CATEGORIZATION_SYSTEM_PROMPT, prompt, api_key, model, retry_stats, budget=budget)
+
+def create_fitted_taxonomy_prompt(
+    bookmarks: List[Bookmark],
+    model_name: str,
+    depth: str,
+    existing_categories: List[str]
+) -> tuple[str, int]:
+    """The taxonomy prompt for a representative sample cut to one request's budget, and the sample size"""
+    sample = [bookmarks[i] for i in select_taxonomy_sample(bookmarks)]
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                },
-                json={
-                    "model": get_model_name(model),
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": CATEGORIZATION_SYSTEM_PROMPT
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 4000
-                }
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
-                raise HTTPException(
-                    status_code=response.status_code, 
-                    detail=f"OpenAI API error: {response.text}"
-                )
-            
-            data = response.json()
-            content = data['choices'][0]['message']['content']
-            
-            # Extract and validate response
-            categorization = extract_json_from_response(content)
-            
-            if not categorization:
-                logger.error("Failed to extract categorization from AI response")
-                raise HTTPException(status_code=500, detail="Failed to extract categorization from AI response")
-            
-            return categorization
-                
-        except httpx.TimeoutException:
-            logger.error("Request timeout")
-            raise HTTPException(status_code=408, detail="Request timeout")
-        except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+    fixed_tokens = chat_prompt_tokens(
+        [TAXONOMY_SYSTEM_PROMPT, create_taxonomy_prompt([], len(bookmarks), depth, existing_categories)], model_name
+    )
+    costs = [estimate_token_count(text, model_name) + 1 for text in bookmark_entry_texts(sample, TAXONOMY_FIELDS)]
+    sample = sample[:pack_chunks(costs, input_token_budget(model_name) - fixed_tokens, len(sample))[0]]
+    return create_taxonomy_prompt(sample, len(bookmarks), depth, existing_categories), len(sample)
+
+async def derive_taxonomy(
+    bookmarks: List[Bookmark],
+    api_key: str,
+    model: str,
+    depth: str,
+    existing_categories: List[str],
+    budget: Optional[JobBudget] = None
+) -> Taxonomy:
+    """Phase one of global mode: design one category list from a representative sample"""
+    prompt, sample_size = create_fitted_taxonomy_prompt(bookmarks, get_model_name(model), depth, existing_categories)
+    response = await request_categorization_json(
+        TAXONOMY_SYSTEM_PROMPT, prompt, api_key, model, call_site="taxonomy", budget=budget
+    )
+    taxonomy = parse_taxonomy(response)
+    if taxonomy is None:
+        raise ValueError("Model returned no usable taxonomy")
+    logger.info(f"Derived a taxonomy of {len(taxonomy)} categories from {sample_size} sample bookmarks")
+    return taxonomy
+
+async def assign_batch_with_taxonomy(
+    bookmarks: List[Bookmark],
+    taxonomy: Taxonomy,
+    api_key: str,
+    model: str,
+    retry_stats: Optional[RetryStats] = None,
+    budget: Optional[JobBudget] = None
+) -> Dict[str, Any]:
+    """Phase two of global mode: assign a chunk against the fixed category list"""
+    prompt = create_assignment_prompt(bookmarks, taxonomy)
+    try:
+        assignment = await request_categorization_json(
+            ASSIGNMENT_SYSTEM_PROMPT, prompt, api_key, model, retry_stats, budget=budget
+        )
+    except MalformedResponseError as e:
+        e.partial = taxonomy.to_batch_result(e.partial)
+        raise
+    return taxonomy.to_batch_result(assignment)
+
+def categorization_cache_depth(depth: str, taxonomy_mode: str) -> str:
+    """Global-taxonomy results are cached (and learned from) apart from per-chunk ones"""
+    return f"{depth}:global" if taxonomy_mode == "global" else depth
+
+async def lookup_cached_categories(
+    bookmarks: List[Bookmark],
+    model_name: str,
+    cache_depth: str,
+    peek: bool = False
+) -> tuple[List[str], Dict[str, str]]:
+    """Cache keys for the bookmarks and the categories cached under them"""
+    cache_keys = [make_cache_key(b.title, b.url, b.folder, model_name, cache_depth) for b in bookmarks]
+    try:
+        cached = await asyncio.to_thread(get_categorization_cache().get_many, cache_keys, peek)
+    except Exception as e:
+        logger.warning(f"Categorization cache lookup failed: {str(e)}")
+        cached = {}
+    return cache_keys, cached
+
+async def estimate_reorganization(
+    bookmarks: List[Bookmark],
+    model: str,
+    depth: str,
+    taxonomy_mode: str,
+    use_cache: bool
+) -> Dict[str, Any]:
+    """
+    Pre-flight token estimate from the chunk plan of the bookmarks the cache
+    cannot answer. Bookmarks the local classifier may resolve are still
+    counted, so this is an upper bound.
+    """
+    model_name = get_model_name(model)
+    pending = bookmarks
+    if use_cache:
+        cache_keys, cached = await lookup_cached_categories(
+            bookmarks, model_name, categorization_cache_depth(depth, taxonomy_mode), peek=True
+        )
+        pending = [b for b, key in zip(bookmarks, cache_keys) if key not in cached]
+    
+    _, plan = await asyncio.to_thread(plan_chunks, pending, model_name, depth)
+    prompt_tokens, completion_tokens = plan["promptTokens"], plan["completionTokens"]
+    if taxonomy_mode == "global" and pending:
+        # Plus the one call that designs the taxonomy
+        taxonomy_prompt, _ = await asyncio.to_thread(create_fitted_taxonomy_prompt, pending, model_name, depth, [])
+        prompt_tokens += chat_prompt_tokens([TAXONOMY_SYSTEM_PROMPT, taxonomy_prompt], model_name)
+        completion_tokens += OUTPUT_OVERHEAD_TOKENS
+    
+    return {
+        "bookmarks": len(bookmarks),
+        "cachedBookmarks": len(bookmarks) - len(pending),
+        "chunks": plan["chunks"],
+        "promptTokens": prompt_tokens,
+        "completionTokens": completion_tokens,
+        "totalTokens": prompt_tokens + completion_tokens,
+        "estimatedCostUsd": estimate_cost_usd(model_name, prompt_tokens, completion_tokens),
+        "model": model_name
+    }
+
+def assignment_records(bookmarks: List[Bookmark], merger: CategoryMerger, indices: Sequence[int]) -> List[Dict[str, Any]]:
+    """Streamable bookmark -> category records for assigned bookmarks"""
+    return [
+        {"type": "bookmark", "index": i, "id": bookmarks[i].id, "category": merger.assignments[i]}
+        for i in indices if merger.assignments[i] is not None
+    ]
 
 async def reorganize_bookmarks_background(request: ReorganizeRequest):
     """Background task to reorganize bookmarks with progress tracking"""
     session_id = request.sessionId
     bookmarks = request.bookmarks
+    job_started = time.perf_counter()
+    budget = JobBudget(token_budgets, request.apiKey, session_id)
     
     try:
         # Add IDs to bookmarks if missing
@@ -652,10 +1063,10 @@ async def reorganize_bookmarks_background(request: ReorganizeRequest):
                 bookmark.id = str(uuid.uuid4())
         
         # Find duplicates and calculate stats
-        duplicates, duplicate_stats = find_duplicate_bookmarks(bookmarks)
+        duplicates, duplicate_stats = await asyncio.to_thread(find_duplicate_bookmarks, bookmarks)
         
         # Initialize progress with duplicate detection results
-        progress_store[session_id] = ProgressUpdate(
+        set_progress(session_id, ProgressUpdate(
             sessionId=session_id,
             progress=10.0,
             status="processing",
@@ -666,126 +1077,418 @@ async def reorganize_bookmarks_background(request: ReorganizeRequest):
             bookmarksProcessed=len(bookmarks),
             duplicatesFound=len(duplicates),
             duplicateStats=duplicate_stats
-        )
+        ))
+        
+        global_taxonomy = request.taxonomyMode == "global"
+        model_name = get_model_name(request.model)
+        cache_depth = categorization_cache_depth(request.categorizationDepth, request.taxonomyMode)
+        example_namespace = f"{model_name}:{cache_depth}"
+        
+        # Reuse cached categorizations so only changed bookmarks go to the model
+        cache_keys = []
+        cached_categories = {}
+        if request.useCache:
+            cache_keys, cached_categories = await lookup_cached_categories(bookmarks, model_name, cache_depth)
+        
+        if cached_categories:
+            miss_indices = [i for i, key in enumerate(cache_keys) if key not in cached_categories]
+        else:
+            miss_indices = list(range(len(bookmarks)))
+        cached_count = len(bookmarks) - len(miss_indices)
+        logger.info(f"Categorization cache: {cached_count} hits, {len(miss_indices)} misses")
+        
+        # Assign confident bookmarks locally and send only the rest to the model
+        local_categories: Dict[int, str] = {}
+        if request.useLocalClassifier and miss_indices:
+            try:
+                resolved, sources = await asyncio.to_thread(
+                    local_classifier.classify,
+                    [bookmarks[i] for i in miss_indices],
+                    example_namespace,
+                    request.categorizationDepth,
+                    get_categorization_cache()
+                )
+                local_categories = {miss_indices[position]: category for position, category in resolved.items()}
+                logger.info(
+                    f"Local classifier resolved {len(local_categories)} of {len(miss_indices)} bookmarks "
+                    f"({sources['neighbors']} by nearest neighbours, {sources['rules']} by domain rules)"
+                )
+            except Exception as e:
+                logger.warning(f"Local classification failed, sending all bookmarks to the model: {str(e)}")
+        if local_categories:
+            miss_indices = [i for i in miss_indices if i not in local_categories]
+        local_count = len(local_categories)
+        
+        # Pick up where an interrupted run of this job stopped
+        checkpoint_key = f"{collection_fingerprint(bookmarks)}:{len(bookmarks)}:{model_name}:{cache_depth}"
+        checkpoint = job_store.get_checkpoint(session_id)
+        if checkpoint is not None and checkpoint["state"].get("key") != checkpoint_key:
+            checkpoint = None
+        resumed_categories: Dict[int, str] = {}
+        if checkpoint is not None:
+            pending = set(miss_indices)
+            resumed_categories = {i: category for i, category in checkpoint["assignments"].items() if i in pending}
+            miss_indices = [i for i in miss_indices if i not in resumed_categories]
+            logger.info(f"Resuming from checkpoint with {len(resumed_categories)} bookmarks already categorized")
+        miss_bookmarks = [bookmarks[i] for i in miss_indices]
+        resumed_count = len(resumed_categories)
+        
+        # Global mode: design the category list once, then only assign against it
+        taxonomy = None
+        if checkpoint is not None and checkpoint["state"].get("taxonomy"):
+            taxonomy = Taxonomy(checkpoint["state"]["taxonomy"])
+        elif global_taxonomy and miss_bookmarks:
+            update_progress(session_id, message="🗂️ Designing a category structure for your whole collection...")
+            try:
+                taxonomy = await derive_taxonomy(
+                    miss_bookmarks,
+                    request.apiKey,
+                    request.model,
+                    request.categorizationDepth,
+                    [name for name, _ in Counter([*cached_categories.values(), *local_categories.values()]).most_common()],
+                    budget
+                )
+            except BudgetExceededError:
+                raise
+            except Exception as e:
+                logger.warning(f"Taxonomy derivation failed, categorizing chunks independently: {str(e)}")
+        
+        if checkpoint is None:
+            # Everything needed to resume except the API key; bookmarks as columns, a fraction of the size of dicts
+            job_store.save_checkpoint(session_id, {
+                "key": checkpoint_key,
+                "request": request.model_dump(exclude={"apiKey", "bookmarks"}),
+                "bookmarks": pack_bookmarks(bookmarks),
+                "taxonomy": taxonomy.to_tree() if taxonomy is not None else None
+            })
         
         # Create chunks for processing
-        chunks = chunk_bookmarks(bookmarks)
+        chunks, plan = await asyncio.to_thread(plan_chunks, miss_bookmarks, model_name, request.categorizationDepth, taxonomy)
         total_batches = len(chunks)
+        remaining_tokens = plan["promptTokens"] + plan["completionTokens"]
+        # Including the taxonomy call, if one was made
+        estimated_tokens = budget.used + remaining_tokens
+        
+        async def announce_wait(pending_tokens: int) -> None:
+            update_progress(
+                session_id,
+                status="queued",
+                message=f"⏳ Waiting for other reorganizations on this API key (~{pending_tokens} tokens still to go)..."
+            )
+        
+        # Hold the job while earlier jobs on the same API key use up its pending-token limit
+        await token_budgets.admit(budget, remaining_tokens, announce_wait)
+        
+        update_progress(
+            session_id,
+            status="processing",
+            estimatedTokens=estimated_tokens,
+            totalBatches=total_batches,
+            cachedBookmarks=cached_count,
+            localBookmarks=local_count,
+            resumedBookmarks=resumed_count,
+            message=f"🧠 Training AI on your bookmark collection...",
+            progress=15.0
+        )
+        
+        merger = CategoryMerger([len(chunk) for chunk in chunks], total=len(bookmarks), index_map=miss_indices)
+        for i, key in enumerate(cache_keys):
+            if key in cached_categories:
+                merger.assign(i, cached_categories[key])
+        for i, category in [*local_categories.items(), *resumed_categories.items()]:
+            merger.assign(i, category)
+        # Clients subscribing from now on start from every assignment made so far
+        result_streams.register(session_id, lambda: assignment_records(bookmarks, merger, range(len(bookmarks))))
         
-        progress_store[session_id].totalBatches = total_batches
-        progress_store[session_id].message = f"🧠 Training AI on your bookmark collection..."
-        progress_store[session_id].progress = 15.0
+        # Cached, local and resumed assignments are final and can be streamed right away
+        if cached_count or local_count or resumed_count:
+            result_streams.append(session_id, assignment_records(
+                bookmarks,
+                merger,
+                [i for i, key in enumerate(cache_keys) if key in cached_categories] + sorted(local_categories) + sorted(resumed_categories)
+            ))
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        retry_stats = RetryStats()
         
-        categorized_results = {}
+        def merge_part(positions: List[int], batch_result: Dict[str, Any]) -> None:
+            """Merge a part's result, stream it and checkpoint it"""
+            merger.merge_positions(positions, batch_result)
+            indices = [merger.to_global(p) for p in positions]
+            result_streams.append(session_id, assignment_records(bookmarks, merger, indices))
+            job_store.append_checkpoint(session_id, {i: merger.assignments[i] for i in indices if merger.assignments[i] is not None})
         
-        # Process chunks
-        for i, chunk in enumerate(chunks):
+        async def categorize_part(chunk_number: int, positions: List[int]) -> None:
+            """
+            Categorize part of a chunk and merge the result. A truncated or
+            unparseable answer keeps its complete entries and the rest is split
+            in half and retried, down to MIN_SPLIT_CHUNK_SIZE bookmarks.
+            """
             try:
-                logger.info(f"Processing chunk {i+1}/{total_batches} with {len(chunk)} bookmarks")
-                
-                # Update progress with engaging message
-                chunk_start = i * len(chunk) + 1
-                chunk_end = min((i + 1) * len(chunk), len(bookmarks))
-                panda_message = get_panda_progress_message(chunk_start, chunk_end, len(bookmarks))
-                
-                progress_store[session_id].message = panda_message
-                progress_store[session_id].progress = 20.0 + (i / total_batches) * 60.0
-                progress_store[session_id].completedBatches = i
+                async with semaphore:
+                    logger.info(f"Processing chunk {chunk_number}/{total_batches} with {len(positions)} bookmarks")
+                    update_progress(session_id, message=get_panda_progress_message(positions[0] + 1, positions[-1] + 1, len(miss_bookmarks)))
+                    
+                    part = [miss_bookmarks[p] for p in positions]
+                    if taxonomy is not None:
+                        batch_result = await assign_batch_with_taxonomy(
+                            part, taxonomy, request.apiKey, request.model, retry_stats, budget
+                        )
+                    else:
+                        batch_result = await process_batch_with_ai(
+                            part, 
+                            request.apiKey, 
+                            request.model, 
+                            request.categorizationDepth,
+                            retry_stats,
+                            budget
+                        )
+            except MalformedResponseError as e:
+                if e.partial:
+                    merge_part(positions, e.partial)
+                remaining = [p for p in positions if merger.assignments[merger.to_global(p)] is None]
+                if not remaining:
+                    return
+                if len(remaining) < MIN_SPLIT_CHUNK_SIZE:
+                    raise
                 
-                # Process batch with AI
-                batch_result = await process_batch_with_ai(
-                    chunk, 
-                    request.apiKey, 
-                    request.model, 
-                    request.categorizationDepth
+                retry_stats.split += 1
+                CHUNK_SPLITS.inc()
+                half = len(remaining) // 2
+                logger.info(f"Splitting {len(remaining)} bookmarks of chunk {chunk_number} in half after: {str(e)}")
+                results = await asyncio.gather(
+                    categorize_part(chunk_number, remaining[:half]),
+                    categorize_part(chunk_number, remaining[half:]),
+                    return_exceptions=True
                 )
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+                return
+            
+            merge_part(positions, batch_result)
+        
+        chunk_mode = "global" if taxonomy is not None else "chunked"
+        
+        async def process_chunk(i: int):
+            """Run one chunk, returning (index, error)"""
+            started = time.perf_counter()
+            try:
+                await categorize_part(i + 1, merger.chunk_positions(i))
+                CHUNK_SECONDS.observe(time.perf_counter() - started, mode=chunk_mode, outcome="ok")
+                return i, None
+            except Exception as e:
+                CHUNK_SECONDS.observe(time.perf_counter() - started, mode=chunk_mode, outcome="failed")
+                return i, e
+        
+        # Process chunks in parallel, merging results as they complete
+        tasks = [asyncio.create_task(process_chunk(i)) for i in range(len(chunks))]
+        completed_batches = 0
+        
+        try:
+            for next_completed in asyncio.as_completed(tasks):
+                i, error = await next_completed
+                completed_batches += 1
                 
-                # Merge results - adjust indices for chunk offset
-                chunk_offset = sum(len(chunks[j]) for j in range(i))
-                for category_name, category_data in batch_result.items():
-                    if category_name not in categorized_results:
-                        categorized_results[category_name] = {
-                            "bookmarks": [],
-                            "subcategories": {}
-                        }
-                    
-                    # Adjust main category bookmarks
-                    if "bookmarks" in category_data:
-                        adjusted_bookmarks = [idx + chunk_offset for idx in category_data["bookmarks"] 
-                                            if idx + chunk_offset < len(bookmarks)]
-                        categorized_results[category_name]["bookmarks"].extend(adjusted_bookmarks)
-                    
-                    # Adjust subcategory bookmarks
-                    if "subcategories" in category_data:
-                        for sub_name, sub_indices in category_data["subcategories"].items():
-                            if sub_name not in categorized_results[category_name]["subcategories"]:
-                                categorized_results[category_name]["subcategories"][sub_name] = []
-                            
-                            adjusted_sub_bookmarks = [idx + chunk_offset for idx in sub_indices 
-                                                    if idx + chunk_offset < len(bookmarks)]
-                            categorized_results[category_name]["subcategories"][sub_name].extend(adjusted_sub_bookmarks)
+                if isinstance(error, BudgetExceededError):
+                    # Finished chunks stay checkpointed; the job can be resumed with a larger budget
+                    raise error
+                if error is not None:
+                    retry_stats.failed += 1
+                    logger.error(f"Error processing chunk {i+1}: {str(error)}")
                 
-                # Add delay between batches
-                if i < total_batches - 1:
-                    await asyncio.sleep(REQUEST_DELAY)
-                    
-            except Exception as e:
-                logger.error(f"Error processing chunk {i+1}: {str(e)}")
-                # Continue with remaining chunks
+                update_progress(
+                    session_id,
+                    completedBatches=completed_batches,
+                    progress=20.0 + (completed_batches / total_batches) * 60.0,
+                    retriedChunks=retry_stats.retried,
+                    splitChunks=retry_stats.split,
+                    failedChunks=retry_stats.failed,
+                    usedTokens=budget.used
+                )
+        finally:
+            # Stop outstanding chunk requests if the merge loop is interrupted
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        
+        if retry_stats.retried or retry_stats.split or retry_stats.failed:
+            logger.info(f"Chunk recovery: {retry_stats.retried} retried calls, {retry_stats.split} splits, {retry_stats.failed} failed chunks")
+        if merger.conflicts or merger.invalid_indices:
+            logger.info(f"Resolved {merger.conflicts} conflicting and dropped {merger.invalid_indices} invalid category assignments")
+        unassigned = merger.unassigned_indices()
+        if unassigned:
+            logger.warning(f"{len(unassigned)} bookmarks were not assigned a category and remain Uncategorized")
         
         # Convert to final bookmark structure
         final_bookmarks = []
         for bookmark_idx, bookmark in enumerate(bookmarks):
-            # Find which category this bookmark belongs to
-            assigned_category = "Uncategorized"
-            
-            for category_name, category_data in categorized_results.items():
-                # Check main category
-                if bookmark_idx in category_data.get("bookmarks", []):
-                    assigned_category = category_name
-                    break
-                
-                # Check subcategories
-                for sub_name, sub_indices in category_data.get("subcategories", {}).items():
-                    if bookmark_idx in sub_indices:
-                        assigned_category = f"{category_name} / {sub_name}"
-                        break
-                
-                if assigned_category != "Uncategorized":
-                    break
-            
-            # Update bookmark with new category
-            bookmark.category = assigned_category
+            bookmark.category = merger.category_for(bookmark_idx)
             final_bookmarks.append(bookmark)
         
+        # Remember newly categorized bookmarks for future runs; only model answers train the local classifier
+        if request.useCache:
+            categorized = [
+                i for i in sorted(resumed_categories) + miss_indices
+                if merger.assignments[i] and merger.assignments[i] != UNCATEGORIZED
+            ]
+            new_entries = [(cache_keys[i], merger.assignments[i]) for i in categorized]
+            examples = [
+                (cache_keys[i], bookmarks[i].title, bookmarks[i].url, bookmarks[i].folder, merger.assignments[i])
+                for i in categorized
+            ]
+            try:
+                await asyncio.to_thread(get_categorization_cache().put_many, new_entries)
+                await asyncio.to_thread(get_categorization_cache().put_examples, example_namespace, examples)
+            except Exception as e:
+                logger.warning(f"Categorization cache update failed: {str(e)}")
+        
+        # Store the result before announcing completion
+        job_store.save_result(session_id, final_bookmarks)
+        job_store.delete_checkpoint(session_id)
+        result_streams.append(session_id, [
+            {"type": "bookmark", "index": i, "id": bookmarks[i].id, "category": UNCATEGORIZED}
+            for i in unassigned
+        ])
+        result_streams.finish(session_id, {
+            "type": "summary",
+            "total": len(final_bookmarks),
+            "categories": merger.category_counts,
+            "uncategorized": len(unassigned),
+            "cached": cached_count,
+            "local": local_count,
+            "resumed": resumed_count,
+            "tokens": budget.used,
+            **retry_stats.as_dict()
+        })
+        
+        for source, count in (("cache", cached_count), ("local", local_count), ("resumed", resumed_count), ("model", len(miss_indices))):
+            if count:
+                BOOKMARKS_CATEGORIZED.inc(count, source=source)
+        JOB_SECONDS.observe(time.perf_counter() - job_started, status="completed")
+        
         # Mark as completed
-        progress_store[session_id] = ProgressUpdate(
+        set_progress(session_id, ProgressUpdate(
             sessionId=session_id,
             progress=100.0,
             status="completed",
-            message=f"🎨 Successfully reorganized {len(final_bookmarks)} bookmarks into {len(categorized_results)} categories!",
+            message=f"🎨 Successfully reorganized {len(final_bookmarks)} bookmarks into {len(merger.main_categories)} categories!",
             completedBatches=total_batches,
             totalBatches=total_batches,
+            cachedBookmarks=cached_count,
+            localBookmarks=local_count,
+            resumedBookmarks=resumed_count,
+            retriedChunks=retry_stats.retried,
+            splitChunks=retry_stats.split,
+            failedChunks=retry_stats.failed,
+            estimatedTokens=estimated_tokens,
+            usedTokens=budget.used,
             duplicateStats=duplicate_stats
-        )
-        
-        # Store the result
-        progress_store[f"{session_id}_result"] = final_bookmarks
+        ))
         
+    except asyncio.CancelledError:
+        logger.info(f"Reorganization {session_id} cancelled")
+        JOB_SECONDS.observe(time.perf_counter() - job_started, status="cancelled")
+        result_streams.finish(session_id, {"type": "cancelled", "message": "Reorganization cancelled"})
+        update_progress(
+            session_id,
+            status="cancelled",
+            message="🛑 Reorganization cancelled. Finished chunks were saved, so it can be resumed."
+        )
+        raise
     except Exception as e:
         logger.error(f"Fatal error in reorganization: {str(e)}")
-        progress_store[session_id] = ProgressUpdate(
+        JOB_SECONDS.observe(time.perf_counter() - job_started, status="error")
+        result_streams.finish(session_id, {"type": "error", "message": str(e)})
+        set_progress(session_id, ProgressUpdate(
             sessionId=session_id,
             progress=0.0,
             status="error",
             message=f"Error: {str(e)}",
             completedBatches=0,
-            totalBatches=0
+            totalBatches=0,
+            usedTokens=budget.used
+        ))
+    finally:
+        token_budgets.release(budget)
+
+async def launch_reorganization(request: ReorganizeRequest) -> None:
+    """Run a job in this process, or hand it to the worker processes in queue mode"""
+    session_id = request.sessionId
+    if JOB_QUEUE_ENABLED:
+        # Any API worker can report on it
+        queue = get_job_queue()
+        await asyncio.to_thread(
+            queue.enqueue,
+            session_id,
+            user_key_for(request.apiKey),
+            len(request.bookmarks),
+            request.model_dump(exclude={"apiKey"}),
+            request.apiKey
+        )
+        ahead = await asyncio.to_thread(queue.position, session_id)
+        if ahead:
+            update_progress(session_id, message=f"🐼 Waiting in line behind {ahead} other reorganizations...")
+        return
+    
+    result_streams.register(session_id, list)
+    task = asyncio.create_task(reorganize_bookmarks_background(request))
+    _running_jobs[session_id] = task
+    
+    def forget(finished: asyncio.Task) -> None:
+        if _running_jobs.get(session_id) is finished:
+            del _running_jobs[session_id]
+    task.add_done_callback(forget)
+
+async def is_job_active(session_id: str) -> bool:
+    """Whether a session's job is queued or running"""
+    if JOB_QUEUE_ENABLED:
+        return await asyncio.to_thread(get_job_queue().active_status, session_id) is not None
+    return session_id in _running_jobs
+
+async def check_admission(request: ReorganizeRequest) -> None:
+    """Refuse jobs whose estimate exceeds the job budget, or the key's pending limit under the "reject" policy"""
+    if not SESSION_TOKEN_BUDGET and not token_budgets.max_pending_tokens:
+        return
+    estimate = await estimate_reorganization(
+        request.bookmarks, request.model, request.categorizationDepth, request.taxonomyMode, request.useCache
+    )
+    if token_budgets.admission(estimate["totalTokens"], request.apiKey) != "reject":
+        return
+    if SESSION_TOKEN_BUDGET and estimate["totalTokens"] > SESSION_TOKEN_BUDGET:
+        raise HTTPException(
+            status_code=413,
+            detail=f"This reorganization needs about {estimate['totalTokens']} tokens, "
+                   f"more than the limit of {SESSION_TOKEN_BUDGET} per job"
         )
+    raise HTTPException(
+        status_code=429,
+        detail="Other reorganizations are using this API key's token budget; try again later",
+        headers={"Retry-After": "60"}
+    )
+
+@app.post("/api/reorganize/estimate")
+async def estimate_reorganization_cost(request: EstimateRequest):
+    """Estimated tokens and cost of a reorganization, and whether it would be admitted now"""
+    bookmarks, _ = resolve_bookmarks(request.bookmarks, request.collectionId)
+    if not bookmarks:
+        raise HTTPException(status_code=400, detail="No bookmarks provided")
+    
+    estimate = await estimate_reorganization(
+        bookmarks, request.model, request.categorizationDepth, request.taxonomyMode, request.useCache
+    )
+    estimate["admission"] = token_budgets.admission(estimate["totalTokens"], request.apiKey)
+    if request.apiKey:
+        estimate["budget"] = token_budgets.key_snapshot(request.apiKey)
+    return estimate
 
 @app.post("/api/reorganize")
-async def start_reorganization(request: ReorganizeRequest, background_tasks: BackgroundTasks):
+async def start_reorganization(request: ReorganizeRequest):
     """Start bookmark reorganization process"""
+    if request.collectionId:
+        # Work on copies so the job never mutates the stored collection
+        bookmarks, _ = resolve_bookmarks(None, request.collectionId)
+        request.bookmarks = [bookmark.model_copy() for bookmark in bookmarks]
+    
     try:
         # Validate request
         if not request.bookmarks:
@@ -797,11 +1500,28 @@ async def start_reorganization(request: ReorganizeRequest, background_tasks: Bac
         # Generate session ID if not provided
         if not request.sessionId:
             request.sessionId = str(uuid.uuid4())
+        elif await is_job_active(request.sessionId):
+            raise HTTPException(status_code=409, detail="A reorganization is already running for this session")
+        
+        await check_admission(request)
         
         logger.info(f"Starting reorganization for {len(request.bookmarks)} bookmarks")
         
-        # Start background task
-        background_tasks.add_task(reorganize_bookmarks_background, request)
+        # A new start never resumes an earlier run of the session
+        job_store.delete_checkpoint(request.sessionId)
+        
+        # Register the session before the task runs so progress streams can attach immediately
+        set_progress(request.sessionId, ProgressUpdate(
+            sessionId=request.sessionId,
+            progress=0.0,
+            status="queued",
+            message="🐼 Getting ready to reorganize your bookmarks...",
+            completedBatches=0,
+            totalBatches=0,
+            bookmarksProcessed=len(request.bookmarks)
+        ))
+        
+        await launch_reorganization(request)
         
         return {
             "sessionId": request.sessionId,
@@ -809,34 +1529,149 @@ async def start_reorganization(request: ReorganizeRequest, background_tasks: Bac
             "message": f"Started reorganization of {len(request.bookmarks)} bookmarks"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error starting reorganization: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/reorganize/{session_id}/cancel")
+async def cancel_reorganization(session_id: str):
+    """Stop a queued or running reorganization; finished chunks stay checkpointed"""
+    progress = job_store.get_progress(session_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if progress.get("status") in FINISHED_STATUSES:
+        return {"sessionId": session_id, "status": progress.get("status")}
+    
+    if JOB_QUEUE_ENABLED:
+        previous = await asyncio.to_thread(get_job_queue().cancel, session_id)
+        if previous == "running":
+            # The worker stops the job and reports the cancellation
+            return {"sessionId": session_id, "status": "cancelling"}
+    else:
+        task = _running_jobs.get(session_id)
+        if task is not None:
+            task.cancel()
+            return {"sessionId": session_id, "status": "cancelling"}
+    
+    # Nothing is running it (still queued, or its process went away)
+    update_progress(session_id, status="cancelled", message="🛑 Reorganization cancelled.")
+    result_streams.finish(session_id, {"type": "cancelled", "message": "Reorganization cancelled"})
+    return {"sessionId": session_id, "status": "cancelled"}
+
+@app.post("/api/reorganize/{session_id}/resume")
+async def resume_reorganization(session_id: str, request: ResumeRequest):
+    """Continue a cancelled or failed reorganization from its last checkpoint"""
+    checkpoint = job_store.get_checkpoint(session_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="No checkpoint to resume from")
+    if await is_job_active(session_id):
+        raise HTTPException(status_code=409, detail="The reorganization is still running")
+    if not request.apiKey:
+        raise HTTPException(status_code=400, detail="API key required")
+    
+    state = checkpoint["state"]
+    # Older checkpoints keep the bookmarks inside the request
+    bookmarks = unpack_bookmarks(state["bookmarks"]) if state.get("bookmarks") else state["request"].get("bookmarks")
+    job_request = ReorganizeRequest(**{**state["request"], "bookmarks": bookmarks}, apiKey=request.apiKey)
+    done = len(checkpoint["assignments"])
+    logger.info(f"Resuming reorganization {session_id} with {done} bookmarks already categorized")
+    
+    set_progress(session_id, ProgressUpdate(
+        sessionId=session_id,
+        progress=0.0,
+        status="queued",
+        message=f"♻️ Resuming your reorganization ({done} bookmarks already done)...",
+        completedBatches=0,
+        totalBatches=0,
+        bookmarksProcessed=len(job_request.bookmarks),
+        resumedBookmarks=done
+    ))
+    await launch_reorganization(job_request)
+    
+    return {
+        "sessionId": session_id,
+        "status": "resumed",
+        "message": f"Resumed reorganization of {len(job_request.bookmarks)} bookmarks"
+    }
+
 @app.get("/api/progress/{session_id}")
 async def get_progress(session_id: str):
     """Get progress for a reorganization session"""
-    if session_id not in progress_store:
+    progress = job_store.get_progress(session_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return progress
+
+@app.get("/api/progress/{session_id}/stream")
+async def stream_progress(session_id: str, request: Request, lastEventId: Optional[int] = None):
+    """Stream progress for a reorganization session as Server-Sent Events"""
+    progress = job_store.get_progress(session_id)
+    if progress is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return progress_store[session_id]
+    # EventSource sends Last-Event-ID on reconnect; the query parameter is for manual clients
+    header_event_id = request.headers.get("last-event-id", "")
+    last_event_id = int(header_event_id) if header_event_id.isdigit() else (lastEventId or 0)
+    
+    if JOB_QUEUE_ENABLED:
+        mirror_queued_session(session_id)
+    elif session_id not in progress_broker:
+        progress_broker.publish(session_id, progress)
+    
+    async def event_stream():
+        yield "retry: 2000\n\n"
+        async for event_id, snapshot in progress_broker.subscribe(session_id, last_event_id):
+            if await request.is_disconnected():
+                break
+            yield format_sse(event_id, snapshot)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/api/result/{session_id}")
 async def get_result(session_id: str):
     """Get the final result of reorganization"""
-    result_key = f"{session_id}_result"
-    if result_key not in progress_store:
+    result = job_store.get_result(session_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Result not found")
     
-    result = progress_store[result_key]
-    
     # Clean up stored data
-    if session_id in progress_store:
-        del progress_store[session_id]
-    del progress_store[result_key]
+    release_session(session_id)
     
     return {"bookmarks": result}
 
+@app.get("/api/result/{session_id}/stream")
+async def stream_result(session_id: str):
+    """Stream bookmark -> category assignments as NDJSON while chunks complete"""
+    if not result_streams.subscribe(session_id):
+        # Queued jobs run elsewhere, and finished ones keep no records; both are replayed from the job store
+        if job_store.get_progress(session_id) is None:
+            raise HTTPException(status_code=404, detail="Result not found")
+        result_streams.open(session_id)
+        mirror_queued_session(session_id)
+    
+    async def record_stream():
+        # Closed with the response, so a client that leaves stops being counted as a reader right away
+        async with aclosing(result_streams.iterate(session_id)) as batches:
+            async for records in batches:
+                yield "".join(format_ndjson(record) for record in records)
+        
+        # Streaming the summary delivers the whole result; release it like /api/result does
+        if result_streams.is_finished(session_id):
+            progress = job_store.get_progress(session_id) or {}
+            if progress.get("status") in FINISHED_STATUSES:
+                release_session(session_id)
+            else:
+                result_streams.discard(session_id)
+    
+    return StreamingResponse(record_stream(), media_type="application/x-ndjson")
+
 @app.post("/api/chat")
 async def chat_with_ai(request: ChatRequest):
     """Unified chat interface for AI assistant"""
@@ -847,6 +1682,8 @@ async def chat_with_ai(request: ChatRequest):
         if not request.message.strip():
             raise HTTPException(status_code=400, detail="Message cannot be empty")
         
+        bookmarks, version_key = resolve_bookmarks(request.bookmarks, request.collectionId)
+        
         logger.info(f"Processing chat message: {request.message[:100]}...")
         
         # Detect intent
@@ -866,7 +1703,10 @@ async def chat_with_ai(request: ChatRequest):
         # Route based on intent
         if intent == "search":
             query = entities.get("query", request.message)
-            results = await search_bookmarks_with_ai(query, request.bookmarks, request.apiKey, request.chatModel)
+            results = await search_bookmarks_with_ai(
+                query, bookmarks, request.apiKey, request.chatModel,
+                request_version_key(bookmarks, version_key), request.searchMode
+            )
             
             if results:
                 response_text = f"Found {len(results)} bookmarks matching '{query}'. Here are the most relevant ones:"
@@ -884,7 +1724,7 @@ async def chat_with_ai(request: ChatRequest):
             )
         
         elif intent == "reorganize":
-            bookmark_count = len(request.bookmarks)
+            bookmark_count = len(bookmarks)
             if bookmark_count == 0:
                 response_text = "You don't have any bookmarks to reorganize. Please upload some bookmarks first."
                 suggestions = ["Upload bookmarks", "Learn about bookmark formats"]
@@ -900,7 +1740,11 @@ async def chat_with_ai(request: ChatRequest):
             )
         
         elif intent == "stats":
-            stats = await generate_bookmark_stats(request.bookmarks)
+            # Stored collections keep their analytics up to date; plain bookmark lists are counted here
+            collection_stats = None
+            if request.collectionId:
+                collection_stats, _ = await asyncio.to_thread(collection_store.get_stats, request.collectionId)
+            stats = await generate_bookmark_stats(bookmarks, collection_stats)
             
             if stats["total"] == 0:
                 response_text = "You don't have any bookmarks loaded. Upload your bookmarks to see statistics."
@@ -928,7 +1772,7 @@ Your collection is {'well-organized' if stats['unique_categories'] > 5 else 'rea
             )
         
         elif intent == "export":
-            bookmark_count = len(request.bookmarks)
+            bookmark_count = len(bookmarks)
             if bookmark_count == 0:
                 response_text = "You don't have any bookmarks to export. Upload bookmarks first."
                 suggestions = ["Upload bookmarks"]
@@ -945,7 +1789,7 @@ Your collection is {'well-organized' if stats['unique_categories'] > 5 else 'rea
         
         else:  # general intent
             # Provide general help and information
-            bookmark_count = len(request.bookmarks)
+            bookmark_count = len(bookmarks)
             
             if "help" in request.message.lower():
                 response_text = f"""🐼 **PinPanda AI Assistant Help**
@@ -971,10 +1815,148 @@ You currently have {bookmark_count} bookmarks loaded."""
                 suggestions=suggestions
             )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Chat processing error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
 
+@app.post("/api/collections")
+async def create_collection(request: CollectionUploadRequest):
+    """Upload a bookmark collection once and reference it by ID afterwards"""
+    collection = collection_store.create(request.bookmarks)
+    return collection.info()
+
+@app.get("/api/collections/{collection_id}")
+async def get_collection(collection_id: str, include_bookmarks: bool = False):
+    """Get collection version info, optionally with its bookmarks"""
+    try:
+        collection = collection_store.get(collection_id)
+    except CollectionNotFoundError:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    
+    info = collection.info()
+    if include_bookmarks:
+        info["bookmarks"] = collection.bookmarks
+    return info
+
+@app.patch("/api/collections/{collection_id}")
+async def update_collection(collection_id: str, request: CollectionDeltaRequest):
+    """Apply add/update/delete deltas to a stored collection"""
+    try:
+        collection = collection_store.apply_delta(
+            collection_id,
+            request.baseVersion,
+            add=request.add,
+            update=[u.model_dump(exclude_unset=True) for u in request.update],
+            delete=request.delete
+        )
+    except CollectionNotFoundError:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    except VersionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return collection.info()
+
+@app.delete("/api/collections/{collection_id}")
+async def delete_collection(collection_id: str):
+    """Drop a stored collection"""
+    try:
+        collection_store.delete(collection_id)
+    except CollectionNotFoundError:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    return {"status": "deleted"}
+
+@app.post("/api/duplicates")
+async def find_duplicates_endpoint(request: DuplicatesRequest):
+    """Group exact duplicates by canonical URL and cluster near duplicates"""
+    bookmarks, _ = resolve_bookmarks(request.bookmarks, request.collectionId)
+    canonicalizer = URLCanonicalizer(
+        ignore_scheme=request.ignoreScheme,
+        ignore_www=request.ignoreWww,
+        ignore_fragment=request.ignoreFragment,
+        ignore_trailing_slash=request.ignoreTrailingSlash,
+        strip_tracking_params=request.stripTrackingParams,
+        sort_query_params=request.sortQueryParams,
+        ignored_params=request.ignoredParams
+    )
+    report = await asyncio.to_thread(
+        find_duplicates, bookmarks, canonicalizer, request.nearDuplicates, request.threshold
+    )
+    return {
+        "stats": build_duplicate_stats(report),
+        "duplicateGroups": report.duplicate_groups(limit=request.limit),
+        "nearDuplicateGroups": report.near_groups[:request.limit]
+    }
+
+@app.post("/api/stats")
+async def get_bookmark_stats(request: StatsRequest):
+    """
+    Collection analytics: top categories, domains, folders and duplicated
+    URLs, and bookmarks added per month overall and per domain. Stored
+    collections keep them up to date, so querying one costs the same at any size.
+    """
+    if request.collectionId:
+        try:
+            stats, version = await asyncio.to_thread(collection_store.get_stats, request.collectionId)
+        except CollectionNotFoundError:
+            raise HTTPException(status_code=404, detail="Collection not found")
+    else:
+        stats = await asyncio.to_thread(CollectionStats, request.bookmarks or [])
+    
+    result = stats.breakdown(request.top, request.folderCategories, request.domainsOverTime)
+    if request.collectionId:
+        result.update(collectionId=request.collectionId, version=version)
+    return result
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Categorization cache size and hit/miss counters"""
+    return await asyncio.to_thread(get_categorization_cache().stats)
+
+@app.delete("/api/cache")
+async def clear_cache():
+    """Remove every cached categorization"""
+    await asyncio.to_thread(get_categorization_cache().clear)
+    return {"status": "cleared"}
+
+@app.get("/api/jobs/stats")
+async def get_job_stats():
+    """Job store size and eviction counters, plus queue depth when the job queue is enabled"""
+    stats = await asyncio.to_thread(job_store.stats)
+    if JOB_QUEUE_ENABLED:
+        stats["queue"] = await asyncio.to_thread(get_job_queue().stats)
+    return stats
+
+def collect_runtime_metrics() -> None:
+    """Refresh metrics whose values live in the stores and caches (runs on every scrape)"""
+    ACTIVE_SESSIONS.set(len(_running_jobs))
+    
+    stats = job_store.stats()
+    JOB_STORE_SESSIONS.set(stats["sessions"])
+    JOB_STORE_BYTES.set(stats["approxBytes"])
+    JOB_STORE_CHECKPOINTS.set(stats["checkpoints"])
+    JOB_STORE_EVICTIONS.set_total(stats["evicted"])
+    
+    if JOB_QUEUE_ENABLED:
+        queue_stats = get_job_queue().stats()
+        for status in ("queued", "running", "done", "failed", "cancelled"):
+            QUEUE_JOBS.set(queue_stats[status], status=status)
+    
+    cache = get_categorization_cache()
+    CATEGORIZATION_CACHE_LOOKUPS.set_total(cache.hits, result="hit")
+    CATEGORIZATION_CACHE_LOOKUPS.set_total(cache.misses, result="miss")
+    INTENT_CACHE_LOOKUPS.set_total(intent_cache.hits, result="hit")
+    INTENT_CACHE_LOOKUPS.set_total(intent_cache.misses, result="miss")
+
+metrics_registry.add_collector(collect_runtime_metrics)
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus metrics for this process"""
+    body = await asyncio.to_thread(metrics_registry.render)
+    return Response(content=body, headers={"Content-Type": METRICS_CONTENT_TYPE})
+
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
@@ -0,0 +1,290 @@
+"""
+Process metrics in the Prometheus text exposition format.
+
+A small dependency-free registry of counters, gauges and histograms with
+labels. Code paths record into module-level metrics; values that live
+elsewhere (job store size, queue depth, cache counters) are read by
+collectors registered with the registry, which run on every scrape.
+
+Metrics are per process: with PINPANDA_JOB_QUEUE enabled, reorganization
+jobs (and their OpenAI calls) run in the worker processes, which serve
+their own metrics (see job_worker.py --metrics-port).
+"""
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds (seconds) for OpenAI calls and chunks, which take from well under a second to minutes
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+# Whole reorganization jobs
+JOB_DURATION_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels: str) -> None:
+        """Expose a running total kept elsewhere (for collectors)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self) -> None:
+        """Drop all label sets, so ones that disappeared are not reported stale"""
+        with self._lock:
+            self._values.clear()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._series.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._series[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Run `collector` before every render, to refresh values kept elsewhere"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the text exposition format (may block on collectors)"""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                # A broken collector should not take the other metrics down with it
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {str(e)}")
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# OpenAI calls
+OPENAI_REQUEST_SECONDS = registry.histogram(
+    "pinpanda_openai_request_duration_seconds",
+    "OpenAI chat completion latency (streamed calls until the stream is closed) by call site and status",
+    ("call_site", "status")
+)
+OPENAI_TOKENS = registry.counter(
+    "pinpanda_openai_tokens_total",
+    "Tokens reported in OpenAI usage, by call site and direction (prompt or completion)",
+    ("call_site", "direction")
+)
+OPENAI_RETRIES = registry.counter(
+    "pinpanda_openai_retries_total",
+    "Retried OpenAI calls by call site and reason",
+    ("call_site", "reason")
+)
+
+# Reorganization jobs
+CHUNK_SECONDS = registry.histogram(
+    "pinpanda_chunk_duration_seconds",
+    "Time to categorize one chunk, including retries and splits, by taxonomy mode and outcome",
+    ("mode", "outcome")
+)
+CHUNK_SPLITS = registry.counter(
+    "pinpanda_chunk_splits_total",
+    "Chunks split in half after a truncated or malformed response"
+)
+JOB_SECONDS = registry.histogram(
+    "pinpanda_reorganize_duration_seconds",
+    "Reorganization job duration by final status",
+    ("status",),
+    JOB_DURATION_BUCKETS
+)
+BOOKMARKS_CATEGORIZED = registry.counter(
+    "pinpanda_bookmarks_categorized_total",
+    "Bookmarks categorized by reorganization jobs, by source (cache, local, resumed, model)",
+    ("source",)
+)
+
+# Caches (running totals read from the caches at scrape time)
+CATEGORIZATION_CACHE_LOOKUPS = registry.counter(
+    "pinpanda_categorization_cache_lookups_total",
+    "Categorization cache lookups by result (hit or miss)",
+    ("result",)
+)
+INTENT_CACHE_LOOKUPS = registry.counter(
+    "pinpanda_intent_cache_lookups_total",
+    "Chat intent cache lookups by result (hit or miss)",
+    ("result",)
+)
+INTENT_DETECTIONS = registry.counter(
+    "pinpanda_intent_detections_total",
+    "Chat intents detected, by source (cache, local or llm)",
+    ("source",)
+)
+
+# Process state (refreshed at scrape time)
+ACTIVE_SESSIONS = registry.gauge(
+    "pinpanda_active_sessions",
+    "Reorganization jobs running in this process"
+)
+QUEUE_JOBS = registry.gauge(
+    "pinpanda_job_queue_jobs",
+    "Jobs in the shared job queue by status (queued jobs are the queue depth)",
+    ("status",)
+)
+JOB_STORE_SESSIONS = registry.gauge(
+    "pinpanda_job_store_sessions",
+    "Sessions held in the job store (progress store)"
+)
+JOB_STORE_BYTES = registry.gauge(
+    "pinpanda_job_store_bytes",
+    "Approximate size of the job store contents in bytes"
+)
+JOB_STORE_CHECKPOINTS = registry.gauge(
+    "pinpanda_job_store_checkpoints",
+    "Sessions with a resumable checkpoint"
+)
+JOB_STORE_EVICTIONS = registry.counter(
+    "pinpanda_job_store_evictions_total",
+    "Sessions evicted from the job store to stay within its size limit"
+)
+
+def record_token_usage(call_site: str, usage: Optional[Dict[str, int]]) -> None:
+    """Count the tokens of an OpenAI usage object"""
+    if not usage:
+        return
+    for direction in ("prompt", "completion"):
+        tokens = usage.get(f"{direction}_tokens")
+        if tokens:
+            OPENAI_TOKENS.inc(tokens, call_site=call_site, direction=direction)
@@ -0,0 +1,181 @@
+"""
+Shared OpenAI HTTP client for the PinPanda backend.
+
+A single pooled httpx.AsyncClient is created when the application starts and
+closed when it shuts down, so chat and reorganization calls reuse keep-alive
+connections instead of paying a TLS handshake per request.
+"""
+import os
+import json
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator, Tuple
+
+import httpx
+
+from metrics import OPENAI_REQUEST_SECONDS
+from incremental_json import MalformedResponseError
+
+logger = logging.getLogger(__name__)
+
+# Client configuration (overridable through environment variables)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes")
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30.0"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10.0"))
+OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "30.0"))
+# Stream categorization responses so they can be parsed (and abandoned) as they arrive
+OPENAI_STREAM_RESPONSES = os.getenv("OPENAI_STREAM_RESPONSES", "true").lower() in ("1", "true", "yes")
+
+_client: Optional[httpx.AsyncClient] = None
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional 'h2' package"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _create_client() -> httpx.AsyncClient:
+    """Build the pooled client from the current configuration"""
+    http2 = OPENAI_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("OPENAI_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(OPENAI_REQUEST_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+    logger.info(
+        f"Creating shared OpenAI client (base_url={OPENAI_BASE_URL}, http2={http2}, "
+        f"max_connections={OPENAI_MAX_CONNECTIONS}, keepalive={OPENAI_MAX_KEEPALIVE_CONNECTIONS})"
+    )
+    return httpx.AsyncClient(base_url=OPENAI_BASE_URL, http2=http2, limits=limits, timeout=timeout)
+
+async def start_openai_client() -> None:
+    """Create the application-lifetime client (called on startup)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+
+async def close_openai_client() -> None:
+    """Close the shared client and release pooled connections (called on shutdown)"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("Closed shared OpenAI client")
+    _client = None
+
+def get_openai_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily if startup has not run"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+def _error_status(error: BaseException) -> str:
+    """Latency metric status for a call that raised"""
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "connection_error"
+    return "aborted"
+
+async def post_chat_completion(
+    api_key: str,
+    payload: Dict[str, Any],
+    timeout: Optional[float] = None,
+    call_site: str = "other"
+) -> httpx.Response:
+    """POST a chat completion request through the shared client"""
+    client = get_openai_client()
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            "/chat/completions",
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {api_key}"
+            },
+            json=payload,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        )
+    except BaseException as e:
+        OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - started, call_site=call_site, status=_error_status(e))
+        raise
+    OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - started, call_site=call_site, status=str(response.status_code))
+    return response
+
+@asynccontextmanager
+async def stream_chat_completion(
+    api_key: str,
+    payload: Dict[str, Any],
+    timeout: Optional[float] = None,
+    call_site: str = "other"
+) -> AsyncIterator[httpx.Response]:
+    """
+    Open a streamed chat completion; the body is read with iter_completion_deltas.
+    Leaving the block early closes the connection, which stops the generation.
+    """
+    client = get_openai_client()
+    started = time.perf_counter()
+    status = "aborted"
+    try:
+        async with client.stream(
+            "POST",
+            "/chat/completions",
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {api_key}"
+            },
+            json={**payload, "stream": True, "stream_options": {"include_usage": True}},
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        ) as response:
+            # A successful stream the caller abandons early stays "aborted"
+            if response.status_code != 200:
+                status = str(response.status_code)
+            yield response
+            status = str(response.status_code)
+    except BaseException as e:
+        if status == "aborted":
+            status = _error_status(e)
+        raise
+    finally:
+        OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - started, call_site=call_site, status=status)
+
+async def iter_completion_deltas(
+    response: httpx.Response
+) -> AsyncIterator[Tuple[str, Optional[str], Optional[Dict[str, Any]]]]:
+    """
+    (content delta, finish reason, usage) for each server-sent event of a
+    streamed completion. An event that is not valid JSON raises
+    MalformedResponseError, like malformed content does.
+    """
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            event = json.loads(data)
+        except json.JSONDecodeError as e:
+            raise MalformedResponseError(f"Invalid stream event: {e.msg}") from None
+        usage = event.get("usage")
+        choices = event.get("choices") or []
+        if not choices:
+            # The usage-only event sent last with include_usage
+            if usage:
+                yield "", None, usage
+            continue
+        choice = choices[0]
+        delta = choice.get("delta") or {}
+        yield delta.get("content") or "", choice.get("finish_reason"), usage
@@ -0,0 +1,103 @@
+"""
+Push-based progress events for reorganization sessions.
+
+Each session keeps only its latest progress snapshot and a monotonically
+increasing event ID. Subscribers wake on every publish but always read the
+latest snapshot, so bursts of updates are coalesced into one event for slow
+clients. A reconnecting client passes the last event ID it saw and receives
+the current snapshot straight away if it missed anything.
+"""
+import json
+import asyncio
+import logging
+from typing import Dict, Any, Optional, AsyncIterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Statuses after which a session produces no more progress events
+TERMINAL_STATUSES = ("completed", "error", "cancelled")
+
+class _SessionChannel:
+    def __init__(self):
+        self.event_id = 0
+        self.snapshot: Dict[str, Any] = {}
+        # Event ID at which duplicateStats last changed
+        self.stats_event_id = 0
+        self.changed = asyncio.Event()
+
+class ProgressBroker:
+    """Fan-out of coalesced progress snapshots to streaming subscribers"""
+
+    def __init__(self):
+        self._channels: Dict[str, _SessionChannel] = {}
+
+    def publish(self, session_id: str, snapshot: Dict[str, Any]) -> int:
+        """Record the latest snapshot for a session and wake its subscribers"""
+        channel = self._channels.get(session_id)
+        if channel is None:
+            channel = self._channels[session_id] = _SessionChannel()
+
+        channel.event_id += 1
+        if snapshot.get("duplicateStats") != channel.snapshot.get("duplicateStats"):
+            channel.stats_event_id = channel.event_id
+        channel.snapshot = snapshot
+
+        # Wake current waiters; later waiters block on a fresh event
+        channel.changed.set()
+        channel.changed = asyncio.Event()
+        return channel.event_id
+
+    def latest(self, session_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        channel = self._channels.get(session_id)
+        if channel is None:
+            return None
+        return channel.event_id, channel.snapshot
+
+    def discard(self, session_id: str) -> None:
+        """Forget a session, waking subscribers so they can finish"""
+        channel = self._channels.pop(session_id, None)
+        if channel is not None:
+            channel.changed.set()
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._channels
+
+    async def subscribe(
+        self,
+        session_id: str,
+        last_event_id: int = 0,
+        heartbeat_seconds: float = 15.0
+    ) -> AsyncIterator[Tuple[Optional[int], Optional[Dict[str, Any]]]]:
+        """
+        Yield (event_id, snapshot) whenever the session moves past the last
+        event the client saw, and (None, None) as a heartbeat when idle.
+        duplicateStats is only included when it changed since last_event_id.
+        Stops after a terminal status or when the session is discarded.
+        """
+        while True:
+            channel = self._channels.get(session_id)
+            if channel is None:
+                return
+
+            if channel.event_id > last_event_id:
+                snapshot = channel.snapshot
+                if channel.stats_event_id <= last_event_id and "duplicateStats" in snapshot:
+                    snapshot = {k: v for k, v in snapshot.items() if k != "duplicateStats"}
+                last_event_id = channel.event_id
+                yield channel.event_id, snapshot
+                if channel.snapshot.get("status") in TERMINAL_STATUSES:
+                    return
+                continue
+
+            try:
+                await asyncio.wait_for(channel.changed.wait(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield None, None
+
+def format_sse(event_id: Optional[int], snapshot: Optional[Dict[str, Any]], event: str = "progress") -> str:
+    """Encode one Server-Sent Events frame (a comment line for heartbeats)"""
+    if snapshot is None:
+        return ": keep-alive\n\n"
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(snapshot)}\n\n"
+
+progress_broker = ProgressBroker()
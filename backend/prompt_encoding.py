@@ -0,0 +1,136 @@
+"""
+Bookmark encodings for LLM prompts.
+
+"json" is the original pretty-printed list of objects. "compact" writes one
+pipe-separated row per bookmark and reduces URLs to host + path (dropping
+the scheme, "www.", query strings and fragments). Repeated folder and
+category names are written once in a dictionary and referenced by short ids.
+Rows keep a leading index because the model answers with indices, and
+explicit numbers are more reliable than asking it to count lines.
+"""
+import os
+import json
+from urllib.parse import urlsplit
+from typing import List, Dict, Any, Sequence, Tuple
+
+PROMPT_ENCODING = os.getenv("PINPANDA_PROMPT_ENCODING", "compact")
+
+# Per-field length limits in compact rows
+MAX_TITLE_CHARS = 120
+MAX_URL_CHARS = 100
+MAX_DESCRIPTION_CHARS = 160
+
+# Fields whose values repeat across bookmarks: (dictionary heading, id prefix)
+DICTIONARY_FIELDS: Dict[str, Tuple[str, str]] = {
+    "folder": ("Folders", "F"),
+    "category": ("Categories", "C")
+}
+
+_EMPTY_LABEL = "Uncategorized"
+
+def compact_url(url: str) -> str:
+    """Host + path without scheme, www., query or fragment"""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url[:MAX_URL_CHARS]
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if not host:
+        # Not an absolute URL (e.g. "javascript:" or a bare path); keep it as written
+        return url[:MAX_URL_CHARS]
+    path = parts.path.rstrip("/")
+    return (host + path)[:MAX_URL_CHARS]
+
+def _clean(text: str, limit: int) -> str:
+    """Single-line field text with the column separator escaped"""
+    return " ".join((text or "").split()).replace("|", "/")[:limit]
+
+def _field_value(bookmark: Any, field: str) -> str:
+    value = getattr(bookmark, field, None) or ""
+    if field in DICTIONARY_FIELDS:
+        return value or _EMPTY_LABEL
+    if field == "url":
+        return compact_url(value)
+    if field == "title":
+        return _clean(value, MAX_TITLE_CHARS)
+    return _clean(value, MAX_DESCRIPTION_CHARS)
+
+def _json_entry(index: int, bookmark: Any, fields: Sequence[str]) -> str:
+    data: Dict[str, Any] = {"index": index}
+    for field in fields:
+        value = getattr(bookmark, field, None)
+        data[field] = (value or _EMPTY_LABEL) if field in DICTIONARY_FIELDS else (value or "")
+    return "  " + json.dumps(data, indent=2).replace("\n", "\n  ")
+
+def encode_bookmarks(bookmarks: Sequence[Any], fields: Sequence[str], encoding: str = PROMPT_ENCODING) -> str:
+    """Render bookmarks for a prompt, indexed from 0"""
+    if encoding == "json":
+        if not bookmarks:
+            return "[]"
+        return "[\n" + ",\n".join(_json_entry(i, b, fields) for i, b in enumerate(bookmarks)) + "\n]"
+
+    dictionaries: Dict[str, Dict[str, str]] = {field: {} for field in fields if field in DICTIONARY_FIELDS}
+    rows = []
+    for i, bookmark in enumerate(bookmarks):
+        values = [str(i)]
+        for field in fields:
+            value = _field_value(bookmark, field)
+            if field in dictionaries:
+                ids = dictionaries[field]
+                if value not in ids:
+                    ids[value] = f"{DICTIONARY_FIELDS[field][1]}{len(ids) + 1}"
+                value = ids[value]
+            values.append(value)
+        rows.append("|".join(values))
+
+    sections = []
+    for field, ids in dictionaries.items():
+        heading, _ = DICTIONARY_FIELDS[field]
+        sections.append(f"{heading}:\n" + "\n".join(f"{ref}={_clean(name, MAX_TITLE_CHARS)}" for name, ref in ids.items()))
+    sections.append(f"Bookmarks (index|{'|'.join(fields)}):\n" + "\n".join(rows))
+    return "\n\n".join(sections)
+
+def bookmark_entry_texts(bookmarks: Sequence[Any], fields: Sequence[str], encoding: str = PROMPT_ENCODING) -> List[str]:
+    """
+    The text each bookmark adds to an encoded prompt, for token costing.
+
+    Entries are rendered with index 0. In compact mode a bookmark whose
+    dictionary value differs from the previous bookmark's is also charged for
+    the dictionary line. Bookmarks from one folder are usually contiguous, so
+    this closely tracks the per-chunk dictionaries.
+    """
+    if encoding == "json":
+        return [_json_entry(0, b, fields) + ",\n" for b in bookmarks]
+
+    texts = []
+    previous: Dict[str, str] = {}
+    for bookmark in bookmarks:
+        values = ["0"]
+        extra = ""
+        for field in fields:
+            value = _field_value(bookmark, field)
+            if field in DICTIONARY_FIELDS:
+                prefix = DICTIONARY_FIELDS[field][1]
+                if previous.get(field) != value:
+                    extra += f"{prefix}99={_clean(value, MAX_TITLE_CHARS)}\n"
+                    previous[field] = value
+                value = f"{prefix}99"
+            values.append(value)
+        texts.append(extra + "|".join(values) + "\n")
+    return texts
+
+def format_description(fields: Sequence[str], encoding: str = PROMPT_ENCODING) -> str:
+    """Instructions telling the model how the bookmark list is laid out"""
+    if encoding == "json":
+        return "Each bookmark is a JSON object with its index."
+    sentences = [
+        f"Each bookmark is one line of pipe-separated fields: index|{'|'.join(fields)}.",
+        "URLs are shown as host and path only."
+    ]
+    for field in fields:
+        if field in DICTIONARY_FIELDS:
+            heading, prefix = DICTIONARY_FIELDS[field]
+            sentences.append(f"{field.capitalize()} values like {prefix}1 refer to the {heading} list.")
+    return " ".join(sentences)
@@ -0,0 +1,126 @@
+"""
+Compressed and fast-path JSON request bodies.
+
+Routes use DecodingRoute, whose requests:
+- accept gzip/deflate bodies, and zstd ones when the `zstandard` package is
+  installed, per the Content-Encoding header. A large collection's JSON
+  compresses ~5-10x, which matters more than anything else for uploads from
+  the browser. Decompressed bodies are capped at PINPANDA_MAX_BODY_BYTES.
+- parse JSON with orjson, or msgspec, when one is installed (several times
+  faster than the json module on bookmark arrays), falling back to json.
+"""
+import io
+import os
+import json
+import zlib
+import logging
+from typing import Any, Callable
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+
+logger = logging.getLogger(__name__)
+
+# Largest request body accepted after decompression
+MAX_BODY_BYTES = int(os.getenv("PINPANDA_MAX_BODY_BYTES", str(256 * 1024 * 1024)))
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import orjson
+
+    def loads(body: bytes) -> Any:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so errors are reported as before
+        return orjson.loads(body)
+
+    JSON_DECODER = "orjson"
+except ImportError:  # pragma: no cover - optional dependency
+    try:
+        import msgspec
+
+        _msgspec_decoder = msgspec.json.Decoder()
+
+        def loads(body: bytes) -> Any:
+            try:
+                return _msgspec_decoder.decode(body)
+            except msgspec.DecodeError as e:
+                raise json.JSONDecodeError(str(e), "", 0) from None
+
+        JSON_DECODER = "msgspec"
+    except ImportError:
+        loads = json.loads
+        JSON_DECODER = "json"
+
+SUPPORTED_ENCODINGS = ("gzip", "deflate", "zstd") if zstandard is not None else ("gzip", "deflate")
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Request body is over {MAX_BODY_BYTES} bytes once decompressed")
+
+def _inflate(body: bytes, wbits: int) -> bytes:
+    decompressor = zlib.decompressobj(wbits)
+    try:
+        data = decompressor.decompress(body, MAX_BODY_BYTES + 1)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid compressed request body: {str(e)}")
+    if len(data) > MAX_BODY_BYTES or decompressor.unconsumed_tail:
+        raise _too_large()
+    return data
+
+def _unzstd(body: bytes) -> bytes:
+    try:
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)) as reader:
+            data = reader.read(MAX_BODY_BYTES + 1)
+    except zstandard.ZstdError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid compressed request body: {str(e)}")
+    if len(data) > MAX_BODY_BYTES:
+        raise _too_large()
+    return data
+
+def decode_body(body: bytes, content_encoding: str) -> bytes:
+    """Undo the Content-Encoding(s) of a request body, outermost last in the header"""
+    for encoding in reversed([e.strip().lower() for e in content_encoding.split(",") if e.strip()]):
+        if encoding == "identity":
+            continue
+        if encoding in ("gzip", "x-gzip"):
+            body = _inflate(body, 16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            # Zlib-wrapped per the spec; some clients send raw deflate
+            body = _inflate(body, 32 + zlib.MAX_WBITS) if body[:1] == b"\x78" else _inflate(body, -zlib.MAX_WBITS)
+        elif encoding == "zstd" and zstandard is not None:
+            body = _unzstd(body)
+        else:
+            raise HTTPException(
+                status_code=415,
+                detail=f"Unsupported Content-Encoding '{encoding}', use one of: {', '.join(SUPPORTED_ENCODINGS)}"
+            )
+    if len(body) > MAX_BODY_BYTES:
+        raise _too_large()
+    return body
+
+class DecodingRequest(Request):
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            content_encoding = self.headers.get("content-encoding")
+            if content_encoding:
+                self._body = decode_body(body, content_encoding)
+        return self._body
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+class DecodingRoute(APIRoute):
+    """Route whose handler reads the body through DecodingRequest"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def decoding_route_handler(request: Request) -> Response:
+            return await handler(DecodingRequest(request.scope, request.receive))
+
+        return decoding_route_handler
@@ -0,0 +1,115 @@
+"""
+Incremental reorganization results.
+
+A running job registers a snapshot of the assignments it has final so far.
+Records are only kept once a client subscribes: its channel starts from the
+snapshot, then each chunk's bookmark -> category assignments are appended as
+it completes, ending with a summary record. With no subscriber nothing is
+buffered, and a channel whose readers all leave before the end is dropped.
+Clients that subscribe after a job finished get its stored result replayed.
+"""
+import json
+import asyncio
+import logging
+from typing import List, Dict, Any, AsyncIterator, Callable
+
+logger = logging.getLogger(__name__)
+
+class _ResultChannel:
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self.done = False
+        self.readers = 0
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+class ResultStreams:
+    """Per-session result records, buffered only while someone reads them"""
+
+    def __init__(self):
+        self._channels: Dict[str, _ResultChannel] = {}
+        # session id -> records of the assignments its job has made so far
+        self._snapshots: Dict[str, Callable[[], List[Dict[str, Any]]]] = {}
+
+    def register(self, session_id: str, snapshot: Callable[[], List[Dict[str, Any]]]) -> None:
+        """Make a running job subscribable; a finished channel from an earlier run is dropped"""
+        channel = self._channels.get(session_id)
+        if channel is not None and channel.done:
+            del self._channels[session_id]
+        self._snapshots[session_id] = snapshot
+
+    def open(self, session_id: str) -> None:
+        """Start an empty channel for records replayed from elsewhere (the job store)"""
+        self._channels[session_id] = _ResultChannel([])
+
+    def subscribe(self, session_id: str) -> bool:
+        """Make sure a channel exists for a reader; False if the session has no records here"""
+        if session_id in self._channels:
+            return True
+        snapshot = self._snapshots.get(session_id)
+        if snapshot is None:
+            return False
+        self._channels[session_id] = _ResultChannel(snapshot())
+        return True
+
+    def append(self, session_id: str, records: List[Dict[str, Any]]) -> None:
+        channel = self._channels.get(session_id)
+        if channel is None or not records:
+            return
+        channel.records.extend(records)
+        channel.notify()
+
+    def finish(self, session_id: str, final_record: Dict[str, Any]) -> None:
+        """Append the closing summary (or error) record"""
+        self._snapshots.pop(session_id, None)
+        channel = self._channels.get(session_id)
+        if channel is None:
+            return
+        channel.records.append(final_record)
+        channel.done = True
+        channel.notify()
+
+    def discard(self, session_id: str) -> None:
+        self._snapshots.pop(session_id, None)
+        channel = self._channels.pop(session_id, None)
+        if channel is not None:
+            channel.done = True
+            channel.notify()
+
+    def is_finished(self, session_id: str) -> bool:
+        channel = self._channels.get(session_id)
+        return channel is None or channel.done
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._channels or session_id in self._snapshots
+
+    async def iterate(self, session_id: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield batches of records from the start, waiting for new ones until finished"""
+        channel = self._channels.get(session_id)
+        if channel is None:
+            return
+        channel.readers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(channel.records):
+                    batch = channel.records[position:]
+                    position += len(batch)
+                    yield batch
+                    continue
+                if channel.done:
+                    return
+                await channel.changed.wait()
+        finally:
+            channel.readers -= 1
+            # Nobody is reading a running job's records any more; a new reader starts from a fresh snapshot
+            if not channel.readers and not channel.done and self._channels.get(session_id) is channel:
+                del self._channels[session_id]
+
+def format_ndjson(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+result_streams = ResultStreams()
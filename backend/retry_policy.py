@@ -0,0 +1,73 @@
+"""
+Retry policy for OpenAI calls made by reorganization jobs.
+
+Transient failures (rate limits, timeouts, 5xx) are retried with full-jitter
+exponential backoff, waiting at least as long as the server's Retry-After
+asks. Responses that are truncated or unparseable are not retried as-is;
+the caller splits the chunk instead (see reorganize_bookmarks_background).
+"""
+import os
+import random
+import email.utils
+import time
+from typing import Optional, Dict, Any, Mapping
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("PINPANDA_RETRY_ATTEMPTS", "4"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("PINPANDA_RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("PINPANDA_RETRY_MAX_DELAY", "30.0"))
+# Longest Retry-After that is waited out rather than failing the call
+RETRY_AFTER_LIMIT_SECONDS = 120.0
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Chunks are not split below this many bookmarks
+MIN_SPLIT_CHUNK_SIZE = 4
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Seconds to wait from retry-after-ms / Retry-After (seconds or HTTP date), if given"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_after_headers(headers: Mapping[str, str]) -> Optional[Dict[str, str]]:
+    """The Retry-After headers of an OpenAI response, to pass along on an HTTPException"""
+    kept = {name: headers[name] for name in ("retry-after", "retry-after-ms") if name in headers}
+    return kept or None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Delay before retry number `attempt` (1-based)"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        # Never earlier than the server asked; the jitter spreads out waiting clients
+        delay = retry_after + random.uniform(0, RETRY_BASE_DELAY_SECONDS)
+    return delay
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code in RETRYABLE_STATUS_CODES
+
+class RetryStats:
+    """Per-job counts of retried calls and split or failed chunks"""
+
+    def __init__(self):
+        self.retried = 0
+        self.split = 0
+        self.failed = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"retried": self.retried, "split": self.split, "failed": self.failed}
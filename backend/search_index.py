@@ -0,0 +1,180 @@
+"""
+Inverted-index keyword search over bookmark collections.
+
+Bookmarks are tokenized once into a field-weighted BM25 (BM25F) index over
+title, URL, category and description. Indexes are cached per collection
+version and reused across queries; top-k retrieval uses a heap.
+"""
+import re
+import math
+import heapq
+import bisect
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Field weights and length normalization (BM25F)
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "url": 1.5,
+    "category": 1.2,
+    "description": 1.0
+}
+FIELD_B = {
+    "title": 0.75,
+    "url": 0.5,
+    "category": 0.3,
+    "description": 0.75
+}
+BM25_K1 = 1.2
+
+# Query terms also match indexed terms they prefix (e.g. "java" -> "javascript")
+MIN_PREFIX_LENGTH = 3
+PREFIX_MATCH_WEIGHT = 0.5
+
+# Number of indexes kept in memory
+MAX_CACHED_INDEXES = 16
+
+_TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; URLs split on punctuation"""
+    if not text:
+        return []
+    return _TOKEN_PATTERN.findall(text.lower())
+
+class BookmarkSearchIndex:
+    """
+    Immutable BM25F index over one version of a bookmark collection.
+
+    Results are positions in the indexed collection, so callers map them back
+    onto their own bookmark list for the same version.
+    """
+
+    def __init__(self, bookmarks: Sequence[Any]):
+        self.doc_count = len(bookmarks)
+
+        field_tokens: Dict[str, List[List[str]]] = {field: [] for field in FIELD_WEIGHTS}
+        for bookmark in bookmarks:
+            field_tokens["title"].append(tokenize(bookmark.title))
+            field_tokens["url"].append(tokenize(bookmark.url))
+            field_tokens["category"].append(tokenize(bookmark.category or ""))
+            field_tokens["description"].append(tokenize(bookmark.description or ""))
+
+        avg_lengths = {
+            field: (sum(len(tokens) for tokens in docs) / self.doc_count) if self.doc_count else 0.0
+            for field, docs in field_tokens.items()
+        }
+
+        # term -> {doc_id: length-normalized, field-weighted term frequency}
+        weighted_tf: Dict[str, Dict[int, float]] = {}
+        for field, docs in field_tokens.items():
+            weight = FIELD_WEIGHTS[field]
+            b = FIELD_B[field]
+            avg_length = avg_lengths[field] or 1.0
+            for doc_id, tokens in enumerate(docs):
+                if not tokens:
+                    continue
+                norm = weight / (1.0 - b + b * len(tokens) / avg_length)
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    postings = weighted_tf.setdefault(token, {})
+                    postings[doc_id] = postings.get(doc_id, 0.0) + count * norm
+
+        # Precompute the saturated BM25 contribution per posting and its maximum
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.idf: Dict[str, float] = {}
+        self.max_impact: Dict[str, float] = {}
+        for term, docs in weighted_tf.items():
+            df = len(docs)
+            self.idf[term] = math.log(1.0 + (self.doc_count - df + 0.5) / (df + 0.5))
+            saturated = {doc_id: tf / (BM25_K1 + tf) for doc_id, tf in docs.items()}
+            self.postings[term] = saturated
+            self.max_impact[term] = max(saturated.values())
+
+        self.vocabulary = sorted(self.postings)
+
+    def _expand_term(self, term: str) -> List[Tuple[str, float]]:
+        """Exact term plus indexed terms it is a prefix of"""
+        expansions = []
+        if term in self.postings:
+            expansions.append((term, 1.0))
+        if len(term) >= MIN_PREFIX_LENGTH:
+            start = bisect.bisect_right(self.vocabulary, term)
+            for candidate in self.vocabulary[start:]:
+                if not candidate.startswith(term):
+                    break
+                expansions.append((candidate, PREFIX_MATCH_WEIGHT))
+        return expansions
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[int, float]]:
+        """Return up to `limit` (collection index, score) pairs, best first"""
+        weighted_terms: Dict[str, float] = {}
+        for term in dict.fromkeys(tokenize(query)):
+            for indexed_term, weight in self._expand_term(term):
+                weighted_terms[indexed_term] = max(weighted_terms.get(indexed_term, 0.0), weight)
+
+        # Most selective terms first, each with an upper bound on its contribution
+        plan = sorted(
+            (
+                (self.idf[term] * weight, self.idf[term] * weight * self.max_impact[term], term)
+                for term, weight in weighted_terms.items()
+            ),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        remaining_bound = sum(bound for _, bound, _ in plan)
+
+        scores: Dict[int, float] = {}
+        for term_idf, bound, term in plan:
+            remaining_bound -= bound
+            postings = self.postings[term]
+            if len(scores) >= limit and len(scores) < len(postings) and \
+                    heapq.nlargest(limit, scores.values())[-1] >= bound + remaining_bound:
+                # MaxScore pruning: documents not yet scored can no longer reach
+                # the top-k, so only existing candidates are updated
+                for doc_id in scores:
+                    saturated_tf = postings.get(doc_id)
+                    if saturated_tf is not None:
+                        scores[doc_id] += term_idf * saturated_tf
+            else:
+                for doc_id, saturated_tf in postings.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + term_idf * saturated_tf
+
+        if not scores:
+            return []
+
+        # Ties keep collection order
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+def collection_fingerprint(bookmarks: Sequence[Any]) -> str:
+    """Content hash of the searchable fields, used when no collection version is known"""
+    # Hashed a bookmark at a time rather than joined into one string the size of the collection
+    digest = hashlib.blake2b(digest_size=16)
+    separator = ""
+    for b in bookmarks:
+        digest.update(f"{separator}{b.title}\x1f{b.url}\x1f{b.category or ''}\x1f{b.description or ''}".encode("utf-8"))
+        separator = "\x1e"
+    return digest.hexdigest()
+
+_index_cache: "OrderedDict[str, BookmarkSearchIndex]" = OrderedDict()
+
+def get_search_index(bookmarks: Sequence[Any], version_key: Optional[str] = None) -> BookmarkSearchIndex:
+    """Return the cached index for this collection version, building it on first use"""
+    key = version_key or collection_fingerprint(bookmarks)
+    index = _index_cache.get(key)
+    if index is not None:
+        _index_cache.move_to_end(key)
+        return index
+
+    index = BookmarkSearchIndex(bookmarks)
+    _index_cache[key] = index
+    while len(_index_cache) > MAX_CACHED_INDEXES:
+        _index_cache.popitem(last=False)
+    logger.info(f"Built search index for {index.doc_count} bookmarks ({len(index.vocabulary)} terms)")
+    return index
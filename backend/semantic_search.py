@@ -0,0 +1,199 @@
+"""
+Local semantic search over bookmark collections.
+
+Bookmarks are embedded with a dependency-light hashed TF-IDF vectorizer
+(word unigrams plus character trigrams, signed feature hashing) into a dense
+NumPy matrix. Queries are answered with a single matrix-vector product and a
+partial sort, so most searches need no network call. Indexes for stored
+collections are updated incrementally: only new or changed bookmarks are
+re-vectorized when the collection version changes.
+"""
+import os
+import zlib
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Sequence
+
+import numpy as np
+
+from search_index import tokenize, collection_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Vector dimensionality (memory is rows * dim * 4 bytes)
+SEMANTIC_DIM = int(os.getenv("PINPANDA_SEMANTIC_DIM", "512"))
+MAX_CACHED_SEMANTIC_INDEXES = 16
+
+# Relative weight of each feature family
+WORD_FEATURE_WEIGHT = 1.0
+TRIGRAM_FEATURE_WEIGHT = 0.4
+
+# Field weights applied to a bookmark's features
+FIELD_WEIGHTS = {
+    "title": 2.0,
+    "url": 1.0,
+    "category": 1.0,
+    "folder": 0.5,
+    "description": 1.0
+}
+
+# Tokens that carry no meaning in URLs
+_URL_STOPWORDS = {"http", "https", "www", "com", "org", "net", "html", "htm", "php", "index"}
+
+_feature_cache: Dict[str, Tuple[Tuple[int, ...], Tuple[float, ...]]] = {}
+_MAX_FEATURE_CACHE = 500000
+
+def _token_features(token: str) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+    """Hashed (bucket, signed weight) features for one token, memoized"""
+    cached = _feature_cache.get(token)
+    if cached is not None:
+        return cached
+
+    grams = [("w:" + token, WORD_FEATURE_WEIGHT)]
+    padded = f"^{token}$"
+    if len(padded) > 3:
+        grams.extend((padded[i:i + 3], TRIGRAM_FEATURE_WEIGHT) for i in range(len(padded) - 2))
+
+    buckets = []
+    weights = []
+    for gram, weight in grams:
+        h = zlib.crc32(gram.encode("utf-8"))
+        buckets.append(h % SEMANTIC_DIM)
+        # A separate hash bit picks the sign so collisions cancel out on average
+        weights.append(weight if (h >> 31) & 1 else -weight)
+
+    result = (tuple(buckets), tuple(weights))
+    if len(_feature_cache) < _MAX_FEATURE_CACHE:
+        _feature_cache[token] = result
+    return result
+
+def _bookmark_fields(bookmark: Any) -> List[Tuple[str, float]]:
+    return [
+        (bookmark.title or "", FIELD_WEIGHTS["title"]),
+        (bookmark.url or "", FIELD_WEIGHTS["url"]),
+        (bookmark.category or "", FIELD_WEIGHTS["category"]),
+        (getattr(bookmark, "folder", None) or "", FIELD_WEIGHTS["folder"]),
+        (bookmark.description or "", FIELD_WEIGHTS["description"])
+    ]
+
+def vectorize_texts(fields_per_row: Sequence[Sequence[Tuple[str, float]]]) -> np.ndarray:
+    """Raw (un-normalized) hashed term-frequency matrix for weighted text fields"""
+    rows: List[int] = []
+    cols: List[int] = []
+    vals: List[float] = []
+    for row, fields in enumerate(fields_per_row):
+        for text, field_weight in fields:
+            for token in tokenize(text):
+                if token in _URL_STOPWORDS:
+                    continue
+                buckets, weights = _token_features(token)
+                rows.extend([row] * len(buckets))
+                cols.extend(buckets)
+                vals.extend(w * field_weight for w in weights)
+
+    matrix = np.zeros((len(fields_per_row), SEMANTIC_DIM), dtype=np.float32)
+    if vals:
+        np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(vals, dtype=np.float32))
+    # Sublinear term frequency, keeping the hashing sign
+    np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+    return matrix
+
+def _row_key(bookmark: Any) -> str:
+    """Identity of a bookmark's searchable content"""
+    return (
+        f"{bookmark.id or ''}\x1f{bookmark.title}\x1f{bookmark.url}\x1f{bookmark.category or ''}"
+        f"\x1f{getattr(bookmark, 'folder', None) or ''}\x1f{bookmark.description or ''}"
+    )
+
+class SemanticIndex:
+    """Dense hashed TF-IDF vectors for one collection, updatable in place"""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.raw = np.zeros((0, SEMANTIC_DIM), dtype=np.float32)
+        self.idf = np.ones(SEMANTIC_DIM, dtype=np.float32)
+        self.matrix = self.raw
+        self.version_key: Optional[str] = None
+
+    def update(self, bookmarks: Sequence[Any], version_key: Optional[str] = None) -> int:
+        """
+        Bring the index in line with `bookmarks`, re-vectorizing only rows
+        whose content changed. Returns the number of rows vectorized.
+        """
+        new_keys = [_row_key(b) for b in bookmarks]
+        positions = {key: i for i, key in enumerate(self.keys)}
+
+        reuse_from = np.fromiter((positions.get(key, -1) for key in new_keys), dtype=np.int64, count=len(new_keys))
+        missing = np.flatnonzero(reuse_from < 0)
+
+        raw = np.empty((len(new_keys), SEMANTIC_DIM), dtype=np.float32)
+        reused = np.flatnonzero(reuse_from >= 0)
+        if len(reused):
+            raw[reused] = self.raw[reuse_from[reused]]
+        if len(missing):
+            raw[missing] = vectorize_texts([_bookmark_fields(bookmarks[i]) for i in missing])
+
+        self.keys = new_keys
+        self.raw = raw
+        self.version_key = version_key
+        self._reweight()
+        return len(missing)
+
+    def _reweight(self) -> None:
+        """Recompute IDF over hashed buckets and the normalized weighted matrix"""
+        doc_count = len(self.keys)
+        if doc_count:
+            df = np.count_nonzero(self.raw, axis=0).astype(np.float32)
+            self.idf = np.log((1.0 + doc_count) / (1.0 + df)).astype(np.float32) + 1.0
+        weighted = self.raw * self.idf
+        norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = weighted / norms
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[int, float]]:
+        """Return up to `limit` (collection index, cosine similarity) pairs, best first"""
+        if not self.keys:
+            return []
+        query_vector = vectorize_texts([[(query, 1.0)]])[0] * self.idf
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return []
+
+        scores = self.matrix @ (query_vector / norm)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+_semantic_indexes: "OrderedDict[str, SemanticIndex]" = OrderedDict()
+
+def get_semantic_index(
+    bookmarks: Sequence[Any],
+    version_key: Optional[str] = None
+) -> SemanticIndex:
+    """
+    Return an up-to-date semantic index for the collection.
+
+    Stored collections ("{collectionId}:{version}" keys) share one index per
+    collection that is updated incrementally as versions change; ad-hoc
+    bookmark lists are indexed by content fingerprint.
+    """
+    if version_key:
+        cache_key = version_key.rsplit(":", 1)[0]
+    else:
+        version_key = collection_fingerprint(bookmarks)
+        cache_key = version_key
+
+    index = _semantic_indexes.get(cache_key)
+    if index is None:
+        index = SemanticIndex()
+        _semantic_indexes[cache_key] = index
+        while len(_semantic_indexes) > MAX_CACHED_SEMANTIC_INDEXES:
+            _semantic_indexes.popitem(last=False)
+    else:
+        _semantic_indexes.move_to_end(cache_key)
+
+    if index.version_key != version_key:
+        vectorized = index.update(bookmarks, version_key)
+        logger.info(f"Semantic index {cache_key[:16]}: vectorized {vectorized} of {len(bookmarks)} bookmarks")
+    return index
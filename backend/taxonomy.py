@@ -0,0 +1,188 @@
+"""
+Global taxonomy for two-phase categorization.
+
+Phase one asks the model for a category tree from a representative sample
+of the collection. Phase two assigns every chunk against that fixed list.
+The model answers with category ids mapped to bookmark indices instead of
+inventing names, so responses are small, every chunk can run in parallel,
+and all chunks share one consistent set of categories.
+"""
+import os
+import random
+from urllib.parse import urlsplit
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+from category_merge import format_category_path, _coerce_index
+from prompt_encoding import encode_bookmarks, format_description
+
+# "chunked" categorizes each chunk independently; "global" derives one taxonomy first
+DEFAULT_TAXONOMY_MODE = os.getenv("PINPANDA_TAXONOMY_MODE", "chunked")
+# Bookmarks shown to the model when deriving the taxonomy (capped further by the token budget)
+TAXONOMY_SAMPLE_SIZE = int(os.getenv("PINPANDA_TAXONOMY_SAMPLE_SIZE", "300"))
+# Catch-all for bookmarks that fit none of the derived categories
+FALLBACK_CATEGORY = "Other"
+# Previously cached category names offered for reuse
+MAX_EXISTING_CATEGORIES = 50
+
+TAXONOMY_FIELDS = ("title", "url", "folder")
+
+DEPTH_INSTRUCTIONS = {
+    "simple": "Create 5-8 broad main categories and no subcategories.",
+    "balanced": "Create 6-10 main categories with 1-4 subcategories where a main category is large (10-25 categories in total).",
+    "detailed": "Create 8-12 main categories with specific subcategories for precise organization (20-40 categories in total)."
+}
+
+TAXONOMY_SYSTEM_PROMPT = """
+You are a professional bookmark organization expert. Design a clean, intuitive folder hierarchy for a user's whole bookmark collection from a representative sample of it.
+
+Return ONLY a valid JSON object mapping each main category to a list of its subcategories:
+{
+  "Main Category 1": ["Subcategory 1A", "Subcategory 1B"],
+  "Main Category 2": []
+}
+
+Use clear, descriptive title-case names, group by theme and purpose, keep categories balanced, and make the hierarchy general enough that bookmarks not in the sample also fit.
+"""
+
+ASSIGNMENT_SYSTEM_PROMPT = """
+You assign bookmarks to a fixed list of categories. Use only the category ids you are given; never invent categories. Choose the most specific category that fits; use the catch-all category only when nothing else fits.
+
+Return ONLY a valid JSON object mapping category ids to the indices of the bookmarks in that category, for example:
+{"3": [0, 4, 5], "7": [1, 2], "12": [3]}
+
+Every bookmark index must appear exactly once.
+"""
+
+class Taxonomy:
+    """Fixed category list with numeric ids (1-based)"""
+
+    def __init__(self, tree: Dict[str, List[str]]):
+        self.paths: List[Tuple[str, Optional[str]]] = []
+        for main, subs in tree.items():
+            self.paths.append((main, None))
+            self.paths.extend((main, sub) for sub in subs)
+        if not any(main == FALLBACK_CATEGORY and sub is None for main, sub in self.paths):
+            self.paths.append((FALLBACK_CATEGORY, None))
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def to_tree(self) -> Dict[str, List[str]]:
+        """The {main: [subs]} form the taxonomy was built from"""
+        tree: Dict[str, List[str]] = {}
+        for main, sub in self.paths:
+            subs = tree.setdefault(main, [])
+            if sub is not None:
+                subs.append(sub)
+        return tree
+
+    def category_paths(self) -> List[str]:
+        return [format_category_path(main, sub) for main, sub in self.paths]
+
+    def format_for_prompt(self) -> str:
+        return "\n".join(f"{i}={path}" for i, path in enumerate(self.category_paths(), start=1))
+
+    def to_batch_result(self, assignment: Any) -> Dict[str, Any]:
+        """Convert an id -> indices response to the nested format CategoryMerger expects"""
+        result: Dict[str, Any] = {}
+        if not isinstance(assignment, dict):
+            return result
+        for raw_id, indices in assignment.items():
+            category_id = _coerce_index(raw_id)
+            if category_id is None or not 1 <= category_id <= len(self.paths) or not isinstance(indices, list):
+                continue
+            main, sub = self.paths[category_id - 1]
+            entry = result.setdefault(main, {"bookmarks": [], "subcategories": {}})
+            if sub is None:
+                entry["bookmarks"].extend(indices)
+            else:
+                entry["subcategories"].setdefault(sub, []).extend(indices)
+        return result
+
+def parse_taxonomy(response: Any, max_categories: int = 60) -> Optional[Taxonomy]:
+    """Build a Taxonomy from the model's {main: [subs]} object, or None if unusable"""
+    if not isinstance(response, dict):
+        return None
+    tree: Dict[str, List[str]] = {}
+    count = 0
+    for main, subs in response.items():
+        main = " ".join(str(main).split())
+        if not main or count >= max_categories:
+            continue
+        # Tolerate the nested {"bookmarks", "subcategories"} shape of the chunked prompt
+        if isinstance(subs, dict):
+            subs = list((subs.get("subcategories") or {}).keys())
+        names = []
+        for sub in subs if isinstance(subs, list) else []:
+            sub = " ".join(str(sub).split())
+            if sub and sub not in names:
+                names.append(sub)
+        tree.setdefault(main, [])
+        tree[main].extend(n for n in names if n not in tree[main])
+        count += 1 + len(names)
+    return Taxonomy(tree) if tree else None
+
+def select_taxonomy_sample(bookmarks: Sequence[Any], size: int = TAXONOMY_SAMPLE_SIZE) -> List[int]:
+    """
+    Indices of a representative sample: bookmarks are bucketed by folder and
+    domain, and buckets are drawn from round-robin (largest first) so every
+    theme is represented before any is repeated.
+    """
+    if len(bookmarks) <= size:
+        return list(range(len(bookmarks)))
+
+    buckets: Dict[Tuple[str, str], List[int]] = {}
+    for index, bookmark in enumerate(bookmarks):
+        try:
+            host = urlsplit(bookmark.url).netloc.lower()
+        except ValueError:
+            host = ""
+        buckets.setdefault((bookmark.folder or "", host), []).append(index)
+
+    # Shuffle within buckets (deterministically) so repeated draws spread across each one
+    rng = random.Random(0)
+    ordered = sorted(buckets.values(), key=len, reverse=True)
+    for members in ordered:
+        rng.shuffle(members)
+
+    picked: List[int] = []
+    for round_index in range(len(ordered[0])):
+        for members in ordered:
+            if round_index < len(members):
+                picked.append(members[round_index])
+                if len(picked) >= size:
+                    return sorted(picked)
+    return sorted(picked)
+
+def create_taxonomy_prompt(
+    sample: Sequence[Any],
+    total: int,
+    depth: str,
+    existing_categories: Sequence[str] = ()
+) -> str:
+    instruction = DEPTH_INSTRUCTIONS.get(depth, DEPTH_INSTRUCTIONS["balanced"])
+    existing = ""
+    if existing_categories:
+        existing = (
+            "\nThe user already has these categories from earlier runs; reuse them where they fit:\n"
+            + "\n".join(f"- {name}" for name in existing_categories[:MAX_EXISTING_CATEGORIES]) + "\n"
+        )
+    return f"""
+Here is a representative sample of {len(sample)} out of {total} bookmarks. {format_description(TAXONOMY_FIELDS)}
+
+{encode_bookmarks(sample, TAXONOMY_FIELDS)}
+{existing}
+{instruction}
+
+Return ONLY the JSON object of main categories and their subcategories."""
+
+def create_assignment_prompt(bookmarks: Sequence[Any], taxonomy: Taxonomy) -> str:
+    return f"""
+Categories (id=name):
+{taxonomy.format_for_prompt()}
+
+Here are {len(bookmarks)} bookmarks to assign. {format_description(TAXONOMY_FIELDS)}
+
+{encode_bookmarks(bookmarks, TAXONOMY_FIELDS)}
+
+Return ONLY the JSON object mapping category ids to bookmark indices."""
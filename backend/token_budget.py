@@ -0,0 +1,193 @@
+"""
+Token accounting for categorization requests.
+
+count_tokens() uses tiktoken when it is installed. Otherwise it falls back to
+a heuristic that mirrors the BPE pre-tokenizer (words, digit groups,
+punctuation runs, whitespace). The heuristic is calibrated at runtime against
+the prompt_tokens that the API reports.
+
+pack_chunks() splits per-item token costs into as few contiguous chunks as
+fit the budget, then evens them out so no chunk is left nearly empty.
+"""
+import os
+import re
+import math
+import logging
+import threading
+from typing import List, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Completion budget requested per categorization call
+RESPONSE_MAX_TOKENS = int(os.getenv("PINPANDA_RESPONSE_MAX_TOKENS", "4000"))
+# Upper bound on prompt tokens per chunk; smaller chunks run in parallel and keep answers reliable
+CHUNK_MAX_INPUT_TOKENS = int(os.getenv("PINPANDA_CHUNK_MAX_INPUT_TOKENS", "16000"))
+# Fraction of each budget actually filled, leaving room for estimation error
+CHUNK_FILL_RATIO = float(os.getenv("PINPANDA_CHUNK_FILL_RATIO", "0.9"))
+
+# Expected completion size: category names plus roughly one index and separator per bookmark
+OUTPUT_TOKENS_PER_BOOKMARK = 2.0
+OUTPUT_OVERHEAD_TOKENS = 400
+
+# Chat format framing per message and per request
+MESSAGE_OVERHEAD_TOKENS = 4
+REQUEST_OVERHEAD_TOKENS = 3
+
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385
+}
+DEFAULT_CONTEXT_WINDOW = 16385
+
+# USD per million (prompt, completion) tokens, for cost estimates only
+MODEL_PRICES_PER_MILLION: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-3.5-turbo": (0.50, 1.50)
+}
+
+# Mirrors the cl100k/o200k pre-tokenizer closely enough for estimation
+_PIECE_PATTERN = re.compile(
+    r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+"
+)
+
+_encoders: Dict[str, object] = {}
+
+def _encoder_for(model: str):
+    encoder = _encoders.get(model)
+    if encoder is None:
+        try:
+            encoder = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoder = tiktoken.get_encoding("cl100k_base")
+        _encoders[model] = encoder
+    return encoder
+
+def _heuristic_tokens(text: str) -> int:
+    tokens = 0
+    for piece in _PIECE_PATTERN.findall(text):
+        word = piece.lstrip(" ")
+        if not word or word.isspace():
+            tokens += 1
+        elif word[0].isdigit():
+            tokens += 1
+        elif word[0].isalpha() or word[0] == "_":
+            if not word.isascii():
+                tokens += len(word)
+            elif len(word) <= 6:
+                tokens += 1
+            else:
+                tokens += math.ceil(len(word) / 4.5)
+        else:
+            tokens += math.ceil(len(word) / 2)
+    return tokens
+
+class _Calibration:
+    """Running ratio of reported to estimated prompt tokens"""
+
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self.factor = 1.0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def record(self, estimated: int, actual: int) -> None:
+        if estimated <= 0 or actual <= 0:
+            return
+        ratio = min(1.5, max(0.6, actual / estimated))
+        with self._lock:
+            self.factor = ratio if self.samples == 0 else self.factor + self.smoothing * (ratio - self.factor)
+            self.samples += 1
+
+calibration = _Calibration()
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Tokens in `text` for the given model (exact with tiktoken, calibrated estimate otherwise)"""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_encoder_for(model).encode(text, disallowed_special=()))
+    return math.ceil(_heuristic_tokens(text) * calibration.factor)
+
+def record_prompt_usage(estimated_tokens: int, usage: Optional[Dict[str, int]]) -> None:
+    """Feed the API-reported prompt size back into the heuristic estimator"""
+    if tiktoken is not None or not usage:
+        return
+    actual = usage.get("prompt_tokens")
+    if actual:
+        calibration.record(estimated_tokens, actual)
+
+def chat_prompt_tokens(messages: Sequence[str], model: str = "gpt-4o-mini") -> int:
+    """Prompt tokens for a list of chat message contents, including message framing"""
+    return REQUEST_OVERHEAD_TOKENS + sum(count_tokens(m, model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+def input_token_budget(model: str) -> int:
+    """Prompt tokens available per chunk for a model"""
+    context = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    return int(min(CHUNK_MAX_INPUT_TOKENS, context - RESPONSE_MAX_TOKENS) * CHUNK_FILL_RATIO)
+
+def max_items_per_response() -> int:
+    """Bookmarks whose indices fit in one completion"""
+    usable = RESPONSE_MAX_TOKENS * CHUNK_FILL_RATIO - OUTPUT_OVERHEAD_TOKENS
+    return max(1, int(usable / OUTPUT_TOKENS_PER_BOOKMARK))
+
+def estimate_completion_tokens(items: int) -> int:
+    """Expected completion size of a categorization call for `items` bookmarks"""
+    return min(RESPONSE_MAX_TOKENS, OUTPUT_OVERHEAD_TOKENS + math.ceil(items * OUTPUT_TOKENS_PER_BOOKMARK))
+
+def estimate_cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Approximate price of the given usage, or None for models without a known price"""
+    prices = MODEL_PRICES_PER_MILLION.get(model)
+    if prices is None:
+        return None
+    return round((prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000, 4)
+
+def pack_chunks(costs: Sequence[int], budget: int, max_items: int) -> List[int]:
+    """
+    Split items with the given token costs into contiguous chunks whose total
+    cost stays within `budget` and item count within `max_items`. Uses the
+    minimum number of chunks, balanced by cost. Returns the chunk sizes.
+    An item costlier than the budget gets a chunk of its own.
+    """
+    # Greedy next-fit gives the minimum chunk count for contiguous chunks
+    greedy: List[int] = []
+    used = 0
+    count = 0
+    for cost in costs:
+        if count and (used + cost > budget or count >= max_items):
+            greedy.append(count)
+            used = 0
+            count = 0
+        used += cost
+        count += 1
+    if count:
+        greedy.append(count)
+    if len(greedy) <= 1:
+        return greedy
+
+    # Re-cut at even cost targets so chunks are equally full
+    chunk_count = len(greedy)
+    target = sum(costs) / chunk_count
+    balanced: List[int] = []
+    used = 0
+    count = 0
+    cumulative = 0.0
+    for cost in costs:
+        boundary = target * (len(balanced) + 1)
+        if count and len(balanced) < chunk_count - 1 and cumulative + cost / 2 > boundary:
+            balanced.append(count)
+            used = 0
+            count = 0
+        used += cost
+        cumulative += cost
+        count += 1
+        if used > budget or count > max_items:
+            return greedy
+    balanced.append(count)
+    return balanced
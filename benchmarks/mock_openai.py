@@ -0,0 +1,225 @@
+"""
+Local stand-in for the OpenAI /v1/chat/completions endpoint.
+
+Answers every prompt the backend sends (categorization, taxonomy derivation,
+taxonomy assignment, intent detection, search reranking, chat) with a
+well-formed response derived from the prompt, streamed or not as requested,
+after a configurable delay. A configurable share of requests fails with
+429/500/503 so retry handling is part of what gets measured.
+
+Point the backend at it with OPENAI_BASE_URL:
+
+    python benchmarks/mock_openai.py --port 8099 --latency-ms 300 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 python backend/main.py
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CATEGORIES = {
+    "Development": ["Python", "Web", "DevOps"],
+    "News": [],
+    "Cooking": ["Recipes"],
+    "Travel": ["Trips", "Bookings"],
+    "Finance": ["Investing"],
+    "Entertainment": ["Music", "Video"],
+    "Learning": ["Courses", "Papers"]
+}
+ERROR_STATUSES = (429, 500, 503)
+
+_ROW = re.compile(r"^(\d+)\|(.*)$", re.M)
+_JSON_INDEX = re.compile(r'"index":\s*(\d+)')
+_CATEGORY_ID = re.compile(r"^(\d+)=", re.M)
+
+class MockSettings:
+    def __init__(
+        self,
+        latency_ms: float = 200.0,
+        jitter: float = 0.3,
+        error_rate: float = 0.0,
+        chunk_ms: float = 2.0,
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        # Latency varies uniformly by +/- this fraction
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Delay between streamed chunks
+        self.chunk_ms = chunk_ms
+        self.rng = random.Random(seed)
+
+def _bucket(text: str, buckets: int) -> int:
+    return zlib.crc32(text.encode("utf-8")) % buckets
+
+def _bookmark_rows(prompt: str) -> List[tuple]:
+    rows = [(int(index), text) for index, text in _ROW.findall(prompt)]
+    if rows:
+        return rows
+    return [(int(index), "") for index in _JSON_INDEX.findall(prompt)]
+
+def _categorize(prompt: str) -> Dict[str, Any]:
+    mains = list(CATEGORIES)
+    result: Dict[str, Any] = {}
+    for index, text in _bookmark_rows(prompt):
+        main = mains[_bucket(text or str(index), len(mains))]
+        entry = result.setdefault(main, {"bookmarks": [], "subcategories": {}})
+        subs = CATEGORIES[main]
+        if subs:
+            entry["subcategories"].setdefault(subs[_bucket(text[::-1], len(subs))], []).append(index)
+        else:
+            entry["bookmarks"].append(index)
+    return result
+
+def _assign(prompt: str) -> Dict[str, List[int]]:
+    header, _, bookmarks = prompt.partition("bookmarks to assign")
+    ids = _CATEGORY_ID.findall(header) or ["1"]
+    result: Dict[str, List[int]] = {}
+    for index, text in _bookmark_rows(bookmarks):
+        result.setdefault(ids[_bucket(text or str(index), len(ids))], []).append(index)
+    return result
+
+def answer(system: str, prompt: str) -> str:
+    """Response content for one request, chosen by what the prompt asks for"""
+    if "Design a clean" in system:
+        return json.dumps(CATEGORIES)
+    if "fixed list of categories" in system:
+        return json.dumps(_assign(prompt))
+    if "determine the intent" in prompt:
+        return json.dumps({"intent": "search", "confidence": 0.8, "entities": {"query": prompt[-80:]}})
+    if "Return format: [1, 5" in prompt:
+        rows = _bookmark_rows(prompt)
+        return json.dumps([index for index, _ in rows[:20]])
+    if system and "bookmark" in system.lower() and "JSON" in system:
+        return json.dumps(_categorize(prompt))
+    return "Here is what I found in your bookmarks. " + " ".join(prompt.split()[:40])
+
+def _usage(messages: List[Dict[str, Any]], content: str) -> Dict[str, int]:
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+def create_app(settings: MockSettings) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI")
+    app.state.settings = settings
+    app.state.counts = Counter()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counts = app.state.counts
+        counts["requests"] += 1
+        messages = body.get("messages") or []
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        prompt = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+
+        delay = settings.latency_ms * (1 + settings.rng.uniform(-settings.jitter, settings.jitter)) / 1000.0
+        await asyncio.sleep(max(0.0, delay))
+
+        if settings.rng.random() < settings.error_rate:
+            status = settings.rng.choice(ERROR_STATUSES)
+            counts[f"errors_{status}"] += 1
+            headers = {"retry-after-ms": "200"} if status == 429 else None
+            return JSONResponse({"error": {"message": "Mock failure", "type": "mock"}}, status_code=status, headers=headers)
+
+        content = answer(system, prompt)
+        usage = _usage(messages, content)
+        model = body.get("model", "mock")
+        created = int(time.time())
+
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            }
+
+        async def events():
+            def event(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> bytes:
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    **extra
+                }
+                return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+            yield event({"role": "assistant", "content": ""})
+            # Roughly 16 tokens per chunk
+            for start in range(0, len(content), 64):
+                if settings.chunk_ms:
+                    await asyncio.sleep(settings.chunk_ms / 1000.0)
+                yield event({"content": content[start:start + 64]})
+            yield event({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({'id': 'chatcmpl-mock', 'choices': [], 'usage': usage})}\n\n".encode("utf-8")
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        return dict(app.state.counts)
+
+    return app
+
+class BackgroundServer:
+    """Runs an ASGI app with uvicorn on a background thread"""
+
+    def __init__(self, app: Any, host: str = "127.0.0.1", port: int = 0):
+        self.config = uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(self.config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "BackgroundServer":
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("Server did not start")
+            time.sleep(0.02)
+        return self
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter", type=float, default=0.3, help="latency varies by +/- this fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429/500/503")
+    parser.add_argument("--chunk-ms", type=float, default=2.0, help="delay between streamed chunks")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    settings = MockSettings(args.latency_ms, args.jitter, args.error_rate, args.chunk_ms, args.seed)
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
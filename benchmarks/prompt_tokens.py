@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Compare prompt size per bookmark for the json and compact prompt encodings.
+
+Builds a synthetic collection and renders the categorization and search
+reranking prompts both ways, reporting tokens per bookmark (exact with
+tiktoken installed, calibrated estimate otherwise).
+
+    python benchmarks/prompt_tokens.py --bookmarks 2000 --json
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from token_budget import count_tokens, tiktoken  # noqa: E402
+from prompt_encoding import encode_bookmarks  # noqa: E402
+
+HOSTS = [
+    "github.com", "www.youtube.com", "docs.python.org", "stackoverflow.com", "medium.com",
+    "www.nytimes.com", "en.wikipedia.org", "www.amazon.com", "news.ycombinator.com", "developer.mozilla.org"
+]
+WORDS = (
+    "python async guide tutorial react hooks recipe travel budget invest kubernetes deploy "
+    "design pattern review news science history music video course learn best tips home garden"
+).split()
+FOLDERS = ["Bookmarks Bar", "Dev/Python", "Dev/Web", "Reading List", "Travel", "Finance", "Recipes", "Music"]
+
+class SyntheticBookmark:
+    def __init__(self, title, url, folder, category, description):
+        self.title = title
+        self.url = url
+        self.folder = folder
+        self.category = category
+        self.description = description
+
+def synthetic_bookmarks(count, seed=7):
+    rng = random.Random(seed)
+    bookmarks = []
+    for i in range(count):
+        words = rng.sample(WORDS, rng.randint(3, 8))
+        path = "/".join(rng.sample(WORDS, rng.randint(1, 3)))
+        query = f"?utm_source=newsletter&utm_medium=email&id={rng.randint(1, 10**6)}" if rng.random() < 0.4 else ""
+        bookmarks.append(SyntheticBookmark(
+            title=" ".join(words).title(),
+            url=f"https://{rng.choice(HOSTS)}/{path}/{i}{query}",
+            # Exports list bookmarks folder by folder
+            folder=FOLDERS[i * len(FOLDERS) // count],
+            category=rng.choice(["Technology", "Travel", "Finance", "Cooking", "Entertainment"]),
+            description=" ".join(rng.sample(WORDS, 6)) if rng.random() < 0.3 else ""
+        ))
+    return bookmarks
+
+def measure(bookmarks, fields, model):
+    results = {}
+    for encoding in ("json", "compact"):
+        tokens = count_tokens(encode_bookmarks(bookmarks, fields, encoding), model)
+        results[encoding] = {"tokens": tokens, "tokensPerBookmark": round(tokens / len(bookmarks), 2)}
+    results["reduction"] = round(1 - results["compact"]["tokens"] / results["json"]["tokens"], 3)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bookmarks", type=int, default=1000)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    bookmarks = synthetic_bookmarks(args.bookmarks)
+    report = {
+        "bookmarks": args.bookmarks,
+        "tokenizer": "tiktoken" if tiktoken is not None else "heuristic",
+        "categorization": measure(bookmarks, ("title", "url", "folder"), args.model),
+        "search": measure(bookmarks[:100], ("title", "url", "category", "description"), args.model)
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.bookmarks} bookmarks, {report['tokenizer']} token counts")
+    for name in ("categorization", "search"):
+        result = report[name]
+        print(
+            f"  {name:15s} json {result['json']['tokensPerBookmark']:6.2f} tok/bookmark"
+            f"  compact {result['compact']['tokensPerBookmark']:6.2f} tok/bookmark"
+            f"  ({result['reduction']:.0%} fewer)"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Backend benchmark suite with machine-readable results.
+
+Micro benchmarks time request decoding (with its peak memory),
+chunk_bookmarks, find_duplicate_bookmarks, perform_keyword_search,
+generate_bookmark_stats and stored-collection stats queries on synthetic
+collections of each size, and check local intent classification on held-out
+phrasings. End-to-end benchmarks run the API with uvicorn
+against the mock OpenAI server (benchmarks/mock_openai.py) and measure
+/api/reorganize job latency and throughput, and /api/chat request latency
+under concurrency.
+
+    python benchmarks/run_benchmarks.py --sizes 1000,10000,100000 --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json --tolerance 0.25
+
+With --baseline the run exits with status 1 when a p50 latency or peak
+memory grew, or a throughput shrank, by more than the tolerance.
+"""
+import os
+import sys
+import gzip
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+import platform
+import argparse
+import tempfile
+import importlib
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import httpx
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "backend"))
+
+from synthetic import generate_collection  # noqa: E402
+from mock_openai import MockSettings, BackgroundServer, create_app  # noqa: E402
+from request_decoding import JSON_DECODER, decode_body, loads  # noqa: E402
+from intent_classifier import HELD_OUT_EXAMPLES  # noqa: E402
+
+RESULT_FORMAT_VERSION = 1
+FINISHED = ("completed", "error", "cancelled")
+
+SEARCH_QUERIES = [
+    "python async", "sourdough bread recipe", "japan itinerary", "index funds retirement",
+    "kubernetes deploy", "concert live music", "machine learning paper", "budget flights hotel"
+]
+CHAT_MESSAGES = [
+    "find my {topic} bookmarks",
+    "show me anything about {topic}",
+    "how many duplicates do I have",
+    "give me stats about my collection",
+    "that {topic} page from last spring",
+    "search {topic}"
+]
+CHAT_TOPICS = ["python", "react hooks", "sourdough", "japan", "retirement", "podcast", "physics", "docker"]
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(samples: List[float], **extra: Any) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    summary = {
+        "unit": "s",
+        "n": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 6) if ordered else 0.0,
+        "min": round(ordered[0], 6) if ordered else 0.0,
+        "p50": round(percentile(ordered, 0.50), 6),
+        "p95": round(percentile(ordered, 0.95), 6),
+        "p99": round(percentile(ordered, 0.99), 6),
+        "max": round(ordered[-1], 6) if ordered else 0.0
+    }
+    summary.update(extra)
+    return summary
+
+def timed(function, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def peak_memory_mb(function) -> float:
+    """Peak Python heap growth while `function` runs"""
+    tracemalloc.start()
+    try:
+        function()
+        return round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+    finally:
+        tracemalloc.stop()
+
+def run_micro_benchmarks(backend: Any, sizes: List[int], repeat: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for size in sizes:
+        collection = generate_collection(size)
+        bookmarks = [backend.Bookmark(**data) for data in collection]
+        print(f"  {size} bookmarks", file=sys.stderr)
+
+        # A gzipped /api/reorganize body to a validated request, as the route decodes it
+        body = gzip.compress(json.dumps({"bookmarks": collection, "apiKey": "sk-bench", "sessionId": "bench"}).encode("utf-8"))
+        def decode_request(body=body):
+            return backend.ReorganizeRequest.model_validate(loads(decode_body(body, "gzip")))
+
+        results[f"decode_reorganize_request/{size}"] = summarize(
+            timed(decode_request, repeat),
+            peakMemoryMb=peak_memory_mb(decode_request),
+            jsonDecoder=JSON_DECODER
+        )
+
+        results[f"chunk_bookmarks/{size}"] = summarize(
+            timed(lambda: backend.chunk_bookmarks(bookmarks), repeat)
+        )
+        results[f"find_duplicate_bookmarks/{size}"] = summarize(
+            timed(lambda: backend.find_duplicate_bookmarks(bookmarks), repeat)
+        )
+
+        # Index build (a new version key each time) and queries against the cached index
+        build_keys = iter(range(repeat))
+        results[f"perform_keyword_search.build/{size}"] = summarize(timed(
+            lambda: backend.perform_keyword_search(SEARCH_QUERIES[0], bookmarks, f"bench-build-{size}-{next(build_keys)}"),
+            repeat
+        ))
+        queries = iter(SEARCH_QUERIES * repeat * 4)
+        results[f"perform_keyword_search/{size}"] = summarize(timed(
+            lambda: backend.perform_keyword_search(next(queries), bookmarks, f"bench-{size}"),
+            len(SEARCH_QUERIES) * repeat * 4
+        ))
+
+        results[f"generate_bookmark_stats/{size}"] = summarize(
+            timed(lambda: asyncio.run(backend.generate_bookmark_stats(bookmarks)), repeat)
+        )
+
+        # Analytics of a stored collection, maintained incrementally and read per query
+        collection = backend.collection_store.create(list(bookmarks))
+        stats, _ = backend.collection_store.get_stats(collection.id)
+        results[f"collection_stats.breakdown/{size}"] = summarize(timed(stats.breakdown, repeat * 20))
+        backend.collection_store.delete(collection.id)
+
+    # Local intent answers on phrasings outside the training set: the ones that clear
+    # the chat's threshold (and skip the LLM) should all be right
+    held_out = HELD_OUT_EXAMPLES
+    answers = [backend.classify_intent(message) for message, _ in held_out]
+    local = [
+        (answer["intent"], expected) for answer, (_, expected) in zip(answers, held_out)
+        if answer["confidence"] >= backend.INTENT_CONFIDENCE_THRESHOLD
+    ]
+    messages = iter([message for message, _ in held_out] * repeat * 20)
+    results["classify_intent/held_out"] = summarize(
+        timed(lambda: backend.classify_intent(next(messages)), len(held_out) * repeat * 20),
+        localShare=round(len(local) / len(held_out), 4),
+        localAccuracy=round(sum(intent == expected for intent, expected in local) / len(local), 4) if local else 1.0
+    )
+    return results
+
+async def _upload(client: httpx.AsyncClient, collection: List[Dict[str, Any]]) -> str:
+    response = await client.post("/api/collections", json={"bookmarks": collection})
+    response.raise_for_status()
+    return response.json()["collectionId"]
+
+async def _run_reorganization(client: httpx.AsyncClient, payload: Dict[str, Any], poll_seconds: float) -> Dict[str, Any]:
+    started = time.perf_counter()
+    response = await client.post("/api/reorganize", json=payload)
+    response.raise_for_status()
+    while True:
+        await asyncio.sleep(poll_seconds)
+        progress = (await client.get(f"/api/progress/{payload['sessionId']}")).json()
+        if progress.get("status") in FINISHED:
+            progress["elapsed"] = time.perf_counter() - started
+            return progress
+
+async def benchmark_reorganize(client: httpx.AsyncClient, args: argparse.Namespace) -> Dict[str, Any]:
+    collection = generate_collection(args.e2e_bookmarks, seed=11)
+    collection_id = await _upload(client, collection)
+    payloads = [{
+        "collectionId": collection_id,
+        "apiKey": f"sk-bench-{job % args.api_keys}",
+        "sessionId": f"bench-reorganize-{job}-{int(time.time() * 1000)}",
+        "model": "gpt-4o-mini",
+        "categorizationDepth": "balanced",
+        "useCache": False,
+        "useLocalClassifier": args.local_classifier,
+        "taxonomyMode": args.taxonomy_mode
+    } for job in range(args.reorganize_jobs)]
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(_run_reorganization(client, payload, 0.05) for payload in payloads))
+    wall = time.perf_counter() - started
+
+    completed = [o for o in outcomes if o.get("status") == "completed"]
+    return summarize(
+        [o["elapsed"] for o in outcomes],
+        bookmarks=args.e2e_bookmarks,
+        jobs=len(outcomes),
+        failedJobs=len(outcomes) - len(completed),
+        chunks=sum(o.get("totalBatches", 0) for o in completed),
+        retriedChunks=sum(o.get("retriedChunks", 0) for o in outcomes),
+        failedChunks=sum(o.get("failedChunks", 0) for o in outcomes),
+        throughput=round(args.e2e_bookmarks * len(completed) / wall, 2),
+        throughputUnit="bookmarks/s"
+    )
+
+async def benchmark_chat(client: httpx.AsyncClient, args: argparse.Namespace) -> Dict[str, Any]:
+    collection_id = await _upload(client, generate_collection(args.e2e_bookmarks, seed=13))
+    rng = random.Random(3)
+    messages = [
+        rng.choice(CHAT_MESSAGES).format(topic=rng.choice(CHAT_TOPICS)) + rng.choice(["", "?", " please"])
+        for _ in range(args.chat_requests)
+    ]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    samples: List[float] = []
+    errors = 0
+
+    async def send(message: str) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/api/chat", json={
+                "message": message,
+                "collectionId": collection_id,
+                "apiKey": "sk-bench",
+                "searchMode": args.search_mode
+            })
+            samples.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(message) for message in messages))
+    wall = time.perf_counter() - started
+    return summarize(
+        samples,
+        errors=errors,
+        concurrency=args.concurrency,
+        throughput=round(len(samples) / wall, 2),
+        throughputUnit="requests/s"
+    )
+
+async def run_end_to_end(app: Any, mock_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    with BackgroundServer(app) as server:
+        async with httpx.AsyncClient(base_url=server.url, timeout=600) as client:
+            results = {
+                f"api_reorganize/{args.e2e_bookmarks}": await benchmark_reorganize(client, args),
+                "api_chat": await benchmark_chat(client, args)
+            }
+        async with httpx.AsyncClient(base_url=mock_url) as client:
+            results["mock_openai"] = (await client.get("/mock/stats")).json()
+    return results
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of the current results against a baseline run"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not isinstance(previous, dict) or current.get("unit") != "s":
+            continue
+        if previous.get("p50") and current["p50"] > previous["p50"] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {previous['p50']:.4f}s -> {current['p50']:.4f}s")
+        if previous.get("throughput") and current.get("throughput", 0) < previous["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {previous['throughput']} -> {current.get('throughput', 0)} {current.get('throughputUnit', '')}"
+            )
+        if previous.get("peakMemoryMb") and current.get("peakMemoryMb", 0) > previous["peakMemoryMb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {previous['peakMemoryMb']}MB -> {current['peakMemoryMb']}MB")
+        if "localAccuracy" in current and current["localAccuracy"] < previous.get("localAccuracy", 1.0):
+            regressions.append(f"{name}: local accuracy {previous.get('localAccuracy', 1.0)} -> {current['localAccuracy']}")
+    return regressions
+
+def print_table(results: Dict[str, Any]) -> None:
+    for name, result in results.items():
+        if result.get("unit") != "s":
+            continue
+        line = f"  {name:42s} p50 {result['p50'] * 1000:10.2f} ms  p95 {result['p95'] * 1000:10.2f} ms  n={result['n']}"
+        if "throughput" in result:
+            line += f"  {result['throughput']} {result['throughputUnit']}"
+        if "peakMemoryMb" in result:
+            line += f"  peak {result['peakMemoryMb']} MB"
+        if "localAccuracy" in result:
+            line += f"  local {result['localShare']:.0%} at {result['localAccuracy']:.0%} accuracy"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated collection sizes for micro benchmarks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument("--e2e-bookmarks", type=int, default=2000)
+    parser.add_argument("--reorganize-jobs", type=int, default=3, help="concurrent reorganization jobs")
+    parser.add_argument("--api-keys", type=int, default=1, help="distinct API keys the jobs are spread over")
+    parser.add_argument("--taxonomy-mode", default="chunked", choices=["chunked", "global"])
+    parser.add_argument("--local-classifier", action="store_true", help="let jobs resolve bookmarks locally")
+    parser.add_argument("--chat-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrent /api/chat requests")
+    parser.add_argument("--search-mode", default="auto", choices=["auto", "local", "ai"])
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="mock OpenAI response latency")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of mock OpenAI requests that fail")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency_ms, error_rate=args.error_rate, seed=1)
+    mock = BackgroundServer(create_app(settings)).__enter__() if not args.skip_e2e else None
+    # The backend reads its configuration at import time
+    if mock is not None:
+        os.environ["OPENAI_BASE_URL"] = f"{mock.url}/v1"
+    work_dir = tempfile.mkdtemp(prefix="pinpanda-bench-")
+    os.environ.setdefault("PINPANDA_CACHE_PATH", os.path.join(work_dir, "cache.db"))
+    os.environ.setdefault("PINPANDA_JOB_STORE_PATH", os.path.join(work_dir, "jobs.db"))
+    backend = importlib.import_module("main")
+    logging.disable(logging.WARNING)
+
+    results: Dict[str, Any] = {}
+    try:
+        if not args.skip_micro:
+            print("Micro benchmarks", file=sys.stderr)
+            results.update(run_micro_benchmarks(backend, [int(s) for s in args.sizes.split(",") if s], args.repeat))
+        if mock is not None:
+            print("End-to-end benchmarks", file=sys.stderr)
+            results.update(asyncio.run(run_end_to_end(backend.app, mock.url, args)))
+    finally:
+        if mock is not None:
+            mock.__exit__(None, None, None)
+
+    report = {
+        "version": RESULT_FORMAT_VERSION,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "mockLatencyMs": args.latency_ms,
+            "mockErrorRate": args.error_rate
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
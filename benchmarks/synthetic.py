@@ -0,0 +1,137 @@
+"""
+Synthetic bookmark collections for benchmarks.
+
+Collections look like browser exports: a few popular hosts account for most
+bookmarks, bookmarks are listed folder by folder, dates span several years,
+some URLs carry tracking parameters, and a share of bookmarks are duplicates
+of earlier ones (exact copies, or the same page with utm_*/fbclid tags, http
+vs https, "www." or a trailing slash added).
+
+    python benchmarks/synthetic.py --bookmarks 10000 > collection.json
+"""
+import sys
+import json
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+TOPICS = {
+    "Development": (
+        ["github.com", "stackoverflow.com", "docs.python.org", "developer.mozilla.org", "dev.to", "pypi.org"],
+        "python async react hooks kubernetes deploy docker rust api testing database sql typescript graphql".split()
+    ),
+    "News": (
+        ["www.nytimes.com", "news.ycombinator.com", "www.bbc.co.uk", "www.theguardian.com", "arstechnica.com"],
+        "election economy climate science policy technology markets report analysis opinion".split()
+    ),
+    "Cooking": (
+        ["www.allrecipes.com", "www.seriouseats.com", "cooking.nytimes.com", "www.bonappetit.com"],
+        "recipe pasta bread sourdough curry vegan dinner baking soup salad grill".split()
+    ),
+    "Travel": (
+        ["www.booking.com", "www.airbnb.com", "www.lonelyplanet.com", "www.tripadvisor.com", "www.google.com"],
+        "japan italy hiking itinerary budget flights hotel guide beach weekend city".split()
+    ),
+    "Finance": (
+        ["www.investopedia.com", "www.bogleheads.org", "www.paypal.com", "www.chase.com"],
+        "invest index funds retirement tax budget savings mortgage credit portfolio".split()
+    ),
+    "Entertainment": (
+        ["www.youtube.com", "www.netflix.com", "open.spotify.com", "www.imdb.com", "www.reddit.com"],
+        "music playlist movie series trailer review live concert podcast episode".split()
+    ),
+    "Learning": (
+        ["www.coursera.org", "en.wikipedia.org", "arxiv.org", "www.khanacademy.org", "medium.com"],
+        "course lecture history physics math machine learning paper tutorial introduction notes".split()
+    )
+}
+FOLDERS = {
+    "Development": ["Bookmarks Bar/Dev", "Dev/Python", "Dev/Web", "Dev/Ops"],
+    "News": ["Reading List", "News"],
+    "Cooking": ["Recipes", "Home/Cooking"],
+    "Travel": ["Travel", "Travel/Trips"],
+    "Finance": ["Finance", "Home/Money"],
+    "Entertainment": ["Music", "Watch Later", "Bookmarks Bar"],
+    "Learning": ["Learning", "Reading List"]
+}
+TRACKING_PARAMS = [
+    "utm_source=newsletter&utm_medium=email&utm_campaign=weekly",
+    "utm_source=twitter&utm_medium=social",
+    "fbclid=IwAR0{n}x",
+    "gclid=Cj0K{n}Q",
+    "ref=hn"
+]
+
+def _tracking_query(rng: random.Random) -> str:
+    return rng.choice(TRACKING_PARAMS).format(n=rng.randint(1000, 99999))
+
+def _duplicate_url(url: str, rng: random.Random) -> str:
+    """The same page as written by another share button or browser"""
+    base, _, query = url.partition("?")
+    variant = rng.randrange(5)
+    if variant == 0:
+        return url
+    if variant == 1:
+        return f"{base}?{_tracking_query(rng)}"
+    if variant == 2:
+        return base.replace("https://", "http://", 1) + (f"?{query}" if query else "")
+    if variant == 3:
+        return base + "/" if not base.endswith("/") else base
+    return base.replace("://www.", "://", 1) if "://www." in base else base.replace("://", "://www.", 1)
+
+def generate_collection(count: int, duplicate_rate: float = 0.08, tracking_rate: float = 0.2, seed: int = 7):
+    """`count` bookmark dicts in the shape the /api endpoints accept"""
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    # Uneven topic sizes, like a real collection
+    weights = [1.0 / (rank + 1) for rank in range(len(topics))]
+    start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+    span_seconds = int((datetime(2025, 6, 1, tzinfo=timezone.utc) - start).total_seconds())
+
+    originals = int(count * (1 - duplicate_rate))
+    bookmarks = []
+    for i in range(originals):
+        topic = rng.choices(topics, weights)[0]
+        hosts, words = TOPICS[topic]
+        # Popular hosts dominate within a topic
+        host = hosts[min(int(rng.expovariate(1.2)), len(hosts) - 1)]
+        title_words = rng.sample(words, rng.randint(2, 5))
+        slug = "-".join(title_words)
+        url = f"https://{host}/{rng.choice(words)}/{slug}-{i}"
+        if rng.random() < tracking_rate:
+            url += f"?{_tracking_query(rng)}"
+        bookmarks.append({
+            "id": str(i),
+            "title": " ".join(title_words).title() + rng.choice(["", " | Guide", " - Notes", f" ({2015 + i % 10})"]),
+            "url": url,
+            "description": " ".join(rng.sample(words, 6)) if rng.random() < 0.25 else "",
+            "folder": rng.choice(FOLDERS[topic]),
+            "dateAdded": (start + timedelta(seconds=rng.randrange(span_seconds))).isoformat()
+        })
+
+    for i in range(originals, count):
+        original = bookmarks[rng.randrange(originals)] if originals else None
+        if original is None:
+            break
+        bookmarks.append(dict(
+            original,
+            id=str(i),
+            url=_duplicate_url(original["url"], rng),
+            folder=rng.choice([original["folder"], "Unsorted"])
+        ))
+
+    # Exports list bookmarks folder by folder
+    bookmarks.sort(key=lambda b: (b["folder"], b["dateAdded"]))
+    return bookmarks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bookmarks", type=int, default=1000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.08)
+    parser.add_argument("--tracking-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    json.dump(generate_collection(args.bookmarks, args.duplicate_rate, args.tracking_rate, args.seed), sys.stdout)
+
+if __name__ == "__main__":
+    main()
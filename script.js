@@ -74,6 +74,21 @@ function getBackendUrl() {
     return `${window.location.protocol}//${window.location.hostname}:8000`;
 }
 
+// Request bodies over this size are gzipped when the browser supports it
+const COMPRESS_REQUEST_BYTES = 64 * 1024;
+
+// POST options for a JSON body; large collections compress ~5-10x and the backend accepts gzip
+async function jsonPostOptions(payload) {
+    const body = JSON.stringify(payload);
+    const headers = { 'Content-Type': 'application/json' };
+    if (body.length < COMPRESS_REQUEST_BYTES || typeof CompressionStream === 'undefined') {
+        return { method: 'POST', headers, body };
+    }
+    const compressed = new Blob([body]).stream().pipeThrough(new CompressionStream('gzip'));
+    headers['Content-Encoding'] = 'gzip';
+    return { method: 'POST', headers, body: await new Response(compressed).arrayBuffer() };
+}
+
 async function testBackendConnection() {
     const backendUrl = getBackendUrl();
     try {
@@ -1403,23 +1418,17 @@ async function sendAIMessage() {
         const backendUrl = getBackendUrl();
         console.log(`Sending chat request with ${bookmarks.length} bookmarks to backend:`, backendUrl);
         
-        const response = await fetch(`${backendUrl}/api/chat`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                message: message,
-                bookmarks: bookmarks || [],
-                apiKey: aiSettings.apiKey,
-                chatModel: aiSettings.chatModel || 'gpt-4o-mini',
-                context: {
-                    currentCategory: getCurrentCategory(),
-                    searchQuery: getLastSearchQuery(),
-                    bookmarkCount: bookmarks.length
-                }
-            })
-        });
+        const response = await fetch(`${backendUrl}/api/chat`, await jsonPostOptions({
+            message: message,
+            bookmarks: bookmarks || [],
+            apiKey: aiSettings.apiKey,
+            chatModel: aiSettings.chatModel || 'gpt-4o-mini',
+            context: {
+                currentCategory: getCurrentCategory(),
+                searchQuery: getLastSearchQuery(),
+                bookmarkCount: bookmarks.length
+            }
+        }));
         
         // Remove typing indicator
         if (typingIndicator.parentNode) {
@@ -1574,11 +1583,52 @@ function showReorganizeModal() {
     
     // Show modal
     document.getElementById('reorganize-modal').style.display = 'flex';
+    updateReorganizeEstimate();
+}
+
+async function updateReorganizeEstimate() {
+    const estimateEl = document.getElementById('reorganize-estimate');
+    const aiSettings = loadAISettings();
+    if (!estimateEl || !aiSettings) return;
+    
+    try {
+        const response = await fetch(`${getBackendUrl()}/api/reorganize/estimate`, await jsonPostOptions({
+            bookmarks: bookmarks,
+            apiKey: aiSettings.apiKey,
+            model: aiSettings.reorganizeModel || 'gpt-5-mini',
+            categorizationDepth: document.getElementById('reorganize-depth').value
+        }));
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        const estimate = await response.json();
+        
+        let text = `Estimated usage: ~${estimate.totalTokens.toLocaleString()} tokens in ${estimate.chunks} requests`;
+        if (estimate.estimatedCostUsd !== null) {
+            text += ` (about $${estimate.estimatedCostUsd.toFixed(2)})`;
+        }
+        if (estimate.cachedBookmarks) {
+            text += `; ${estimate.cachedBookmarks} bookmarks are already categorized`;
+        }
+        if (estimate.admission === 'reject') {
+            text += '. This is over the token budget, so it cannot start right now.';
+        } else if (estimate.admission === 'queue') {
+            text += '. It will wait for other reorganizations on this API key to finish first.';
+        }
+        estimateEl.textContent = text;
+        estimateEl.classList.toggle('over-budget', estimate.admission === 'reject');
+        estimateEl.style.display = 'block';
+    } catch (error) {
+        // The estimate is informational; starting still works without it
+        console.warn('Could not estimate reorganization cost:', error);
+        estimateEl.style.display = 'none';
+    }
 }
 
 function hideReorganizeModal() {
     document.getElementById('reorganize-modal').style.display = 'none';
     
+    // Closing the dialog stops a running reorganization so it stops using tokens
+    cancelRunningReorganization();
+    
     // Reset modal state
     const reorganizeInfo = document.querySelector('.reorganize-info');
     const reorganizeProgress = document.getElementById('reorganize-progress');
@@ -1592,6 +1642,23 @@ function hideReorganizeModal() {
 }
 
 let reorganizationSessionId = null;
+let reorganizationRunning = false;
+let reorganizationProgressSource = null;
+// Resolves to the reorganized bookmarks once the result stream delivers them, or null
+let reorganizationResults = null;
+
+function cancelRunningReorganization() {
+    if (!reorganizationRunning || !reorganizationSessionId) return;
+    reorganizationRunning = false;
+    
+    const url = `${getBackendUrl()}/api/reorganize/${reorganizationSessionId}/cancel`;
+    // sendBeacon still delivers while the page is being closed
+    if (!(navigator.sendBeacon && navigator.sendBeacon(url))) {
+        fetch(url, { method: 'POST', keepalive: true }).catch(() => {});
+    }
+}
+
+window.addEventListener('pagehide', cancelRunningReorganization);
 
 async function startReorganization() {
     const aiSettings = loadAISettings();
@@ -1604,6 +1671,8 @@ async function startReorganization() {
     
     // Generate session ID
     reorganizationSessionId = 'session_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
+    reorganizationResults = null;
+    const sentBookmarks = bookmarks;
     
     // Switch to progress view
     const reorganizeInfo = document.querySelector('.reorganize-info');
@@ -1627,19 +1696,20 @@ async function startReorganization() {
         console.log('Starting reorganization with backend:', backendUrl);
         
         // Start reorganization
-        const response = await fetch(`${backendUrl}/api/reorganize`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                bookmarks: bookmarks,
-                apiKey: aiSettings.apiKey,
-                model: aiSettings.reorganizeModel || 'gpt-5-mini',
-                categorizationDepth: depth,
-                sessionId: reorganizationSessionId
-            })
-        });
+        const response = await fetch(`${backendUrl}/api/reorganize`, await jsonPostOptions({
+            bookmarks: bookmarks,
+            apiKey: aiSettings.apiKey,
+            model: aiSettings.reorganizeModel || 'gpt-5-mini',
+            categorizationDepth: depth,
+            sessionId: reorganizationSessionId
+        }));
+        
+        if (response.status === 413 || response.status === 429) {
+            // Refused by the token budget; the server explains why
+            const error = await response.json().catch(() => ({}));
+            showReorganizationError(error.detail || 'This reorganization is over the token budget.');
+            return;
+        }
         
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
@@ -1647,9 +1717,16 @@ async function startReorganization() {
         
         const result = await response.json();
         console.log('Reorganization started:', result);
+        reorganizationRunning = true;
         
-        // Start polling for progress
-        pollReorganizationProgress();
+        // Receive categories as chunks finish; the summary record completes the job on its own
+        reorganizationResults = streamReorganizationResults(sentBookmarks);
+        reorganizationResults.then(streamed => {
+            if (streamed) completeReorganization();
+        });
+        
+        // Follow progress via server-sent events, polling if unavailable
+        streamReorganizationProgress();
         
     } catch (error) {
         console.error('Error starting reorganization:', error);
@@ -1667,6 +1744,44 @@ async function startReorganization() {
     }
 }
 
+function streamReorganizationProgress() {
+    if (!reorganizationSessionId) return;
+    
+    if (typeof EventSource === 'undefined') {
+        pollReorganizationProgress();
+        return;
+    }
+    
+    const backendUrl = getBackendUrl();
+    const source = new EventSource(`${backendUrl}/api/progress/${reorganizationSessionId}/stream`);
+    reorganizationProgressSource = source;
+    let receivedEvent = false;
+    
+    source.addEventListener('progress', async (event) => {
+        receivedEvent = true;
+        const progress = JSON.parse(event.data);
+        updateProgressDisplay(progress);
+        
+        if (progress.status === 'completed') {
+            await completeReorganization();
+        } else if (progress.status === 'error' || progress.status === 'cancelled') {
+            source.close();
+            reorganizationRunning = false;
+            showReorganizationError(progress.message);
+        }
+    });
+    
+    source.onerror = () => {
+        // EventSource reconnects on its own (resuming from the last event ID);
+        // only fall back to polling if the stream never worked
+        if (!receivedEvent) {
+            console.warn('Progress stream unavailable, falling back to polling');
+            source.close();
+            pollReorganizationProgress();
+        }
+    };
+}
+
 async function pollReorganizationProgress() {
     if (!reorganizationSessionId) return;
     
@@ -1682,10 +1797,11 @@ async function pollReorganizationProgress() {
         updateProgressDisplay(progress);
         
         if (progress.status === 'completed') {
-            await handleReorganizationComplete();
-        } else if (progress.status === 'error') {
+            await completeReorganization();
+        } else if (progress.status === 'error' || progress.status === 'cancelled') {
+            reorganizationRunning = false;
             showReorganizationError(progress.message);
-        } else {
+        } else if (reorganizationRunning) {
             // Continue polling
             setTimeout(pollReorganizationProgress, 2000);
         }
@@ -1706,20 +1822,76 @@ function updateProgressDisplay(progress) {
     console.log(`Progress: ${progress.progress}% - ${progress.message}`);
 }
 
+function streamReorganizationResults(sentBookmarks) {
+    // NDJSON records: one per categorized bookmark (by its index in the request), then a summary
+    return (async () => {
+        try {
+            const backendUrl = getBackendUrl();
+            const response = await fetch(`${backendUrl}/api/result/${reorganizationSessionId}/stream`);
+            if (!response.ok || !response.body || typeof TextDecoderStream === 'undefined') {
+                return null;
+            }
+            
+            const reorganized = sentBookmarks.map(bookmark => ({ ...bookmark }));
+            const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+            let buffered = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) return null;
+                
+                buffered += value;
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const record = JSON.parse(line);
+                    if (record.type === 'bookmark') {
+                        const bookmark = reorganized[record.index];
+                        if (bookmark) {
+                            bookmark.category = record.category;
+                            if (record.id) bookmark.id = record.id;
+                        }
+                    } else {
+                        reader.cancel();
+                        return record.type === 'summary' ? reorganized : null;
+                    }
+                }
+            }
+        } catch (error) {
+            console.warn('Result stream unavailable, the result will be fetched at the end:', error);
+            return null;
+        }
+    })();
+}
+
+async function completeReorganization() {
+    // Reached from the progress stream, polling and the result stream; only the first one applies
+    if (!reorganizationRunning) return;
+    reorganizationRunning = false;
+    if (reorganizationProgressSource) {
+        reorganizationProgressSource.close();
+        reorganizationProgressSource = null;
+    }
+    await handleReorganizationComplete();
+}
+
 async function handleReorganizationComplete() {
     try {
-        // Get the reorganized bookmarks
-        const backendUrl = getBackendUrl();
-        const response = await fetch(`${backendUrl}/api/result/${reorganizationSessionId}`);
-        
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+        // The streamed result, or the stored one if the stream did not deliver it
+        let reorganized = reorganizationResults ? await reorganizationResults : null;
+        if (!reorganized) {
+            const backendUrl = getBackendUrl();
+            const response = await fetch(`${backendUrl}/api/result/${reorganizationSessionId}`);
+            
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            
+            reorganized = (await response.json()).bookmarks;
         }
         
-        const result = await response.json();
-        
         // Update local bookmarks with new categories
-        bookmarks = result.bookmarks;
+        bookmarks = reorganized;
         
         // Regenerate categories structure
         categories = generateCategoriesFromBookmarks(bookmarks);
@@ -13,6 +13,7 @@ def check_requirements():
         import uvicorn
         import httpx
         import pydantic
+        import numpy
         print("All required packages are installed")
         return True
     except ImportError as e: